@@ -4,14 +4,23 @@ import time
 import math
 import cv2
 import datetime
+import json
 import os
 import random
 from flask import Flask, jsonify, render_template, Response, request, make_response
-import numpy as np
 
 from detection import DetectionEngine
+from event_hub import EventHub, format_sse
+from frame_bus import FrameBus
+from inference_gate import InferenceGate
+from tracker import IoUTracker
+from sensor_fusion import SensorFusion
+from frame_writer import FrameWriter
+from stream_encoder import TieredJpegEncoder, FrameRateLimiter, multipart_chunk, parse_stream_params
 from data_manager import DataManager # Import the new DataManager
+from retention import RetentionEngine
 from car_software import config # Import config for LOCAL_DATA_DIR and DATA_RETENTION_DAYS
+from car_software.cloud_sync import CloudOutbox
 
 # --- App Initialization ---
 app = Flask(
@@ -23,8 +32,30 @@ app = Flask(
 # --- Initialize DataManager ---
 data_manager = DataManager(
     db_path='database.db',
-    local_data_dir=config.LOCAL_DATA_DIR,
-    retention_days=config.DATA_RETENTION_DAYS
+    cluster_radius_m=config.POTHOLE_CLUSTER_RADIUS_M
+)
+
+# --- Background image persistence (keeps JPEG encoding and disk I/O off state_lock) ---
+frame_writer = FrameWriter(max_queue=config.FRAME_WRITER_QUEUE_SIZE,
+                           fsync_interval=config.FRAME_WRITER_FSYNC_INTERVAL)
+
+# --- Live update fan-out for the /events stream ---
+event_hub = EventHub(max_pending=config.LIVE_EVENTS_MAX_PENDING)
+
+# --- Incremental retention of recorded sessions (age, disk quota, protected evidence) ---
+# Images the car app has not uploaded yet are listed in its cloud outbox
+cloud_outbox = CloudOutbox(config.CLOUD_OUTBOX_PATH)
+retention_engine = RetentionEngine(
+    data_manager, config.LOCAL_DATA_DIR,
+    retention_days=config.DATA_RETENTION_DAYS,
+    quota_bytes=config.DATA_QUOTA_BYTES,
+    low_watermark=config.DATA_QUOTA_LOW_WATERMARK,
+    min_free_bytes=config.DATA_MIN_FREE_BYTES,
+    keep_confidence=config.RETENTION_KEEP_CONFIDENCE,
+    batch_size=config.RETENTION_BATCH_SIZE,
+    batch_pause_s=config.RETENTION_BATCH_PAUSE_SECONDS,
+    protected_paths=cloud_outbox.pending_files,
+    active_session=lambda: state['current_session_timestamp']
 )
 
 # --- Configuration (Moved to config.py or kept minimal here) ---
@@ -80,13 +111,12 @@ state = {
     "current_speed": 0.0,
     "g_force": 0.0,
     "g_force_history": collections.deque([0.0] * G_FORCE_HISTORY_LENGTH, maxlen=G_FORCE_HISTORY_LENGTH), # G-force history
-    "impact_events_history": [], # Store detected impacts {timestamp, g_force}
+    "impact_events_history": collections.deque(maxlen=config.IMPACT_HISTORY_LENGTH), # Recent fused impacts
     "pothole_detected": False,
     "pothole_confidence": 0.0, 
     "suspension_status": "ACTIVE",
     "latitude": 12.9716,
     "longitude": 77.5946,
-    "pothole_cooldown": 0,
     "latest_event": None,
     "gps_status": "INIT",
     "obd_status": "INIT",
@@ -100,10 +130,58 @@ state_lock = threading.Lock()
 detection_engine = DetectionEngine(model_path=config.MODEL_PATH)
 video_capture = cv2.VideoCapture(0)
 hw_manager = HardwareManager()
+# ROI crop + motion/speed gating in front of the model
+inference_gate = InferenceGate(detection_engine,
+                               roi=config.INFERENCE_ROI,
+                               motion_threshold=config.INFERENCE_MOTION_THRESHOLD,
+                               max_skip_s=config.INFERENCE_MAX_SKIP_SECONDS,
+                               speed_source=hw_manager.get_speed,
+                               stationary_speed_kmh=config.INFERENCE_STATIONARY_SPEED_KMH,
+                               stationary_interval_s=config.INFERENCE_STATIONARY_INTERVAL_SECONDS)
+# Single capture + inference thread shared by the logging loop and every MJPEG client
+frame_bus = FrameBus(video_capture, inference_gate, is_active=lambda: state.get("camera_active"))
+# Each bus frame is JPEG-encoded once per tier and shared by every /video_feed client
+stream_encoder = TieredJpegEncoder(config.STREAM_TIERS)
+# Follows potholes across frames so each one is persisted once, when its track is confirmed
+pothole_tracker = IoUTracker(iou_threshold=config.TRACKER_IOU_THRESHOLD,
+                             min_hits=config.TRACKER_MIN_HITS,
+                             max_age=config.TRACKER_MAX_AGE,
+                             high_threshold=config.TRACKER_HIGH_THRESHOLD)
+
+# Joins IMU impacts with the nearest GPS fix and the preceding vision detection
+sensor_fusion = SensorFusion(impact_threshold=IMPACT_THRESHOLD,
+                             capacity=config.FUSION_BUFFER_SIZE,
+                             detection_window_s=config.FUSION_DETECTION_WINDOW_SECONDS,
+                             gps_max_gap_s=config.FUSION_GPS_MAX_GAP_SECONDS)
+
+def persist_confirmed_pothole(track):
+    """Saves a newly confirmed track's best frame, DB row and dashboard event. Call with state_lock held."""
+    context = track.best_context
+    session_timestamp = state['current_session_timestamp']
+    image_filename = f"frame_{int(context['timestamp'].timestamp())}_{track.track_id}.jpg"
+    if session_timestamp and config.LOCAL_DATA_DIR: 
+        image_path = os.path.join(config.LOCAL_DATA_DIR, session_timestamp, image_filename)
+        # Encoding and writing happen on the FrameWriter thread, not under state_lock
+        if not frame_writer.submit(image_path, track.best_frame):
+            print(f"⚠️ Storage backpressure, pothole image dropped: {image_path}")
+            image_filename = None
+    else:
+        image_filename = None 
+
+    state["latest_event"] = {
+        "timestamp": context["timestamp"].isoformat(),
+        "type": "POTHOLE",
+        "details": f"Detected at {context['latitude']:.4f}, {context['longitude']:.4f}"
+    }
+    # Log to DB using DataManager
+    data_manager.add_pothole_entry(context['latitude'], context['longitude'], context['timestamp'],
+                                   session_timestamp, image_filename, track.best_confidence)
+    event_hub.publish('event', state["latest_event"])
 
 def main_loop():
     """Main background loop for simulation and detection."""
     global state
+    last_seq = 0
     
     while True:
         if not state.get("camera_active"):
@@ -114,22 +192,37 @@ def main_loop():
         speed = hw_manager.get_speed()
         g_force_base = hw_manager.get_g_force()
 
+        now = time.time()
+        sensor_fusion.add_gps(now, lat, lon)
+        # Returns a fused event once per impact, when the g-force drops back below the threshold
+        impact = sensor_fusion.add_g_force(now, g_force_base)
+
         # Update G-force history
         state["g_force_history"].append(g_force_base)
-        if g_force_base >= IMPACT_THRESHOLD:
-            state["impact_events_history"].append({
-                "timestamp": datetime.datetime.now().isoformat(),
-                "g_force": g_force_base
-            })
+        event_hub.publish('g_force', {"value": g_force_base})
+        if impact is not None:
+            with state_lock:
+                state["impact_events_history"].append(impact)
+                session_timestamp = state['current_session_timestamp']
+            data_manager.add_impact_event(impact, session_timestamp)
+            event_hub.publish('impact', impact)
 
-        success, frame = video_capture.read()
-        if not success:
-            time.sleep(0.1)
+        packet = frame_bus.wait_for_next(last_seq, timeout=1.0)
+        if packet is None:
             continue
+        last_seq = packet.seq
         
-        original_frame = frame.copy() 
-        detected_defects, _ = detection_engine.detect(frame.copy())
-        pothole_in_frame = any(d['class'] == 'Pothole' for d in detected_defects)
+        potholes = [d for d in packet.detections if d['class'] == 'Pothole']
+        confirmed_tracks = []
+        # Frames the gate skipped were never inferred; feeding them in would age tracks out and
+        # re-persist the same pothole once inference resumes
+        if packet.inferred:
+            _, confirmed_tracks = pothole_tracker.update(
+                potholes, frame=packet.frame,
+                context={"latitude": lat, "longitude": lon, "timestamp": datetime.datetime.now()})
+        sensor_fusion.add_detections(packet.timestamp, potholes)
+        # The alert lasts as long as a confirmed pothole is tracked, instead of a fixed cooldown
+        tracked_potholes = [t for t in pothole_tracker.tracks if t.confirmed]
 
         with state_lock:
             state.update({
@@ -141,72 +234,88 @@ def main_loop():
                 "imu_status": hw_manager.imu_status
             })
 
-            if state["pothole_cooldown"] > 0:
-                state["pothole_cooldown"] -= 1
-            else:
-                state["pothole_detected"] = False
-                state["suspension_status"] = "ACTIVE"
-                state["pothole_confidence"] = 0.0 
-
-            if pothole_in_frame and state["pothole_cooldown"] == 0:
-                highest_confidence = 0.0
-                for defect in detected_defects:
-                    if defect['class'] == 'Pothole' and defect['confidence'] > highest_confidence:
-                        highest_confidence = defect['confidence']
-
-                session_timestamp = state['current_session_timestamp']
-                image_filename = f"frame_{int(time.time())}.jpg"
-                if session_timestamp and config.LOCAL_DATA_DIR: 
-                    session_dir = os.path.join(config.LOCAL_DATA_DIR, session_timestamp)
-                    os.makedirs(session_dir, exist_ok=True)
-                    cv2.imwrite(os.path.join(session_dir, image_filename), original_frame)
-                    print(f"Pothole image saved: {os.path.join(session_dir, image_filename)}")
-                else:
-                    image_filename = None 
+            for track in confirmed_tracks:
+                persist_confirmed_pothole(track)
 
+            if tracked_potholes:
                 state.update({
                     "pothole_detected": True,
-                    "pothole_confidence": highest_confidence, 
+                    "pothole_confidence": max(t.best_confidence for t in tracked_potholes), 
                     "suspension_status": "STABILIZING",
-                    "pothole_cooldown": 15,
                     "g_force": g_force_base * 0.5, 
-                    "latest_event": {
-                        "timestamp": datetime.datetime.now().isoformat(),
-                        "type": "POTHOLE",
-                        "details": f"Detected at {lat:.4f}, {lon:.4f}"
-                    }
                 })
-                # Log to DB using DataManager
-                data_manager.add_pothole_entry(lat, lon, datetime.datetime.now(), 
-                                               session_timestamp, image_filename, highest_confidence)
             else:
-                state["g_force"] = g_force_base 
+                state.update({
+                    "pothole_detected": False,
+                    "pothole_confidence": 0.0,
+                    "suspension_status": "ACTIVE",
+                    "g_force": g_force_base,
+                })
+
+            publish_state_changes()
 
         time.sleep(0.2) 
 
-def generate_frames_with_detection():
-    """Generator for streaming video with detection overlays."""
+def publish_state_changes():
+    """Pushes the coalescable parts of `state` that changed since the last tick. Call with state_lock held."""
+    event_hub.publish_if_changed('telemetry', {
+        "current_speed": round(state["current_speed"], 1),
+        "g_force": round(state["g_force"], 2),
+        "latitude": round(state["latitude"], 5),
+        "longitude": round(state["longitude"], 5),
+    })
+    event_hub.publish_if_changed('hardware_status', {
+        "gps_status": state["gps_status"],
+        "obd_status": state["obd_status"],
+        "imu_status": state["imu_status"],
+        "camera_active": state["camera_active"],
+    })
+    event_hub.publish_if_changed('pothole', {
+        "pothole_detected": state["pothole_detected"],
+        "pothole_confidence": state["pothole_confidence"],
+        "suspension_status": state["suspension_status"],
+    })
+
+def serializable_state():
+    """Copy of `state` that jsonify can handle. Call with state_lock held."""
+    snapshot = dict(state)
+    # Convert deque to list for JSON serialization
+    snapshot["g_force_history"] = list(state["g_force_history"])
+    snapshot["impact_events_history"] = list(state["impact_events_history"])
+    snapshot["storage"] = frame_writer.stats()
+    snapshot["stream"] = stream_encoder.stats()
+    snapshot["inference"] = inference_gate.stats()
+    snapshot["tracking"] = pothole_tracker.stats()
+    snapshot["fusion"] = sensor_fusion.stats()
+    snapshot["retention"] = retention_engine.stats()
+    return snapshot
+
+def generate_frames_with_detection(tier, max_fps):
+    """
+    Generator for streaming video with detection overlays at the given tier.
+    A client that reads slower than `max_fps` (or than the bus) skips to the
+    newest frame instead of building up a backlog.
+    """
+    limiter = FrameRateLimiter(max_fps)
+    last_seq = frame_bus.last_seq
     while True:
         if not state.get("camera_active"):
-            placeholder = cv2.imencode('.jpg', np.zeros((480, 640, 3), dtype=np.uint8))[1].tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + placeholder + b'\r\n')
+            yield multipart_chunk(stream_encoder.placeholder(tier))
             time.sleep(1)
             continue
 
-        success, frame = video_capture.read()
-        if not success:
-            break
-        
-        _, frame_with_boxes = detection_engine.detect(frame)
+        # Subscribe to the shared bus instead of reading the camera ourselves
+        packet = frame_bus.wait_for_next(last_seq, timeout=1.0)
+        if packet is None:
+            continue
+        last_seq = packet.seq
 
-        ret, buffer = cv2.imencode('.jpg', frame_with_boxes)
-        if not ret: continue
-        
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(0.05)
+        try:
+            frame_bytes = stream_encoder.encode(packet.seq, packet.annotated_frame, tier)
+        except ValueError:
+            continue
+        yield multipart_chunk(frame_bytes)
+        limiter.wait()
 
 
 # --- Flask Routes ---
@@ -217,28 +326,63 @@ def dashboard():
 @app.route("/data")
 def get_data():
     with state_lock:
-        # Create a copy of the state to modify for JSON serialization
-        serializable_state = dict(state)
-        # Convert deque to list for JSON serialization
-        serializable_state["g_force_history"] = list(state["g_force_history"])
+        snapshot = serializable_state()
+        # Clear impacts after sending so polling clients only see each impact once
+        state["impact_events_history"].clear()
         
-        # Get impact events to send and then clear them from the state
-        # This ensures impacts are only sent once to the frontend
-        impacts_to_send = list(state["impact_events_history"])
-        serializable_state["impact_events_history"] = impacts_to_send
-        state["impact_events_history"].clear() # Clear after sending
-        
-        return jsonify(serializable_state)
+        return jsonify(snapshot)
+
+@app.route('/events')
+def events_stream():
+    """
+    Server-Sent Events stream of live telemetry. Sends one full snapshot, then
+    only deltas (g_force samples, impacts, detections, and telemetry/status
+    values when they change). A client that falls behind gets the latest
+    telemetry instead of a backlog, and a fresh snapshot if samples were dropped.
+    """
+    def stream():
+        subscription = event_hub.subscribe()
+        try:
+            with state_lock:
+                snapshot = serializable_state()
+            yield format_sse('snapshot', json.dumps(snapshot))
+            while True:
+                events = subscription.get(timeout=config.LIVE_EVENTS_KEEPALIVE_SECONDS)
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                messages = []
+                for event_type, data in events:
+                    if event_type == 'resync':
+                        with state_lock:
+                            event_type, data = 'snapshot', serializable_state()
+                    messages.append(format_sse(event_type, json.dumps(data)))
+                yield ''.join(messages)
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames_with_detection(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    """MJPEG stream. Optional ?tier= (see config.STREAM_TIERS) and ?fps= cap per client."""
+    try:
+        tier, max_fps = parse_stream_params(request.args.get('tier', config.STREAM_DEFAULT_TIER),
+                                            request.args.get('fps', config.STREAM_MAX_FPS),
+                                            config.STREAM_TIERS, config.STREAM_MAX_FPS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(generate_frames_with_detection(tier, max_fps), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/start_camera', methods=['POST'])
 def start_camera():
     with state_lock:
         state['camera_active'] = True
         state['current_session_timestamp'] = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') # Initialize session
+        publish_state_changes()
     return jsonify({"status": "camera started"})
 
 @app.route('/stop_camera', methods=['POST'])
@@ -246,11 +390,24 @@ def stop_camera():
     with state_lock:
         state['camera_active'] = False
         state['current_session_timestamp'] = None # Clear session on stop
+        publish_state_changes()
     return jsonify({"status": "camera stopped"})
 
 @app.route('/export_data')
 def export_data_route(): 
-    return data_manager.export_pothole_data()
+    bbox = None
+    if 'min_lat' in request.args:
+        try:
+            bbox = [float(request.args[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+        except (KeyError, ValueError):
+            return jsonify({"error": "min_lat, min_lon, max_lat and max_lon must all be numbers."}), 400
+    return data_manager.export_pothole_data(
+        export_format=request.args.get('format', 'csv'),
+        start=request.args.get('start'),
+        end=request.args.get('end'),
+        bbox=bbox,
+        session_timestamp=request.args.get('session')
+    )
 
 @app.route('/api/historical_potholes')
 def historical_potholes_route(): 
@@ -259,6 +416,47 @@ def historical_potholes_route():
         return jsonify(potholes_list), status_code
     return jsonify(potholes_list)
 
+@app.route('/api/potholes/bbox')
+def potholes_bbox_route():
+    try:
+        bounds = [float(request.args[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+        limit = int(request.args.get('limit', 500))
+    except (KeyError, ValueError):
+        return jsonify({"error": "min_lat, min_lon, max_lat and max_lon are required numbers."}), 400
+    result, status_code = data_manager.get_potholes_in_bbox(*bounds, limit=limit,
+                                                           cursor=request.args.get('cursor', type=int))
+    return jsonify(result), status_code
+
+@app.route('/api/potholes/radius')
+def potholes_radius_route():
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        radius_m = float(request.args.get('radius_m', 50))
+        limit = int(request.args.get('limit', 500))
+        offset = int(request.args.get('offset', 0))
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lon are required numbers."}), 400
+    result, status_code = data_manager.get_potholes_within_radius(lat, lon, radius_m, limit=limit, offset=offset)
+    return jsonify(result), status_code
+
+@app.route('/api/pothole_clusters')
+def pothole_clusters_route():
+    try:
+        bounds = [request.args.get(key, type=float) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+        min_hits = int(request.args.get('min_hits', 1))
+        limit = int(request.args.get('limit', 500))
+    except ValueError:
+        return jsonify({"error": "min_hits and limit must be integers."}), 400
+    result, status_code = data_manager.get_pothole_clusters(*bounds, min_hits=min_hits, limit=limit,
+                                                            cursor=request.args.get('cursor', type=int))
+    return jsonify(result), status_code
+
+@app.route('/api/pothole_clusters/<int:cluster_id>')
+def pothole_cluster_details_route(cluster_id):
+    cluster_data, status_code = data_manager.get_cluster_details(cluster_id)
+    return jsonify(cluster_data), status_code
+
 @app.route('/api/summary_statistics')
 def summary_statistics_route(): 
     summary_data, status_code = data_manager.get_summary_statistics_data()
@@ -266,6 +464,22 @@ def summary_statistics_route():
         return jsonify(summary_data), status_code
     return jsonify(summary_data)
 
+@app.route('/api/defect_counts')
+def defect_counts_route():
+    counts, status_code = data_manager.get_defect_counts(request.args.get('granularity', 'day'),
+                                                         request.args.get('start'), request.args.get('end'))
+    return jsonify(counts), status_code
+
+@app.route('/api/impact_events')
+def impact_events_route():
+    try:
+        limit = int(request.args.get('limit', 500))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer."}), 400
+    events, status_code = data_manager.get_impact_events(request.args.get('start'), request.args.get('end'),
+                                                         limit=limit)
+    return jsonify(events), status_code
+
 @app.route('/api/defect_details/<int:defect_id>')
 def defect_details_route(defect_id):
     defect_data, status_code = data_manager.get_defect_details(defect_id)
@@ -273,17 +487,36 @@ def defect_details_route(defect_id):
         return jsonify(defect_data), status_code
     return jsonify(defect_data)
 
+# --- Cleanup ---
+@app.teardown_request
+def release_db_reader(exception=None):
+    # Request threads are short-lived under threaded=True; don't leave their read connection open
+    data_manager.release_reader()
+
+def shutdown():
+    """Stops the background services once the server has exited (not per request)."""
+    frame_bus.stop()
+    frame_writer.close()
+    video_capture.release()
+    cloud_outbox.close()
+    data_manager.close()
+
 # --- Main Execution ---
 if __name__ == "__main__":
+    frame_bus.start()
+
     main_thread = threading.Thread(target=main_loop)
     main_thread.daemon = True
     main_thread.start()
     
-    # Schedule data cleanup to run periodically (e.g., once every 24 hours)
+    # Incremental retention passes; each one only rescans changed session directories
     def cleanup_scheduler():
         while True:
-            data_manager.cleanup_old_data() 
-            time.sleep(24 * 60 * 60) 
+            try:
+                print(f"Retention: {retention_engine.run_once()}")
+            except Exception as e:
+                print(f"Retention: Error during retention pass: {e}")
+            time.sleep(config.RETENTION_INTERVAL_SECONDS)
     
     cleanup_thread = threading.Thread(target=cleanup_scheduler)
     cleanup_thread.daemon = True
@@ -291,10 +524,7 @@ if __name__ == "__main__":
 
     print("🚀 SENTINEL Dashboard is running!")
     print("Navigate to http://127.0.0.1:5000")
-    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
-
-# --- Cleanup ---
-@app.teardown_appcontext
-def cleanup(exception=None):
-    video_capture.release()
-    data_manager.close() 
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, threaded=True)
+    finally:
+        shutdown()
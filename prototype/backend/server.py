@@ -1,27 +1,13 @@
 import asyncio
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from threading import Thread
-import time
-import os
-
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-import asyncio
-import random
-from datetime import datetime
-from threading import Thread, Lock
-import time
 import os
 import csv
-import pathlib
-import ast
 import io
 import cv2
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -31,25 +17,39 @@ from pydantic import BaseModel, Field
 # Add parent directories to sys.path to allow imports from other folders
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'car-software')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'car_software')))
 
 from detection import DetectionEngine
-from car-software.gps_module import GPSSimulator
-import car-software.config as config
+from event_hub import EventHub
+from event_store import DetectionEventStore, make_detection_event
+from stream_encoder import TieredJpegEncoder, multipart_chunk, parse_stream_params
+from car_software.gps_module import GPSSimulator
+from car_software import config
 
 # --- Global State & Configuration ---
-# Using a dictionary to hold state that the background thread will modify
+# Using a dictionary to hold state that the background tasks will modify.
+# Everything except the executors' work runs on the event loop, so no locks are needed.
 app_state = {
     "camera": None,
     "gps_simulator": None,
     "detection_engine": None,
-    "latest_frame": None,
-    "frame_lock": Lock(),
+    "latest_frame": None, # (seq, annotated frame) of the newest published frame
+    "frame_seq": 0, # Incremented with every new latest_frame
+    "frame_subscribers": set(), # One asyncio.Queue(maxsize=1) per /video_feed client
+    "stream_encoder": TieredJpegEncoder(config.STREAM_TIERS), # Shared per-tier JPEG encodes for /video_feed
+    "encode_futures": {}, # tier -> (seq, future) of the newest encode for that tier
+    "capture_executor": None, # Blocking camera reads
+    "inference_executor": None, # Bounded pool for DetectionEngine.detect()
+    "encode_executor": None, # JPEG encoding for /video_feed
+    "io_executor": None, # Single thread for session files, so writes stay ordered
+    "background_tasks": [],
     "data_dir": None,
     "session_timestamp": None,
     "metadata_writer": None,
     "metadata_file": None,
     "is_scanning": False, # Control scanning state
+    "event_store": None, # Append-only detection events served by /api/status
+    "event_hub": EventHub(max_pending=config.LIVE_EVENTS_MAX_PENDING), # Push updates for /ws/live
 }
 
 # --- App Initialization ---
@@ -61,7 +61,7 @@ app = FastAPI(
 
 # --- Template and Static File Setup ---
 app.mount("/static", StaticFiles(directory="prototype/backend/static"), name="static")
-app.mount("/images", StaticFiles(directory="prototype/car-software/data"), name="images")
+app.mount("/images", StaticFiles(directory=config.LOCAL_DATA_DIR), name="images")
 templates = Jinja2Templates(directory="prototype/backend/templates")
 
 # --- Pydantic Data Models ---
@@ -81,10 +81,21 @@ class Defect(BaseModel):
     longitude: float
     image_url: str
 
+def defect_from_event(event):
+    return Defect(
+        id=str(event["id"]),
+        type=event["type"],
+        confidence=event["confidence"],
+        timestamp=event["timestamp"],
+        latitude=event["latitude"],
+        longitude=event["longitude"],
+        image_url=event["image_url"]
+    )
+
 # --- System State (Simulation) ---
 telemetry_data = Telemetry(cpuUsage=12.5, gpuUsage=45.0, fps=60, temperature=55, isScanning=False)
 
-def telemetry_simulation():
+async def telemetry_simulation():
     """Simulates telemetry data changes."""
     global telemetry_data
     while True:
@@ -95,9 +106,30 @@ def telemetry_simulation():
         else:
             telemetry_data.cpuUsage = round(random.uniform(5, 15), 1)
             telemetry_data.gpuUsage = round(random.uniform(10, 20), 1)
-        time.sleep(0.5)
+        telemetry_data.is_scanning = app_state["is_scanning"]
+        app_state["event_hub"].publish_if_changed('telemetry', telemetry_data.dict())
+        await asyncio.sleep(0.5)
 
 # --- Data Saving Logic ---
+# These run on the single-threaded io_executor, in submission order.
+def open_session_metadata(data_dir):
+    os.makedirs(data_dir, exist_ok=True)
+    metadata_path = os.path.join(data_dir, 'metadata.csv')
+    app_state["metadata_file"] = open(metadata_path, 'w', newline='')
+    app_state["metadata_writer"] = csv.writer(app_state["metadata_file"])
+    app_state["metadata_writer"].writerow(['filename', 'timestamp', 'latitude', 'longitude', 'detections'])
+
+def close_session_metadata():
+    if app_state["metadata_file"]:
+        app_state["metadata_file"].close()
+        app_state["metadata_file"] = None
+        app_state["metadata_writer"] = None
+
+def log_save_failure(future):
+    """Done-callback for the fire-and-forget save_defect_data() futures, so failed writes are not silent."""
+    if not future.cancelled() and future.exception() is not None:
+        print(f"❌ Failed to save defect data: {future.exception()!r}")
+
 def save_defect_data(frame, location, detections):
     """Saves the captured frame and its metadata."""
     timestamp = location['timestamp']
@@ -112,48 +144,90 @@ def save_defect_data(frame, location, detections):
         app_state["metadata_writer"].writerow([image_filename, timestamp, location['latitude'], location['longitude'], str(detections)])
         app_state["metadata_file"].flush()
 
-
-# --- Camera & Detection Background Thread ---
-def camera_thread_func():
-    """Main loop for camera capture and defect detection."""
+    # Append structured events so /api/status never has to re-read the CSVs
+    for detection in detections:
+        event = app_state["event_store"].append(make_detection_event(
+            app_state["session_timestamp"], image_filename, detection,
+            timestamp, location['latitude'], location['longitude']))
+        app_state["event_hub"].publish('defect', defect_from_event(event).dict())
+
+
+# --- Camera & Detection Background Task ---
+def publish_frame(frame):
+    """Hands the newest annotated frame to every stream client, replacing any frame it has not taken yet."""
+    app_state["frame_seq"] += 1
+    item = (app_state["frame_seq"], frame)
+    app_state["latest_frame"] = item
+    for queue in app_state["frame_subscribers"]:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(item)
+
+async def camera_loop():
+    """Main loop for camera capture and defect detection. Blocking work runs in the executors."""
+    loop = asyncio.get_running_loop()
     while True:
         if not app_state["is_scanning"]:
-            time.sleep(1)
+            await asyncio.sleep(1)
             continue
 
-        ret, frame = app_state["camera"].read()
+        ret, frame = await loop.run_in_executor(app_state["capture_executor"], app_state["camera"].read)
         if not ret:
             print("❌ Failed to grab frame from camera.")
-            time.sleep(1)
+            await asyncio.sleep(1)
             continue
 
         original_frame = frame.copy() # Keep an original copy for saving
         location = app_state["gps_simulator"].get_location()
         
         # Perform ML inference
-        detections, frame_with_boxes = app_state["detection_engine"].detect(frame)
+        detections, frame_with_boxes = await loop.run_in_executor(
+            app_state["inference_executor"], app_state["detection_engine"].detect, frame)
         
         if detections:
-            save_defect_data(original_frame, location, detections)
+            # Not awaited: disk writes must not delay the next frame
+            save = loop.run_in_executor(app_state["io_executor"], save_defect_data, original_frame, location, detections)
+            save.add_done_callback(log_save_failure)
             
-        # Update the frame for streaming
-        with app_state["frame_lock"]:
-            app_state["latest_frame"] = frame_with_boxes
+        publish_frame(frame_with_boxes)
         
-        time.sleep(1 / config.UI_UPDATE_HZ)
+        await asyncio.sleep(1 / config.UI_UPDATE_HZ)
 
 # --- Video Streaming Generator ---
-def generate_frames():
-    """Generator function to yield frames for the MJPEG stream."""
-    while True:
-        with app_state["frame_lock"]:
-            if app_state["latest_frame"] is not None:
-                ret, buffer = cv2.imencode('.jpg', app_state["latest_frame"])
-                if ret:
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(1 / config.UI_UPDATE_HZ)
+async def encode_frame(seq, frame, tier):
+    """Encodes a frame for `tier` in the encode pool; clients watching the same tier share one encode."""
+    in_flight = app_state["encode_futures"].get(tier)
+    if in_flight is None or in_flight[0] != seq:
+        future = asyncio.get_running_loop().run_in_executor(
+            app_state["encode_executor"], app_state["stream_encoder"].encode, seq, frame, tier)
+        in_flight = app_state["encode_futures"][tier] = (seq, future)
+    # Shielded so a disconnecting client does not cancel the encode other clients are waiting for
+    return await asyncio.shield(in_flight[1])
+
+async def generate_frames(tier, max_fps):
+    """
+    Async generator yielding frames for the MJPEG stream at the given tier.
+    Each client has a one-slot queue that publish_frame() overwrites, so a
+    capped or slow client skips to the newest frame instead of queueing them.
+    """
+    frame_interval = 1 / min(max_fps, config.UI_UPDATE_HZ)
+    queue = asyncio.Queue(maxsize=1)
+    if app_state["latest_frame"] is not None:
+        queue.put_nowait(app_state["latest_frame"])
+    app_state["frame_subscribers"].add(queue)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            seq, frame = await queue.get()
+            started = loop.time()
+            try:
+                frame_bytes = await encode_frame(seq, frame, tier)
+            except ValueError:
+                continue
+            yield multipart_chunk(frame_bytes)
+            await asyncio.sleep(max(0.0, frame_interval - (loop.time() - started)))
+    finally:
+        app_state["frame_subscribers"].discard(queue)
 
 # --- CORS Middleware ---
 app.add_middleware(
@@ -168,55 +242,71 @@ app.add_middleware(
 class StatusResponse(BaseModel):
     telemetry: Telemetry
     defects: list[Defect]
+    cursor: int
 
 @app.get("/video_feed")
-async def video_feed():
-    return StreamingResponse(generate_frames(), media_type="multipart/x-mixed-replace; boundary=frame")
+async def video_feed(tier: str = config.STREAM_DEFAULT_TIER, fps: float = config.STREAM_MAX_FPS):
+    """MJPEG stream. `tier` is one of config.STREAM_TIERS and `fps` caps this client's frame rate."""
+    try:
+        tier, max_fps = parse_stream_params(tier, fps, config.STREAM_TIERS, config.STREAM_MAX_FPS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(generate_frames(tier, max_fps), media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/api/status", response_model=StatusResponse)
-async def get_status():
-    defect_list = []
-    data_dir = pathlib.Path(__file__).parent.parent / "car-software" / "data"
-
-    try:
-        session_dirs = sorted([d for d in data_dir.iterdir() if d.is_dir()], reverse=True)
-        if not session_dirs:
-            return StatusResponse(telemetry=telemetry_data, defects=[])
-
-        for session_dir in session_dirs[:5]: # Check last 5 sessions
-            metadata_path = session_dir / 'metadata.csv'
-            if metadata_path.exists():
-                with open(metadata_path, 'r', newline='') as csvfile:
-                    reader = csv.DictReader(csvfile)
-                    for row in reader:
-                        try:
-                            detections = ast.literal_eval(row.get('detections', '[]'))
-                        except (ValueError, SyntaxError):
-                            continue
-
-                        for detection in detections:
-                            defect_id = f"{session_dir.name}-{row.get('filename')}-{detection.get('class')}"
-                            image_url = f"/images/{session_dir.name}/{row.get('filename')}"
-                            
-                            defect_list.append(
-                                Defect(
-                                    id=defect_id,
-                                    type=detection.get('class', 'N/A'),
-                                    confidence=float(detection.get('confidence', 0.0)),
-                                    timestamp=int(row.get('timestamp', 0)),
-                                    latitude=float(row.get('latitude', 0.0)),
-                                    longitude=float(row.get('longitude', 0.0)),
-                                    image_url=image_url
-                                )
-                            )
-    except Exception as e:
-        print(f"Error reading local data: {e}")
+async def get_status(cursor: int = 0, limit: int = 50):
+    """
+    Returns telemetry and detections, oldest first: the newest `limit` without a cursor,
+    otherwise the next `limit` recorded after it. Pass the returned `cursor` (the id of the
+    last detection returned) back to page through everything recorded since, without gaps.
+    Served entirely from memory on the event loop; it never waits on disk or inference.
+    """
+    event_store = app_state["event_store"]
+    limit = max(1, min(limit, 500))
+    events = event_store.since(cursor, limit) if cursor else event_store.latest(limit)[::-1]
+
+    defect_list = [defect_from_event(event) for event in events]
 
     # Update telemetry scanning status
     telemetry_data.is_scanning = app_state["is_scanning"]
-    # Sort defects by timestamp descending and limit to 50
-    defect_list.sort(key=lambda x: x.timestamp, reverse=True)
-    return StatusResponse(telemetry=telemetry_data, defects=defect_list[:50])
+    return StatusResponse(telemetry=telemetry_data, defects=defect_list,
+                          cursor=events[-1]["id"] if events else max(cursor, event_store.last_id))
+
+def live_snapshot():
+    """Full state sent when a push client connects or has fallen too far behind."""
+    telemetry_data.is_scanning = app_state["is_scanning"]
+    event_store = app_state["event_store"]
+    return {
+        "telemetry": telemetry_data.dict(),
+        "defects": [defect_from_event(event).dict() for event in event_store.latest(20)],
+        "cursor": event_store.last_id,
+    }
+
+@app.websocket("/ws/live")
+async def live_updates(websocket: WebSocket):
+    """
+    Pushes telemetry and new detections as they happen, replacing /api/status polling.
+    Each message is a JSON list of {"type", "data"} events: one "snapshot" on connect,
+    then "telemetry" (only when it changed, coalesced for slow clients) and "defect" deltas.
+    """
+    await websocket.accept()
+    event_hub = app_state["event_hub"]
+    subscription = event_hub.subscribe(loop=asyncio.get_running_loop())
+    try:
+        await websocket.send_json([{"type": "snapshot", "data": live_snapshot()}])
+        while True:
+            events = await subscription.get_async(timeout=config.LIVE_EVENTS_KEEPALIVE_SECONDS)
+            messages = [
+                {"type": "snapshot", "data": live_snapshot()} if event_type == 'resync'
+                else {"type": event_type, "data": data}
+                for event_type, data in events
+            ]
+            # An empty list doubles as a keepalive
+            await websocket.send_json(messages)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        event_hub.unsubscribe(subscription)
 
 class ControlResponse(BaseModel):
     status: str
@@ -224,26 +314,20 @@ class ControlResponse(BaseModel):
 @app.post("/api/control/start", response_model=ControlResponse)
 async def start_scan():
     if not app_state["is_scanning"]:
-        app_state["is_scanning"] = True
         # Create new session directory for saving data
         app_state["session_timestamp"] = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
         app_state["data_dir"] = os.path.join(config.LOCAL_DATA_DIR, app_state["session_timestamp"])
-        os.makedirs(app_state["data_dir"], exist_ok=True)
-        
-        metadata_path = os.path.join(app_state["data_dir"], 'metadata.csv')
-        app_state["metadata_file"] = open(metadata_path, 'w', newline='')
-        app_state["metadata_writer"] = csv.writer(app_state["metadata_file"])
-        app_state["metadata_writer"].writerow(['filename', 'timestamp', 'latitude', 'longitude', 'detections'])
+        await asyncio.get_running_loop().run_in_executor(
+            app_state["io_executor"], open_session_metadata, app_state["data_dir"])
+        app_state["is_scanning"] = True
     return ControlResponse(status="started")
 
 @app.post("/api/control/stop", response_model=ControlResponse)
 async def stop_scan():
     if app_state["is_scanning"]:
         app_state["is_scanning"] = False
-        if app_state["metadata_file"]:
-            app_state["metadata_file"].close()
-            app_state["metadata_file"] = None
-            app_state["metadata_writer"] = None
+        # Queued behind any pending save_defect_data calls, so their metadata rows are kept
+        await asyncio.get_running_loop().run_in_executor(app_state["io_executor"], close_session_metadata)
     return ControlResponse(status="stopped")
 
 # --- Application Lifecycle ---
@@ -253,48 +337,39 @@ async def startup_event():
     app_state["camera"] = cv2.VideoCapture(0)
     app_state["gps_simulator"] = GPSSimulator(start_lat=config.START_LAT, start_lon=config.START_LON)
     app_state["detection_engine"] = DetectionEngine(model_path=config.MODEL_PATH)
+    app_state["event_store"] = DetectionEventStore(
+        os.path.join(config.LOCAL_DATA_DIR, 'events.ndjson'), legacy_data_dir=config.LOCAL_DATA_DIR)
+    
+    app_state["capture_executor"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+    app_state["inference_executor"] = ThreadPoolExecutor(max_workers=config.INFERENCE_WORKERS,
+                                                         thread_name_prefix="inference")
+    app_state["encode_executor"] = ThreadPoolExecutor(max_workers=config.STREAM_ENCODE_WORKERS,
+                                                      thread_name_prefix="encode")
+    app_state["io_executor"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-io")
     
-    # Start background threads
-    telemetry_thread = Thread(target=telemetry_simulation, daemon=True)
-    camera_thread = Thread(target=camera_thread_func, daemon=True)
-    telemetry_thread.start()
-    camera_thread.start()
+    # Start background tasks
+    app_state["background_tasks"] = [
+        asyncio.create_task(telemetry_simulation()),
+        asyncio.create_task(camera_loop()),
+    ]
     
     print("🚀 SMART ROAD SENTINEL API ACTIVE")
     print("📡 API Running at http://localhost:8000")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    for task in app_state["background_tasks"]:
+        task.cancel()
+    await asyncio.gather(*app_state["background_tasks"], return_exceptions=True)
+    for name in ("capture_executor", "inference_executor", "encode_executor", "io_executor"):
+        if app_state[name]:
+            app_state[name].shutdown(wait=True) # Lets queued defect saves finish
     if app_state["camera"]:
         app_state["camera"].release()
-    if app_state["metadata_file"]:
-        app_state["metadata_file"].close()
+    close_session_metadata()
+    if app_state["event_store"]:
+        app_state["event_store"].close()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
-
-class ControlResponse(BaseModel):
-    status: str
-
-@app.post("/api/control/start", response_model=ControlResponse)
-async def start_scan():
-    telemetry_data.is_scanning = True
-    return ControlResponse(status="started")
-
-@app.post("/api/control/stop", response_model=ControlResponse)
-async def stop_scan():
-    telemetry_data.is_scanning = False
-    return ControlResponse(status="stopped")
-
-# --- Application Lifecycle ---
-@app.on_event("startup")
-async def startup_event():
-    simulation_thread = Thread(target=telemetry_simulation, daemon=True)
-    simulation_thread.start()
-    print("🚀 SMART ROAD SENTINEL API ACTIVE")
-    print("📡 API Running at http://localhost:8000")
-
-@app.get("/", response_class=HTMLResponse)
-async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
\ No newline at end of file
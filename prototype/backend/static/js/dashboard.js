@@ -5,6 +5,8 @@ document.addEventListener('DOMContentLoaded', function () {
     
     // Keep track of logged event IDs to prevent duplicates
     const loggedEventIds = new Set();
+    // Id of the newest detection seen so far; the server only returns newer ones
+    let statusCursor = 0;
 
     // --- Control Button Logic ---
     startBtn.addEventListener('click', async () => {
@@ -58,29 +60,38 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    function updateTelemetry(telemetry) {
+        // Update telemetry (example for scanning status)
+        const telemetryGpu = document.querySelector('#telemetry-container .telemetry-widget h2');
+        if(telemetryGpu) {
+            telemetryGpu.style.color = (telemetry.is_scanning ?? telemetry.isScanning) ? '#00faff' : '#e0e0e0';
+        }
+    }
+
+    function logDefects(defects) {
+        // Polls return oldest first, snapshots newest first; the log prepends, so add oldest first
+        defects.slice().sort((a, b) => Number(a.id) - Number(b.id)).forEach(defect => {
+            if (!loggedEventIds.has(defect.id)) {
+                addEventToLog(defect);
+                loggedEventIds.add(defect.id);
+            }
+        });
+    }
+
+    // Polling fallback for browsers without WebSocket support
     async function fetchStatus() {
         try {
-            const response = await fetch('/api/status');
+            const response = await fetch(`/api/status?cursor=${statusCursor}`);
             if (!response.ok) {
                 console.error("Failed to fetch status");
                 return;
             }
             const data = await response.json();
 
-            // Update telemetry (example for scanning status)
-            const telemetryGpu = document.querySelector('#telemetry-container .telemetry-widget h2');
-            if(telemetryGpu) {
-                telemetryGpu.style.color = data.telemetry.is_scanning ? '#00faff' : '#e0e0e0';
-            }
-
-            // Update defect log
+            updateTelemetry(data.telemetry);
+            statusCursor = data.cursor;
             if (data.defects) {
-                data.defects.forEach(defect => {
-                    if (!loggedEventIds.has(defect.id)) {
-                        addEventToLog(defect);
-                        loggedEventIds.add(defect.id);
-                    }
-                });
+                logDefects(data.defects);
             }
 
         } catch (error) {
@@ -88,6 +99,38 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
-    // Fetch status every 2 seconds
-    setInterval(fetchStatus, 2000);
+    // --- Live updates pushed by the server ---
+    // Each message is a list of events: a snapshot on connect, then telemetry
+    // changes and new defects as they happen.
+    function connectLiveUpdates() {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${window.location.host}/ws/live`);
+
+        socket.onmessage = (message) => {
+            JSON.parse(message.data).forEach(event => {
+                if (event.type === 'snapshot') {
+                    updateTelemetry(event.data.telemetry);
+                    statusCursor = event.data.cursor;
+                    logDefects(event.data.defects);
+                } else if (event.type === 'telemetry') {
+                    updateTelemetry(event.data);
+                } else if (event.type === 'defect') {
+                    logDefects([event.data]);
+                }
+            });
+        };
+
+        // Reconnect after a short delay; the new snapshot fills any gap
+        socket.onclose = () => {
+            console.error("Live update connection closed, reconnecting...");
+            setTimeout(connectLiveUpdates, 2000);
+        };
+    }
+
+    if (window.WebSocket) {
+        connectLiveUpdates();
+    } else {
+        // Fetch status every 2 seconds
+        setInterval(fetchStatus, 2000);
+    }
 });
\ No newline at end of file
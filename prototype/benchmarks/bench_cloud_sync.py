@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Add the parent directory (prototype) to sys.path to allow importing modules from it
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_data_manager import percentile
+from car_software.cloud_sync import CloudOutbox, CloudSyncWorker, ResumableUploadExpired
+
+
+class FakeCloudStorage:
+    """
+    In-memory stand-in for CloudStorage with network latency, periodic dead
+    zones and lost acknowledgements (the write lands but the caller sees an
+    error), which is what the outbox's idempotency keys have to absorb.
+    """
+    def __init__(self, latency_s=0.02, online_s=2.0, offline_s=1.0, lost_ack_rate=0.05, seed=0):
+        self.latency_s = latency_s
+        self.online_s = online_s
+        self.offline_s = offline_s
+        self.lost_ack_rate = lost_ack_rate
+        self.documents = {}
+        self.blobs = {}
+        self.document_writes = 0
+        self._sessions = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def _network(self):
+        time.sleep(self.latency_s)
+        if self.offline_s and (time.monotonic() - self._started) % (self.online_s + self.offline_s) >= self.online_s:
+            raise ConnectionError("dead zone")
+
+    def _lost_ack(self):
+        with self._lock:
+            return self._rng.random() < self.lost_ack_rate
+
+    def commit_documents(self, documents):
+        self._network()
+        with self._lock:
+            for collection_name, document_id, data in documents:
+                self.documents[(collection_name, document_id)] = data
+                self.document_writes += 1
+        if self._lost_ack():
+            raise ConnectionError("acknowledgement lost")
+
+    def start_resumable_upload(self, destination_blob_name, size, content_type=None):
+        self._network()
+        with self._lock:
+            url = f"fake://upload/{len(self._sessions)}"
+            self._sessions[url] = (destination_blob_name, bytearray())
+        return url
+
+    def upload_chunks(self, upload_url, file_path, chunk_size, on_progress=None):
+        if upload_url not in self._sessions:
+            raise ResumableUploadExpired(upload_url)
+        destination, received = self._sessions[upload_url]
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        while len(received) < len(data):
+            self._network()
+            received.extend(data[len(received):len(received) + chunk_size])
+            if on_progress:
+                on_progress(len(received))
+        self.blobs[destination] = bytes(received)
+        return len(data)
+
+
+def run(documents, files, file_size, enqueue_rate, cloud, worker_kwargs, tmp):
+    outbox = CloudOutbox(os.path.join(tmp, 'outbox.db'))
+    worker = CloudSyncWorker(outbox, cloud, **worker_kwargs).start()
+    payload = os.urandom(file_size)
+    enqueue_ms, depth_samples = [], []
+
+    start = time.monotonic()
+    files_every = max(1, documents // files) if files else None
+    for i in range(documents):
+        t0 = time.perf_counter()
+        outbox.enqueue_document('defects', {'index': i, 'confidence': 0.8}, idempotency_key=f"doc_{i}")
+        if files_every and i % files_every == 0 and i // files_every < files:
+            path = os.path.join(tmp, f"frame_{i}.jpg")
+            with open(path, 'wb') as f:
+                f.write(payload)
+            outbox.enqueue_file(path, f"session/frame_{i}.jpg", content_type='image/jpeg')
+        enqueue_ms.append((time.perf_counter() - t0) * 1000)
+        if i % 100 == 0:
+            depth = outbox.depth()
+            depth_samples.append(depth['documents'] + depth['files'])
+        if enqueue_rate:
+            time.sleep(1.0 / enqueue_rate)
+    enqueued_s = time.monotonic() - start
+
+    # Drain
+    while True:
+        depth = outbox.depth()
+        depth_samples.append(depth['documents'] + depth['files'])
+        if depth_samples[-1] == 0 and not worker.stats()['uploads_in_flight']:
+            break
+        time.sleep(0.1)
+    drained_s = time.monotonic() - start
+    worker.stop()
+    stats = worker.stats()
+    outbox.close()
+
+    return {
+        "documents": documents,
+        "files": len(cloud.blobs),
+        "enqueue_p50_ms": round(percentile(enqueue_ms, 50), 3),
+        "enqueue_p99_ms": round(percentile(enqueue_ms, 99), 3),
+        "enqueue_s": round(enqueued_s, 2),
+        "drain_s": round(drained_s, 2),
+        "documents_per_s": round(documents / drained_s, 1),
+        "upload_bytes_per_s": round(stats['bytes_uploaded'] / drained_s),
+        "max_queue_depth": max(depth_samples),
+        "failures": stats['failures'],
+        "document_writes": cloud.document_writes,
+        # Lost acknowledgements cause rewrites, never extra documents
+        "documents_in_cloud": len(cloud.documents),
+        "files_intact": all(len(b) == file_size for b in cloud.blobs.values()),
+    }
+
+
+def main():
+    """Drives CloudOutbox and CloudSyncWorker against an in-memory fake with dead zones and lost acks."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--documents', type=int, default=5000)
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--file-size', type=int, default=300_000)
+    parser.add_argument('--enqueue-rate', type=float, default=0, help='Enqueues per second (0 = as fast as possible).')
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated seconds per network call.')
+    parser.add_argument('--online', type=float, default=2.0, help='Seconds of connectivity per cycle.')
+    parser.add_argument('--offline', type=float, default=1.0, help='Seconds of dead zone per cycle (0 = always online).')
+    parser.add_argument('--lost-ack-rate', type=float, default=0.05)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--upload-workers', type=int, default=4)
+    parser.add_argument('--chunk-size', type=int, default=256 * 1024)
+    parser.add_argument('--output', help='Optional path for JSON results.')
+    args = parser.parse_args()
+
+    cloud = FakeCloudStorage(latency_s=args.latency, online_s=args.online, offline_s=args.offline,
+                             lost_ack_rate=args.lost_ack_rate)
+    worker_kwargs = {"batch_size": args.batch_size, "upload_workers": args.upload_workers,
+                     "chunk_size": args.chunk_size, "base_backoff_s": 0.1, "max_backoff_s": 1.0,
+                     "poll_interval_s": 0.05}
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(args.documents, args.files, args.file_size, args.enqueue_rate, cloud, worker_kwargs, tmp)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Add the parent directory (prototype) to sys.path to allow importing modules from it
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_manager import DataManager
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def time_query(fn, repeats):
+    """Runs fn `repeats` times and returns p50/p95 latency in milliseconds."""
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(percentile(latencies, 50), 3), "p95_ms": round(percentile(latencies, 95), 3)}
+
+
+def synthetic_rows(count, days, seed=0):
+    """Yields pothole rows spread over the last `days` days around Bangalore."""
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    for i in range(count):
+        timestamp = now - datetime.timedelta(seconds=rng.uniform(0, days * 86400))
+        session = (timestamp - datetime.timedelta(minutes=timestamp.minute % 30)).strftime('%Y-%m-%d_%H-%M-00')
+        yield (12.9716 + rng.uniform(-0.1, 0.1), 77.5946 + rng.uniform(-0.1, 0.1), timestamp,
+               session, f"frame_{i}.jpg", round(rng.uniform(0.25, 0.99), 2))
+
+
+def run(rows, batch_rows, single_rows, repeats, days, db_path):
+    results = {"rows": rows}
+    dm = DataManager(db_path=db_path)
+
+    # Bulk path: large transactions through add_pothole_entries
+    start = time.perf_counter()
+    batch = []
+    for row in synthetic_rows(rows, days):
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            dm.add_pothole_entries(batch, wait=False)
+            batch = []
+    if batch:
+        dm.add_pothole_entries(batch, wait=False)
+    dm.flush()
+    elapsed = time.perf_counter() - start
+    results["bulk_insert_rows_per_s"] = round(rows / elapsed)
+
+    # Live path: one add_pothole_entry call per detection, grouped by the writer thread
+    start = time.perf_counter()
+    for row in synthetic_rows(single_rows, days, seed=1):
+        dm.add_pothole_entry(*row)
+    dm.flush()
+    results["single_insert_rows_per_s"] = round(single_rows / (time.perf_counter() - start))
+
+    today = datetime.date.today().isoformat()
+    some_day = (datetime.date.today() - datetime.timedelta(days=days // 2)).isoformat()
+    sample_session = dm._reader().execute("SELECT session_timestamp FROM potholes LIMIT 1").fetchone()[0]
+    results["queries"] = {
+        "summary_statistics": time_query(dm.get_summary_statistics_data, repeats),
+        "historical_today": time_query(lambda: dm.get_historical_potholes_data(today), repeats),
+        "historical_one_day": time_query(lambda: dm.get_historical_potholes_data(some_day), repeats),
+        "defect_details": time_query(lambda: dm.get_defect_details(random.randint(1, rows)), repeats),
+        "session_rows": time_query(lambda: dm._reader().execute(
+            "SELECT id FROM potholes WHERE session_timestamp = ?", (sample_session,)).fetchall(), repeats),
+    }
+    dm.close()
+    return results
+
+
+def main():
+    """Benchmarks DataManager insert throughput and query latency on a synthetic table."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch-rows', type=int, default=10_000)
+    parser.add_argument('--single-rows', type=int, default=20_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--output', help='Optional path for JSON results.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(args.rows, args.batch_rows, args.single_rows, args.repeats, args.days,
+                      os.path.join(tmp, 'bench.db'))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+# Add the parent directory (prototype) to sys.path to allow importing modules from it
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import inference_backends
+from bench_data_manager import percentile, run as run_data_manager_benchmark
+from car_software import config
+from detection import DetectionEngine, draw_detections
+from stream_encoder import TieredJpegEncoder
+
+PROTOTYPE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_FIXTURE_GLOBS = (
+    os.path.join(PROTOTYPE_DIR, 'car_software', 'data', '*', 'frame_*.jpg'),
+    os.path.join(PROTOTYPE_DIR, 'dataset_synthetic', 'images', '*', '*.jpg'),
+)
+DEFAULT_BATCH_SIZES = (1, 4, 8, 16)
+# Drawn when no model is available, so the draw stage is still measured
+PLACEHOLDER_DETECTIONS = [
+    {'class': 'Pothole', 'confidence': 0.9, 'bbox': [40, 200, 160, 260]},
+    {'class': 'Pothole', 'confidence': 0.6, 'bbox': [300, 240, 420, 300]},
+]
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return None
+    return {
+        "samples": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def load_fixtures(patterns, max_images):
+    """Reads up to `max_images` JPEGs as raw bytes, sorted so every run uses the same set."""
+    paths = sorted(path for pattern in patterns for path in glob.glob(pattern))[:max_images]
+    fixtures = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            fixtures.append((os.path.relpath(path, PROTOTYPE_DIR), np.frombuffer(f.read(), dtype=np.uint8)))
+    return fixtures
+
+
+def environment_info(engine, model_path, fixture_count):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROTOTYPE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "model": model_path,
+        "backend": type(engine.model).__name__ if engine.model else None,
+        "fixtures": fixture_count,
+    }
+
+
+def model_stages(engine, frame):
+    """
+    Times one frame through the model as {stage: ms} for preprocess, inference
+    and postprocess, and returns the detections.
+    """
+    backend = engine.model
+    if isinstance(backend, inference_backends.UltralyticsBackend):
+        # ultralytics times its own stages per image, so one call gives both the timings and the detections
+        result = backend.model([frame], imgsz=backend.img_size, conf=backend.conf_threshold,
+                               iou=backend.iou_threshold, verbose=False)[0]
+        return dict(result.speed), to_detections(engine, *backend.result_arrays(result))
+
+    timings = {}
+    start = time.perf_counter()
+    tensor, metas = inference_backends.preprocess([frame], backend.img_size)
+    timings["preprocess"] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    prediction = backend._forward(tensor)
+    timings["inference"] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    class_ids, confidences, boxes = inference_backends.postprocess(
+        prediction, metas, backend.conf_threshold, backend.iou_threshold)[0]
+    detections = to_detections(engine, class_ids, confidences, boxes)
+    timings["postprocess"] = (time.perf_counter() - start) * 1000
+    return timings, detections
+
+
+def to_detections(engine, class_ids, confidences, boxes):
+    """Detection dicts of the engine's target classes, as DetectionEngine.detect() returns them."""
+    mask = np.isin(class_ids, engine.target_class_ids)
+    return [{'class': engine.model.names.get(c, 'Unknown'), 'confidence': round(s, 2), 'bbox': b}
+            for c, s, b in zip(class_ids[mask].tolist(), confidences[mask].tolist(),
+                               boxes[mask].astype(np.int32).tolist())]
+
+
+def bench_stages(engine, fixtures, encoder, warmup):
+    """Per-frame latency of every stage from JPEG bytes to streamed JPEG."""
+    stages = {name: [] for name in ("decode", "preprocess", "inference", "postprocess", "draw")}
+    stages.update({f"encode_{tier}": [] for tier in encoder.tiers})
+
+    for index, (_, data) in enumerate(fixtures):
+        record = index >= warmup
+        start = time.perf_counter()
+        frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        decode_ms = (time.perf_counter() - start) * 1000
+        if frame is None:
+            continue
+
+        if engine.model:
+            timings, detections = model_stages(engine, frame)
+        else:
+            # Preprocessing is pure NumPy/OpenCV, so it is measured even without a model
+            start = time.perf_counter()
+            inference_backends.preprocess([frame])
+            timings, detections = {"preprocess": (time.perf_counter() - start) * 1000}, PLACEHOLDER_DETECTIONS
+
+        start = time.perf_counter()
+        draw_detections(frame, detections)
+        timings["draw"] = (time.perf_counter() - start) * 1000
+
+        for tier in encoder.tiers:
+            start = time.perf_counter()
+            encoder.encode(index, frame, tier)
+            timings[f"encode_{tier}"] = (time.perf_counter() - start) * 1000
+
+        if record:
+            stages["decode"].append(decode_ms)
+            for name, ms in timings.items():
+                stages[name].append(ms)
+    return {name: latency_summary(values) for name, values in stages.items()}
+
+
+def bench_batches(engine, frames, batch_sizes, warmup):
+    """Images per second through DetectionEngine.detect_batch() at each batch size."""
+    results = {}
+    for batch_size in batch_sizes:
+        engine.detect_batch([f.copy() for f in frames[:batch_size * warmup]], batch_size=batch_size)
+        work = [f.copy() for f in frames]
+        start = time.perf_counter()
+        engine.detect_batch(work, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        results[str(batch_size)] = {
+            "images_per_s": round(len(work) / elapsed, 2),
+            "ms_per_image": round(elapsed * 1000 / len(work), 3),
+        }
+    return results
+
+
+def flatten(results, prefix=''):
+    """Flattens nested results into {'a.b.c': number} for comparison."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, threshold_pct):
+    """
+    Prints the change of every timing, rate and memory metric against a
+    baseline results file. Returns the metrics that got worse by more than
+    `threshold_pct` percent.
+    """
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    regressions = []
+    print(f"Comparing against {baseline['environment'].get('commit')} ({baseline['environment'].get('timestamp')})")
+    for name in sorted(set(old) & set(new)):
+        if name.endswith('_per_s'):
+            higher_is_better = True
+        elif name.endswith('_ms') or name.endswith('_mb'):
+            higher_is_better = False
+        else:
+            continue
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold_pct:
+            flag = '  ⚠️ regression'
+            regressions.append(name)
+        print(f"  {name:60s} {old[name]:>12} -> {new[name]:>12} ({change:+.1f}%){flag}")
+    return regressions
+
+
+def main():
+    """Benchmarks every stage of the detection pipeline on the committed fixture images."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--model', default=config.MODEL_PATH)
+    parser.add_argument('--fixtures', nargs='*', default=list(DEFAULT_FIXTURE_GLOBS),
+                        help='Glob patterns of fixture JPEGs.')
+    parser.add_argument('--max-images', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=5, help='Frames (or batches) excluded from the results.')
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=list(DEFAULT_BATCH_SIZES))
+    parser.add_argument('--db-rows', type=int, default=100_000)
+    parser.add_argument('--db-single-rows', type=int, default=5_000)
+    parser.add_argument('--skip-db', action='store_true', help='Skip the SQLite insert/query benchmark.')
+    parser.add_argument('--output', help='Optional path for JSON results.')
+    parser.add_argument('--compare', help='Baseline JSON results to compare against.')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent change counted as a regression in --compare (exit status 1).')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures, args.max_images)
+    if not fixtures:
+        print(f"❌ No fixture images found for {args.fixtures}")
+        sys.exit(1)
+
+    engine = DetectionEngine(model_path=args.model)
+    # Phase names end in _mb so compare() treats them as lower-is-better
+    results = {"peak_rss": {"start_mb": peak_rss_mb()}}
+
+    results["stages"] = bench_stages(engine, fixtures, TieredJpegEncoder(config.STREAM_TIERS), args.warmup)
+    results["peak_rss"]["stages_mb"] = peak_rss_mb()
+
+    if engine.model:
+        frames = [frame for frame in (cv2.imdecode(data, cv2.IMREAD_COLOR) for _, data in fixtures)
+                  if frame is not None]
+        results["batch_throughput"] = bench_batches(engine, frames, args.batch_sizes, args.warmup)
+        del frames
+        results["peak_rss"]["batches_mb"] = peak_rss_mb()
+    else:
+        print("⚠️ No model available: skipping inference stages and batch throughput.")
+
+    if not args.skip_db:
+        with tempfile.TemporaryDirectory() as tmp:
+            results["sqlite"] = run_data_manager_benchmark(args.db_rows, 10_000, args.db_single_rows, 20, 30,
+                                                           os.path.join(tmp, 'bench.db'))
+        results["peak_rss"]["sqlite_mb"] = peak_rss_mb()
+
+    report = {"environment": environment_info(engine, args.model, len(fixtures)), "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} metric(s) regressed by more than {args.threshold}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import json
+import time
+import urllib.parse
+
+BOUNDARY = b'--frame'
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"requests": 0}
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+async def http_request(host, port, method, path):
+    """Minimal HTTP/1.1 request on a fresh connection; returns the status code."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: 0\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def poll_status(host, port, rate, duration, latencies, errors):
+    """Fires GET /api/status at a fixed rate (open loop) for `duration` seconds."""
+    async def one_request():
+        start = time.perf_counter()
+        try:
+            status = await http_request(host, port, 'GET', '/api/status')
+            if status != 200:
+                errors.append(status)
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+        except (OSError, ValueError, IndexError) as e:
+            errors.append(str(e))
+
+    tasks = []
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - started < duration:
+        tasks.append(asyncio.create_task(one_request()))
+        sent += 1
+        # Schedule against the start time so a slow server does not lower the offered rate
+        await asyncio.sleep(max(0.0, started + sent * interval - time.perf_counter()))
+    await asyncio.gather(*tasks)
+
+
+async def stream_client(host, port, path, stop, stats):
+    """Reads an MJPEG stream until `stop` is set, counting frames and bytes."""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError as e:
+        stats["errors"] += 1
+        print(f"❌ Stream client could not connect: {e}")
+        return
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    tail = b''
+    try:
+        while not stop.is_set():
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            if not chunk:
+                break
+            data = tail + chunk
+            stats["frames"] += data.count(BOUNDARY)
+            stats["bytes"] += len(chunk)
+            tail = data[-(len(BOUNDARY) - 1):]
+    finally:
+        writer.close()
+
+
+async def run_phase(host, port, rate, duration, stream_clients, stream_path):
+    latencies, errors = [], []
+    stop = asyncio.Event()
+    stream_stats = {"frames": 0, "bytes": 0, "errors": 0}
+    streams = [asyncio.create_task(stream_client(host, port, stream_path, stop, stream_stats))
+               for _ in range(stream_clients)]
+    if streams:
+        await asyncio.sleep(1.0) # Let the streams connect before measuring
+    await poll_status(host, port, rate, duration, latencies, errors)
+    stop.set()
+    await asyncio.gather(*streams)
+
+    result = latency_summary(latencies)
+    result["errors"] = len(errors)
+    if stream_clients:
+        result["stream_clients"] = stream_clients
+        result["stream_fps_per_client"] = round(stream_stats["frames"] / stream_clients / duration, 2)
+        result["stream_mbytes_per_s"] = round(stream_stats["bytes"] / duration / 1e6, 2)
+        result["stream_errors"] = stream_stats["errors"]
+    return result
+
+
+async def run(url, rate, duration, stream_clients, tier, fps, start_scan):
+    parsed = urllib.parse.urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    stream_path = f"/video_feed?{urllib.parse.urlencode({'tier': tier, 'fps': fps})}"
+
+    if start_scan:
+        await http_request(host, port, 'POST', '/api/control/start')
+    try:
+        results = {
+            "status_rate_per_s": rate,
+            "duration_s": duration,
+            "baseline": await run_phase(host, port, rate, duration, 0, stream_path),
+            "with_streams": await run_phase(host, port, rate, duration, stream_clients, stream_path),
+        }
+    finally:
+        if start_scan:
+            await http_request(host, port, 'POST', '/api/control/stop')
+
+    baseline_p99 = results["baseline"].get("p99_ms")
+    loaded_p99 = results["with_streams"].get("p99_ms")
+    if baseline_p99 and loaded_p99:
+        results["p99_ratio"] = round(loaded_p99 / baseline_p99, 2)
+    return results
+
+
+def main():
+    """
+    Load-tests the FastAPI backend: polls /api/status at a fixed rate, first
+    alone and then alongside concurrent /video_feed clients, and reports
+    status latency percentiles for both phases. Start the server first, e.g.
+    `uvicorn prototype.backend.server:app --port 8000` from the repository root.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--status-rate', type=float, default=200, help='/api/status requests per second.')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per phase.')
+    parser.add_argument('--stream-clients', type=int, default=50)
+    parser.add_argument('--tier', default='480p')
+    parser.add_argument('--fps', type=float, default=15)
+    parser.add_argument('--no-start-scan', action='store_true',
+                        help="Don't call /api/control/start/stop around the test.")
+    parser.add_argument('--output', help='Optional path for JSON results.')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.status_rate, args.duration, args.stream_clients,
+                              args.tier, args.fps, not args.no_start_scan))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,14 @@
 import firebase_admin
 from firebase_admin import credentials, firestore, storage
 import os
+import re
+import requests
+
+from cloud_sync import ResumableUploadExpired
+
+# Resumable upload chunks must be a multiple of 256 KiB
+UPLOAD_CHUNK_ALIGNMENT = 256 * 1024
+UPLOAD_TIMEOUT_SECONDS = 60
 
 class CloudStorage:
     def __init__(self, credentials_path, project_id):
@@ -46,6 +54,63 @@ class CloudStorage:
             print(f"Error adding document: {e}")
             return None
 
+    def commit_documents(self, documents):
+        """
+        Writes documents in one Firestore batched write (at most 500 per batch).
+        Uses set() on caller-chosen ids, so retrying a batch never duplicates documents.
+        :param documents: Iterable of (collection_name, document_id, data).
+        Raises on failure so the caller can retry.
+        """
+        batch = self.db.batch()
+        for collection_name, document_id, data in documents:
+            batch.set(self.db.collection(collection_name).document(document_id), data)
+        batch.commit()
+
+    def start_resumable_upload(self, destination_blob_name, size, content_type=None):
+        """
+        Opens a resumable upload session for a blob and returns its session URL.
+        The URL stays valid for about a week and needs no further credentials.
+        """
+        blob = self.bucket.blob(destination_blob_name)
+        return blob.create_resumable_upload_session(content_type=content_type, size=size)
+
+    def upload_chunks(self, upload_url, file_path, chunk_size=8 * UPLOAD_CHUNK_ALIGNMENT, on_progress=None):
+        """
+        Sends a file to a resumable upload session, continuing from the byte
+        offset the server has already committed.
+        :param on_progress: Optional callback receiving the committed byte count after every chunk.
+        Returns the file size. Raises ResumableUploadExpired if the session is gone.
+        """
+        chunk_size = max(UPLOAD_CHUNK_ALIGNMENT, chunk_size // UPLOAD_CHUNK_ALIGNMENT * UPLOAD_CHUNK_ALIGNMENT)
+        total = os.path.getsize(file_path)
+        # Ask the server how much it already has
+        offset = self._committed_bytes(requests.put(upload_url, headers={'Content-Range': f'bytes */{total}'},
+                                                    timeout=UPLOAD_TIMEOUT_SECONDS), total)
+        with open(file_path, 'rb') as f:
+            while offset < total:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                content_range = f'bytes {offset}-{offset + len(chunk) - 1}/{total}'
+                response = requests.put(upload_url, data=chunk, headers={'Content-Range': content_range},
+                                        timeout=UPLOAD_TIMEOUT_SECONDS)
+                offset = self._committed_bytes(response, total)
+                if on_progress:
+                    on_progress(offset)
+        return total
+
+    @staticmethod
+    def _committed_bytes(response, total):
+        """Interprets a resumable upload response as the number of bytes the server has committed."""
+        if response.status_code in (200, 201):
+            return total
+        if response.status_code == 308: # Resume Incomplete
+            match = re.match(r'bytes=0-(\d+)', response.headers.get('Range', ''))
+            return int(match.group(1)) + 1 if match else 0
+        if response.status_code in (404, 410):
+            raise ResumableUploadExpired(f"Upload session expired ({response.status_code})")
+        response.raise_for_status()
+        raise RuntimeError(f"Unexpected resumable upload response {response.status_code}")
+
 if __name__ == '__main__':
     # Example Usage (requires the credentials file)
     # cred_path = '../asphalt-ai-firebase-adminsdk-fbsvc-f7762d42b3.json'
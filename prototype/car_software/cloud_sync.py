@@ -0,0 +1,379 @@
+import concurrent.futures
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import cv2
+
+# Outbox schema migrations, applied in order. PRAGMA user_version records how many have run.
+OUTBOX_MIGRATIONS = [
+    # 1: outbox table
+    ['''CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        kind TEXT NOT NULL,
+        collection TEXT,
+        payload TEXT,
+        file_path TEXT,
+        destination TEXT,
+        content_type TEXT,
+        upload_url TEXT,
+        uploaded_bytes INTEGER NOT NULL DEFAULT 0,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        synced_at REAL
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (state, kind, next_attempt_at)"],
+    # 2: upload priority and pre-upload transform
+    ["ALTER TABLE outbox ADD COLUMN priority REAL NOT NULL DEFAULT 0",
+     "ALTER TABLE outbox ADD COLUMN transform TEXT",
+     "DROP INDEX IF EXISTS idx_outbox_due",
+     "CREATE INDEX IF NOT EXISTS idx_outbox_priority ON outbox (state, kind, priority)"],
+]
+
+OUTBOX_COLUMNS = ('id', 'idempotency_key', 'kind', 'collection', 'payload', 'file_path', 'destination',
+                  'content_type', 'upload_url', 'uploaded_bytes', 'attempts', 'transform')
+
+
+class ResumableUploadExpired(Exception):
+    """The server no longer knows the resumable upload session; the upload must start over."""
+
+
+class CloudOutbox:
+    """
+    Durable, SQLite-backed queue of Firestore documents and Storage uploads.
+
+    `enqueue_document()` and `enqueue_file()` are a single local insert, so the
+    car code never waits on the network and nothing is lost in a dead zone or
+    across restarts. Every entry carries an idempotency key: enqueueing the same
+    key twice is a no-op, and the key is the Firestore document id, so a write
+    retried after a lost acknowledgement overwrites instead of duplicating.
+
+    Entries are sent highest priority first. An entry's priority is the
+    caller's importance score (e.g. detection confidence) plus its enqueue time
+    divided by `recency_scale_s`, so between equally important entries the
+    newest goes first, and an entry `recency_scale_s` seconds newer outranks
+    one scoring 1.0 higher. CloudSyncWorker drains the outbox.
+    """
+    def __init__(self, db_path, recency_scale_s=3600.0):
+        self.db_path = db_path
+        self.recency_scale_s = recency_scale_s
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+
+    def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for index, statements in enumerate(OUTBOX_MIGRATIONS[version:], start=version + 1):
+            self.conn.execute("BEGIN")
+            for statement in statements:
+                self.conn.execute(statement)
+            self.conn.execute(f"PRAGMA user_version = {index}")
+            self.conn.execute("COMMIT")
+
+    def enqueue_document(self, collection_name, data, idempotency_key=None, priority=0.0):
+        """
+        Queues `data` (JSON-serialisable; datetimes are stored as ISO strings) for `collection_name`.
+        Returns False if an entry with this idempotency key already exists.
+        """
+        return self._insert(idempotency_key or uuid.uuid4().hex, 'document', priority, collection=collection_name,
+                            payload=json.dumps(data, default=str))
+
+    def enqueue_file(self, file_path, destination_blob_name, content_type=None, idempotency_key=None,
+                     priority=0.0, transform=None):
+        """
+        Queues `file_path` for upload to `destination_blob_name`. The file may
+        still be in flight to disk (e.g. in FrameWriter); missing files are retried.
+        :param transform: Optional UploadTransform.spec() dict; the worker uploads that rendering instead of the file.
+        """
+        return self._insert(idempotency_key or f"file:{destination_blob_name}", 'file', priority,
+                            file_path=file_path, destination=destination_blob_name, content_type=content_type,
+                            transform=json.dumps(transform) if transform else None)
+
+    def _insert(self, idempotency_key, kind, priority, **fields):
+        now = time.time()
+        columns = ['idempotency_key', 'kind', 'created_at', 'priority'] + list(fields)
+        values = [idempotency_key, kind, now, priority + now / self.recency_scale_s] + list(fields.values())
+        with self._lock:
+            cursor = self.conn.execute(
+                f"INSERT OR IGNORE INTO outbox ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                values)
+        return cursor.rowcount == 1
+
+    def due(self, kind, limit, exclude=()):
+        """Returns up to `limit` pending entries of `kind` whose retry time has come, highest priority first."""
+        exclude = list(exclude)
+        query = (f"SELECT {', '.join(OUTBOX_COLUMNS)} FROM outbox "
+                 f"WHERE state = 'pending' AND kind = ? AND next_attempt_at <= ?")
+        if exclude:
+            query += f" AND id NOT IN ({', '.join('?' for _ in exclude)})"
+        query += " ORDER BY priority DESC LIMIT ?"
+        with self._lock:
+            rows = self.conn.execute(query, [kind, time.time()] + exclude + [limit]).fetchall()
+        return [dict(zip(OUTBOX_COLUMNS, row)) for row in rows]
+
+    def mark_synced(self, ids):
+        self._update_many("UPDATE outbox SET state = 'synced', synced_at = ?, last_error = NULL WHERE id = ?",
+                          [(time.time(), entry_id) for entry_id in ids])
+
+    def retry_later(self, entries, error, delays, max_attempts=None):
+        """Records a failed attempt; entries past `max_attempts` are parked as 'failed' instead of retried."""
+        now = time.time()
+        rows = []
+        for entry, delay in zip(entries, delays):
+            attempts = entry['attempts'] + 1
+            state = 'failed' if max_attempts and attempts >= max_attempts else 'pending'
+            rows.append((attempts, now + delay, str(error)[:500], state, entry['id']))
+        self._update_many("UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ?, state = ? "
+                          "WHERE id = ?", rows)
+
+    def save_upload_progress(self, entry_id, upload_url, uploaded_bytes):
+        self._update_many("UPDATE outbox SET upload_url = ?, uploaded_bytes = ? WHERE id = ?",
+                          [(upload_url, uploaded_bytes, entry_id)])
+
+    def pending_files(self, directory):
+        """Source paths under `directory` that still have an unsynced upload (pending or parked as failed)."""
+        prefix = os.path.join(os.path.abspath(directory), '')
+        with self._lock:
+            rows = self.conn.execute("SELECT file_path FROM outbox WHERE kind = 'file' AND state != 'synced' "
+                                     "AND substr(file_path, 1, ?) = ?", (len(prefix), prefix)).fetchall()
+        return {row[0] for row in rows}
+
+    def purge_synced(self, older_than_s):
+        """Deletes synced entries older than `older_than_s` seconds. Returns the number deleted."""
+        with self._lock:
+            cursor = self.conn.execute("DELETE FROM outbox WHERE state = 'synced' AND synced_at < ?",
+                                       (time.time() - older_than_s,))
+        return cursor.rowcount
+
+    def depth(self):
+        """Queue depth: pending entries per kind, parked failures and the age of the oldest pending entry."""
+        with self._lock:
+            counts = self.conn.execute(
+                "SELECT state, kind, COUNT(*) FROM outbox WHERE state != 'synced' GROUP BY state, kind").fetchall()
+            oldest = self.conn.execute("SELECT MIN(created_at) FROM outbox WHERE state = 'pending'").fetchone()[0]
+        depth = {"documents": 0, "files": 0, "failed": 0}
+        for state, kind, count in counts:
+            if state == 'failed':
+                depth["failed"] += count
+            else:
+                depth["documents" if kind == 'document' else "files"] += count
+        depth["oldest_pending_age_s"] = round(time.time() - oldest, 1) if oldest else 0.0
+        return depth
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _update_many(self, sql, rows):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(sql, rows)
+            self.conn.execute("COMMIT")
+
+
+class CloudSyncWorker:
+    """
+    Background thread draining a CloudOutbox into Firebase.
+
+    - Documents go out as Firestore batched writes of up to `batch_size`
+      (Firestore's limit is 500), keyed by their idempotency key.
+    - Files are uploaded by a pool of `upload_workers` threads using resumable
+      upload sessions. The session URL and committed byte count are saved in
+      the outbox, so an interrupted upload continues where it stopped, even
+      after a restart.
+    - A failed entry is retried after exponential backoff with jitter, capped
+      at `max_backoff_s`; other entries keep flowing meanwhile.
+    - File entries queued with a transform spec are rendered by `transform`
+      (an UploadTransform) into the session's upload/ folder before their
+      first attempt, so every retry resumes the same bytes. The rendering is
+      deleted once uploaded.
+
+    `cloud` is anything with CloudStorage's `commit_documents()`,
+    `start_resumable_upload()` and `upload_chunks()`, so a local fake can stand
+    in for Firebase (see benchmarks/bench_cloud_sync.py).
+    """
+    def __init__(self, outbox, cloud, batch_size=500, upload_workers=4, chunk_size=2 * 1024 * 1024,
+                 base_backoff_s=1.0, max_backoff_s=300.0, max_attempts=None, poll_interval_s=1.0,
+                 retain_synced_s=86400.0, transform=None):
+        """
+        :param batch_size: Documents per Firestore batched write.
+        :param upload_workers: Concurrent file uploads.
+        :param chunk_size: Bytes per resumable upload request (a multiple of 256 KiB).
+        :param base_backoff_s: Delay before the first retry; doubled on every further failure.
+        :param max_backoff_s: Upper bound of the retry delay.
+        :param max_attempts: Attempts before an entry is parked as 'failed' (None retries forever).
+        :param poll_interval_s: Sleep between outbox scans when there is nothing to send.
+        :param retain_synced_s: Synced entries are kept this long so re-enqueued idempotency keys stay no-ops.
+        :param transform: Optional UploadTransform applied to file entries that carry a transform spec.
+        """
+        self.outbox = outbox
+        self.cloud = cloud
+        self.batch_size = batch_size
+        self.upload_workers = upload_workers
+        self.chunk_size = chunk_size
+        self.base_backoff_s = base_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.max_attempts = max_attempts
+        self.poll_interval_s = poll_interval_s
+        self.retain_synced_s = retain_synced_s
+        self.transform = transform
+
+        self._uploads = {} # outbox id -> future
+        self._pool = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+
+        self.documents_synced = 0
+        self.files_synced = 0
+        self.bytes_uploaded = 0
+        self.failures = 0
+        self._started = None
+
+    def start(self):
+        self._started = time.monotonic()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.upload_workers,
+                                                           thread_name_prefix='cloud-upload')
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Stops scanning and waits for running uploads; unfinished work stays in the outbox."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._reap_uploads()
+
+    def stats(self):
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            "documents_synced": self.documents_synced,
+            "files_synced": self.files_synced,
+            "bytes_uploaded": self.bytes_uploaded,
+            "failures": self.failures,
+            "uploads_in_flight": len(self._uploads),
+            "documents_per_s": round(self.documents_synced / elapsed, 2) if elapsed else 0.0,
+            "upload_bytes_per_s": round(self.bytes_uploaded / elapsed) if elapsed else 0,
+            "queue": self.outbox.depth(),
+            "transform": self.transform.stats() if self.transform else None,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                busy = self._sync_documents()
+                busy = self._schedule_uploads() or busy
+                if time.monotonic() - self._last_purge > 3600:
+                    self.outbox.purge_synced(self.retain_synced_s)
+                    self._last_purge = time.monotonic()
+            except Exception as e:
+                print(f"CloudSyncWorker: Error scanning outbox: {e}")
+                busy = False
+            if not busy:
+                self._stop.wait(self.poll_interval_s)
+
+    def _backoff(self, entries):
+        return [min(self.max_backoff_s, self.base_backoff_s * 2 ** entry['attempts']) * random.uniform(0.5, 1.0)
+                for entry in entries]
+
+    def _sync_documents(self):
+        """Sends one Firestore batch. Returns True if a full batch went out (more may be waiting)."""
+        entries = self.outbox.due('document', self.batch_size)
+        if not entries:
+            return False
+        documents = [(e['collection'], e['idempotency_key'], json.loads(e['payload'])) for e in entries]
+        try:
+            self.cloud.commit_documents(documents)
+        except Exception as e:
+            self.failures += 1
+            self.outbox.retry_later(entries, e, self._backoff(entries), self.max_attempts)
+            print(f"CloudSyncWorker: Batch of {len(entries)} documents failed, will retry: {e}")
+            return False
+        self.outbox.mark_synced([e['id'] for e in entries])
+        self.documents_synced += len(entries)
+        return len(entries) == self.batch_size
+
+    def _schedule_uploads(self):
+        """Tops the upload pool up with due files. Returns True if any upload finished or started."""
+        progressed = self._reap_uploads()
+        free = self.upload_workers - len(self._uploads)
+        if free <= 0:
+            return progressed
+        for entry in self.outbox.due('file', free, exclude=self._uploads):
+            self._uploads[entry['id']] = (entry, self._pool.submit(self._upload, entry))
+            progressed = True
+        return progressed
+
+    def _reap_uploads(self):
+        finished = [entry_id for entry_id, (_, future) in self._uploads.items() if future.done()]
+        for entry_id in finished:
+            entry, future = self._uploads.pop(entry_id)
+            try:
+                self.bytes_uploaded += future.result()
+            except Exception as e:
+                self.failures += 1
+                self.outbox.retry_later([entry], e, self._backoff([entry]), self.max_attempts)
+                continue
+            self.outbox.mark_synced([entry_id])
+            self.files_synced += 1
+        return bool(finished)
+
+    def _upload(self, entry):
+        """Runs on the upload pool; returns the bytes sent by this attempt."""
+        file_path = entry['file_path']
+        if entry['transform'] and self.transform:
+            file_path = self._render(entry)
+        size = os.path.getsize(file_path) # FileNotFoundError until FrameWriter has written it
+        upload_url = entry['upload_url']
+        if upload_url is None:
+            upload_url = self.cloud.start_resumable_upload(entry['destination'], size, entry['content_type'])
+            self.outbox.save_upload_progress(entry['id'], upload_url, 0)
+        sent_from = entry['uploaded_bytes']
+
+        def on_progress(uploaded_bytes):
+            self.outbox.save_upload_progress(entry['id'], upload_url, uploaded_bytes)
+
+        try:
+            self.cloud.upload_chunks(upload_url, file_path, self.chunk_size, on_progress)
+        except ResumableUploadExpired:
+            # Start a fresh session on the next attempt
+            self.outbox.save_upload_progress(entry['id'], None, 0)
+            raise
+        if file_path != entry['file_path']:
+            os.remove(file_path)
+        return size - sent_from
+
+    def _render(self, entry):
+        """Writes the entry's transformed image to the session's upload/ folder once and returns its path."""
+        spec = json.loads(entry['transform'])
+        source = entry['file_path']
+        stem = os.path.splitext(os.path.basename(source))[0]
+        rendered_path = os.path.join(os.path.dirname(source), 'upload',
+                                     f"{stem}_{spec['variant']}{self.transform.extension}")
+        if os.path.exists(rendered_path):
+            return rendered_path
+        frame = cv2.imread(source, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise FileNotFoundError(f"Source image not readable yet: {source}")
+        data = self.transform.render(frame, spec, source_bytes=os.path.getsize(source))
+        os.makedirs(os.path.dirname(rendered_path), exist_ok=True)
+        # Write-then-rename so a crash never leaves a truncated rendering to resume from
+        tmp_path = rendered_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, rendered_path)
+        return rendered_path
@@ -17,8 +17,10 @@ FIRESTORE_COLLECTION = os.getenv('FIRESTORE_COLLECTION')
 
 
 # --- ML Model Configuration ---
-# Path to the original trained road defect YOLOv8 model weights
-MODEL_PATH = os.path.join(PROJECT_ROOT, 'ml-model', 'yolov8n.pt')
+# Path to the original trained road defect YOLOv8 model weights.
+# Can point at an exported .onnx / .torchscript / OpenVINO model, e.g. the INT8
+# model produced by ml-model/quantize.py.
+MODEL_PATH = os.getenv('MODEL_PATH', os.path.join(PROJECT_ROOT, 'ml-model', 'yolov8n.pt'))
 
 
 # --- Data Storage Configuration ---
@@ -26,6 +28,110 @@ MODEL_PATH = os.path.join(PROJECT_ROOT, 'ml-model', 'yolov8n.pt')
 LOCAL_DATA_DIR = os.path.join(BASE_DIR, 'data')
 # Data retention policy (in days)
 DATA_RETENTION_DAYS = int(os.getenv('DATA_RETENTION_DAYS', 30))
+# Disk quota for all recorded sessions (bytes): pruning starts above it and stops at the low watermark fraction
+DATA_QUOTA_BYTES = int(os.getenv('DATA_QUOTA_BYTES', 20 * 1024 ** 3))
+DATA_QUOTA_LOW_WATERMARK = 0.8
+# Pruning also starts when free disk space drops below this (bytes)
+DATA_MIN_FREE_BYTES = 1024 ** 3
+# Images of detections at or above this confidence are kept past retention and quota
+RETENTION_KEEP_CONFIDENCE = 0.8
+# Files / rows deleted per batch, and the pause between batches (seconds), to keep I/O spikes off live detection
+RETENTION_BATCH_SIZE = 200
+RETENTION_BATCH_PAUSE_SECONDS = 0.05
+# Seconds between incremental retention passes
+RETENTION_INTERVAL_SECONDS = 600
+# Detections closer than this (meters) are merged into the same pothole cluster
+POTHOLE_CLUSTER_RADIUS_M = 8.0
+# Background frame writer: pending frames before new ones are rejected
+FRAME_WRITER_QUEUE_SIZE = 64
+# Background frame writer: seconds between fsyncs of session files
+FRAME_WRITER_FSYNC_INTERVAL = 5.0
+
+# --- Live Updates Configuration ---
+# Undelivered events kept per push client (SSE/WebSocket) before it is resynchronised with a snapshot
+LIVE_EVENTS_MAX_PENDING = 256
+# Seconds between keepalive messages on idle push connections
+LIVE_EVENTS_KEEPALIVE_SECONDS = 15
+
+# --- Video Streaming Configuration ---
+# MJPEG quality tiers: name -> (max frame height in pixels, None for native size; JPEG quality)
+STREAM_TIERS = {
+    'full': (None, 95),
+    '1080p': (1080, 85),
+    '480p': (480, 75),
+    'thumb': (180, 60),
+}
+# Tier used when a client does not pass ?tier=
+STREAM_DEFAULT_TIER = 'full'
+# Upper bound (and default) for the per-client ?fps= cap
+STREAM_MAX_FPS = 30
+
+# --- Backend (FastAPI) Concurrency Configuration ---
+# Threads running DetectionEngine.detect(); further inference calls wait in line
+INFERENCE_WORKERS = 1
+# Threads JPEG-encoding /video_feed frames (one per tier in use is enough)
+STREAM_ENCODE_WORKERS = 4
+
+# --- Inference Gating Configuration ---
+# Road region sent to the detector, as fractions of the frame: (x_min, y_min, x_max, y_max)
+INFERENCE_ROI = (0.0, 0.35, 1.0, 0.9)
+# Mean grey-level change (0-255) inside the ROI below which a frame is treated as unchanged
+INFERENCE_MOTION_THRESHOLD = 2.0
+# Inference runs at least this often (seconds), even on unchanged frames
+INFERENCE_MAX_SKIP_SECONDS = 2.0
+# Below this speed (km/h) the vehicle counts as stationary...
+INFERENCE_STATIONARY_SPEED_KMH = 3.0
+# ...and inference runs at most once per this many seconds
+INFERENCE_STATIONARY_INTERVAL_SECONDS = 1.0
+
+# --- Pothole Tracking Configuration ---
+# Minimum IoU between a track's predicted box and a detection to associate them
+TRACKER_IOU_THRESHOLD = 0.3
+# Matched detections needed before a track is confirmed and its pothole persisted
+TRACKER_MIN_HITS = 3
+# Frames a track survives without a matching detection
+TRACKER_MAX_AGE = 10
+# Detections at or above this confidence are matched first and can start new tracks
+TRACKER_HIGH_THRESHOLD = 0.4
+
+# --- Sensor Fusion Configuration ---
+# Samples kept in each sensor's ring buffer (g-force, detections, GPS)
+FUSION_BUFFER_SIZE = 600
+# An impact is linked to the latest vision detection at most this many seconds before it
+FUSION_DETECTION_WINDOW_SECONDS = 3.0
+# ...and to the GPS fix nearest in time, if within this many seconds
+FUSION_GPS_MAX_GAP_SECONDS = 2.0
+# Fused impacts kept in memory for the dashboard
+IMPACT_HISTORY_LENGTH = 50
+
+# --- Cloud Sync Configuration ---
+# Durable local outbox of Firestore documents and Storage uploads waiting to be synced
+CLOUD_OUTBOX_PATH = os.path.join(LOCAL_DATA_DIR, 'outbox.db')
+# Documents per Firestore batched write (Firestore allows at most 500)
+CLOUD_SYNC_BATCH_SIZE = 500
+# Concurrent resumable file uploads
+CLOUD_SYNC_UPLOAD_WORKERS = 4
+# Bytes per resumable upload request (a multiple of 256 KiB)
+CLOUD_SYNC_CHUNK_SIZE = 2 * 1024 * 1024
+# Retry delay after a failed sync starts here and doubles up to the maximum (seconds)
+CLOUD_SYNC_BASE_BACKOFF_SECONDS = 1.0
+CLOUD_SYNC_MAX_BACKOFF_SECONDS = 300.0
+# Upload order: detection confidence plus enqueue time / this scale, so an entry this many seconds
+# newer outranks one 1.0 more confident
+CLOUD_SYNC_RECENCY_SCALE_SECONDS = 3600.0
+
+# --- Upload Transform Configuration ---
+# Format of uploaded defect images: 'jpg' or 'webp' (the local recording stays full-resolution JPEG)
+UPLOAD_IMAGE_FORMAT = os.getenv('UPLOAD_IMAGE_FORMAT', 'webp')
+# Encoder quality (1-100) of the uploaded crop
+UPLOAD_QUALITY = 80
+# Context kept around the detection boxes, as a fraction of their size
+UPLOAD_CROP_MARGIN = 0.25
+# Whole-frame thumbnail height (pixels) and quality
+UPLOAD_THUMB_HEIGHT = 160
+UPLOAD_THUMB_QUALITY = 60
+# Added to thumbnails' upload priority so every thumbnail goes out before the crops
+UPLOAD_THUMB_PRIORITY_BOOST = 1.0
 
 # --- Kivy UI Configuration ---
 # Update frequency for the UI (in Hz)
@@ -33,6 +139,26 @@ UI_UPDATE_HZ = 30
 # Frequency for saving data (in Hz)
 DATA_SAVE_HZ = 1
 
+# --- Recording Policy Configuration ---
+# Which offered frames are persisted: 'all', 'detections', 'preroll' or 'distance'
+RECORDING_MODE = os.getenv('RECORDING_MODE', 'preroll')
+# Seconds of frames kept in memory before / saved after a detection ('preroll' mode)
+RECORDING_PRE_ROLL_SECONDS = 5
+RECORDING_POST_ROLL_SECONDS = 5
+# Minimum GPS displacement between saved frames ('distance' mode)
+RECORDING_MIN_DISTANCE_M = 10.0
+# Skip frames that are perceptually identical to the last saved one
+RECORDING_DEDUP = True
+# Maximum dHash Hamming distance (out of 64 bits) treated as a duplicate
+RECORDING_DEDUP_MAX_DISTANCE = 5
+
+# --- Session Storage Configuration ---
+# How recorded frames are stored: 'container' (segment files with frames, GPS and detections, see
+# session_container.py) or 'files' (one frame_<timestamp>.jpg per frame plus metadata.csv)
+RECORDING_FORMAT = os.getenv('RECORDING_FORMAT', 'container')
+# Size at which a session segment file is closed and the next one started
+SESSION_SEGMENT_BYTES = 64 * 1024 * 1024
+
 # --- GPS Simulator Configuration ---
 # Starting latitude for the simulator
 START_LAT = 12.9716
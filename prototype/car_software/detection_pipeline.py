@@ -0,0 +1,124 @@
+import collections
+import threading
+import time
+
+# Output of the inference worker. `frame` is the untouched capture and
+# `annotated_frame` has the boxes drawn on it; `timestamp` and `location` are the
+# wall-clock time and GPS fix taken when the frame was captured, not when inference finished.
+DetectionResult = collections.namedtuple(
+    'DetectionResult', ['seq', 'timestamp', 'frame', 'annotated_frame', 'detections', 'location']
+)
+
+
+class LatestSlot:
+    """
+    A single-item mailbox. Putting a new item replaces any item that has not
+    been taken yet, so the consumer always works on the freshest data.
+    """
+    def __init__(self):
+        self._item = None
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        """Returns the pending item (or None on timeout) and empties the slot."""
+        with self._cond:
+            if self._item is None:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+
+class DetectionPipeline:
+    """
+    Capture -> inference -> display pipeline for the in-car UI.
+
+    A capture thread reads camera frames (and the matching GPS fix) into a
+    LatestSlot, an inference worker always takes the newest frame and drops the
+    stale ones, and the UI only reads `latest_result()`. The UI tick therefore
+    never waits on the camera or on YOLO, and detection runs at whatever rate
+    the CPU can sustain.
+    """
+    def __init__(self, capture, detection_engine, gps=None):
+        """
+        :param capture: An opened cv2.VideoCapture.
+        :param detection_engine: The DetectionEngine used by the inference worker.
+        :param gps: Optional GPS source with a get_location() method.
+        """
+        self.capture = capture
+        self.detection_engine = detection_engine
+        self.gps = gps
+
+        self._frames = LatestSlot()
+        self._result = None
+        self._result_lock = threading.Lock()
+        self._running = False
+        self._threads = []
+
+        self.captured = 0
+        self.processed = 0
+        self._started_at = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._started_at = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, daemon=True),
+            threading.Thread(target=self._inference_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+
+    def latest_result(self):
+        """Returns the newest DetectionResult, or None before the first inference."""
+        with self._result_lock:
+            return self._result
+
+    def stats(self):
+        """Frame counters for the pipeline; `dropped` frames were never sent to the model."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            "captured": self.captured,
+            "processed": self.processed,
+            "dropped": self._frames.dropped,
+            "inference_fps": round(self.processed / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def _capture_loop(self):
+        while self._running:
+            ret, frame = self.capture.read()
+            if not ret:
+                time.sleep(0.1)
+                continue
+            captured_at = time.time()
+            location = self.gps.get_location() if self.gps else None
+            self.captured += 1
+            self._frames.put((frame, captured_at, location))
+
+    def _inference_loop(self):
+        while self._running:
+            item = self._frames.take(timeout=0.5)
+            if item is None:
+                continue
+            frame, captured_at, location = item
+            # detect() draws on the frame it is given, keep the original clean for saving
+            detections, annotated_frame = self.detection_engine.detect(frame.copy())
+            self.processed += 1
+            with self._result_lock:
+                self._result = DetectionResult(self.processed, captured_at, frame, annotated_frame,
+                                               detections, location)
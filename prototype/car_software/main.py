@@ -16,11 +16,17 @@ from kivy.graphics import Color, Rectangle
 import cv2
 from gps_module import GPSSimulator
 from cloud_storage import CloudStorage
+from cloud_sync import CloudOutbox, CloudSyncWorker
+from upload_transform import UploadTransform
+from detection_pipeline import DetectionPipeline
 import os
 import datetime
-import csv
 import threading
 from detection import DetectionEngine
+from inference_gate import InferenceGate
+from frame_writer import FrameWriter
+from recording_policy import RecordingPolicy
+from session_container import SessionWriter, frame_name
 
 import config
 
@@ -60,6 +66,10 @@ class SentinelApp(App):
         self.gps_label = Label(text="GPS: N/A", size_hint=(1, 0.1), pos_hint={'bottom': 1})
         video_layout.add_widget(self.gps_label)
 
+        # Pipeline counters (processed / dropped frames)
+        self.stats_label = Label(text="Detection: starting...", size_hint=(1, 0.05))
+        video_layout.add_widget(self.stats_label)
+
         root_layout.add_widget(video_layout)
 
         # Alert area
@@ -71,6 +81,19 @@ class SentinelApp(App):
         self.capture = cv2.VideoCapture(0)
         self.gps = GPSSimulator(start_lat=config.START_LAT, start_lon=config.START_LON)
         self.detection_engine = DetectionEngine(model_path=config.MODEL_PATH)
+        # ROI crop + motion/speed gating so unchanged or stationary frames skip YOLO
+        self.inference_gate = InferenceGate(self.detection_engine,
+                                            roi=config.INFERENCE_ROI,
+                                            motion_threshold=config.INFERENCE_MOTION_THRESHOLD,
+                                            max_skip_s=config.INFERENCE_MAX_SKIP_SECONDS,
+                                            speed_source=lambda: self.gps.speed_mps * 3.6,
+                                            stationary_speed_kmh=config.INFERENCE_STATIONARY_SPEED_KMH,
+                                            stationary_interval_s=config.INFERENCE_STATIONARY_INTERVAL_SECONDS)
+
+        # Capture and inference run on their own threads; update() only displays results
+        self.pipeline = DetectionPipeline(self.capture, self.inference_gate, gps=self.gps)
+        self.last_displayed_seq = 0
+        self.pipeline.start()
 
         # Initialize data storage
         self.setup_storage()
@@ -86,28 +109,116 @@ class SentinelApp(App):
         self.data_dir = os.path.join(config.LOCAL_DATA_DIR, self.session_timestamp)
         os.makedirs(self.data_dir, exist_ok=True)
 
-        self.metadata_file_path = os.path.join(self.data_dir, 'metadata.csv')
-        self.metadata_file = open(self.metadata_file_path, 'w', newline='')
-        self.metadata_writer = csv.writer(self.metadata_file)
-        self.metadata_writer.writerow(['filename', 'timestamp', 'latitude', 'longitude', 'detections'])
+        # Frames and metadata rows are encoded/written on a background thread
+        self.frame_writer = FrameWriter(max_queue=config.FRAME_WRITER_QUEUE_SIZE,
+                                        fsync_interval=config.FRAME_WRITER_FSYNC_INTERVAL)
+        self.session_container = None
+        if config.RECORDING_FORMAT == 'container':
+            # Frames, GPS and detections are appended to rolling segment files instead of one file per frame
+            self.session_container = SessionWriter(self.data_dir, segment_bytes=config.SESSION_SEGMENT_BYTES,
+                                                   fsync_interval=config.FRAME_WRITER_FSYNC_INTERVAL)
+        else:
+            self.metadata_file_path = os.path.join(self.data_dir, 'metadata.csv')
+            self.frame_writer.register_csv(self.metadata_file_path,
+                                           ['filename', 'timestamp', 'latitude', 'longitude', 'detections'])
+        # Decides which frames are worth persisting (detections, pre/post-roll, distance, dedup)
+        self.recording_policy = RecordingPolicy(
+            mode=config.RECORDING_MODE,
+            pre_roll_seconds=config.RECORDING_PRE_ROLL_SECONDS,
+            post_roll_seconds=config.RECORDING_POST_ROLL_SECONDS,
+            min_distance_m=config.RECORDING_MIN_DISTANCE_M,
+            dedup=config.RECORDING_DEDUP,
+            dedup_max_distance=config.RECORDING_DEDUP_MAX_DISTANCE
+        )
+        # Defect records go to a local outbox first and are synced to Firebase in the background
+        self.outbox = CloudOutbox(config.CLOUD_OUTBOX_PATH, recency_scale_s=config.CLOUD_SYNC_RECENCY_SCALE_SECONDS)
+        # Only a crop around the defects and a thumbnail are uploaded, not the full frame
+        self.upload_transform = UploadTransform(image_format=config.UPLOAD_IMAGE_FORMAT,
+                                                quality=config.UPLOAD_QUALITY,
+                                                crop_margin=config.UPLOAD_CROP_MARGIN,
+                                                thumb_height=config.UPLOAD_THUMB_HEIGHT,
+                                                thumb_quality=config.UPLOAD_THUMB_QUALITY)
+        self.cloud_sync = None
+        try:
+            cloud = CloudStorage(credentials_path=config.CREDENTIALS_FILE, project_id=config.PROJECT_ID)
+            self.cloud_sync = CloudSyncWorker(self.outbox, cloud,
+                                              batch_size=config.CLOUD_SYNC_BATCH_SIZE,
+                                              upload_workers=config.CLOUD_SYNC_UPLOAD_WORKERS,
+                                              chunk_size=config.CLOUD_SYNC_CHUNK_SIZE,
+                                              base_backoff_s=config.CLOUD_SYNC_BASE_BACKOFF_SECONDS,
+                                              max_backoff_s=config.CLOUD_SYNC_MAX_BACKOFF_SECONDS,
+                                              transform=self.upload_transform).start()
+        except Exception as e:
+            print(f"⚠️ Cloud sync disabled, records stay in the local outbox: {e}")
 
         self.current_frame = None
+        self.current_frame_time = None
         self.current_location = None
         self.current_detections = []
+        self.outbox_depth = 0
 
     def save_data(self, dt):
+        # Refreshed at the save rate rather than on every UI frame
+        depth = self.outbox.depth()
+        self.outbox_depth = depth['documents'] + depth['files']
         if self.current_frame is not None and self.current_location is not None:
-            timestamp = self.current_location['timestamp']
-            lat = self.current_location['latitude']
-            lon = self.current_location['longitude']
-
-            # Save frame locally
-            image_filename = f"frame_{timestamp}.jpg"
-            image_path = os.path.join(self.data_dir, image_filename)
-            cv2.imwrite(image_path, self.current_frame)
-
-            # Save metadata locally
-            self.metadata_writer.writerow([image_filename, timestamp, lat, lon, str(self.current_detections)])
+            to_save = self.recording_policy.offer(self.current_frame_time, self.current_frame,
+                                                  self.current_location, self.current_detections)
+            for recorded in to_save:
+                timestamp = recorded.location['timestamp']
+                lat = recorded.location['latitude']
+                lon = recorded.location['longitude']
+
+                if self.session_container is not None:
+                    # Capture time keeps sub-second resolution, so records and defect files never collide.
+                    # Defect frames are also written standalone: they are the source of the upload variants.
+                    image_filename = f"{frame_name(recorded.timestamp)}.jpg"
+                    image_path = os.path.join(self.data_dir, image_filename)
+                    queued = self.frame_writer.submit_record(self.session_container, recorded.timestamp,
+                                                             recorded.frame, lat, lon, recorded.detections,
+                                                             image_path=image_path if recorded.detections else None)
+                else:
+                    # Queue frame and metadata row for the background writer
+                    image_filename = f"frame_{timestamp}.jpg"
+                    image_path = os.path.join(self.data_dir, image_filename)
+                    queued = self.frame_writer.submit(image_path, recorded.frame, self.metadata_file_path,
+                                                      [image_filename, timestamp, lat, lon, str(recorded.detections)])
+                if not queued:
+                    print(f"⚠️ Storage backpressure, frame dropped: {image_filename}")
+                    continue
+                if recorded.detections:
+                    self.queue_cloud_sync(image_filename, image_path, recorded)
+
+    def queue_cloud_sync(self, image_filename, image_path, recorded):
+        """
+        Queues a defect frame's thumbnail, crop and record in the outbox, most
+        confident first; never touches the network.
+        """
+        stem = os.path.splitext(image_filename)[0]
+        confidence = max(d['confidence'] for d in recorded.detections)
+        blobs, specs = {}, {}
+        for variant, boost in (('thumb', config.UPLOAD_THUMB_PRIORITY_BOOST), ('crop', 0.0)):
+            specs[variant] = self.upload_transform.spec(variant, recorded.frame.shape, recorded.detections)
+            blobs[variant] = f"{self.session_timestamp}/{stem}_{variant}{self.upload_transform.extension}"
+            self.outbox.enqueue_file(image_path, blobs[variant], content_type=self.upload_transform.content_type,
+                                     priority=confidence + boost, transform=specs[variant])
+        self.outbox.enqueue_document(config.FIRESTORE_COLLECTION, {
+            'latitude': recorded.location['latitude'],
+            'longitude': recorded.location['longitude'],
+            'timestamp': recorded.location['timestamp'],
+            'session_timestamp': self.session_timestamp,
+            'image': blobs['crop'],
+            'thumbnail': blobs['thumb'],
+            # Offset of the crop in the frame, to map detection boxes onto the uploaded image
+            'crop_box': specs['crop']['box'],
+            'detections': recorded.detections,
+        }, idempotency_key=f"{self.session_timestamp}_{stem}", priority=confidence) # Firestore ids cannot contain '/'
+
+    def recording_stats(self):
+        """Per-session recording policy stats, including an estimate of the bytes not written."""
+        writer_stats = self.frame_writer.stats()
+        avg_frame_bytes = writer_stats['bytes_written'] / writer_stats['written'] if writer_stats['written'] else 0
+        return self.recording_policy.stats(avg_frame_bytes=avg_frame_bytes)
 
 
     def show_alert(self, message):
@@ -121,37 +232,56 @@ class SentinelApp(App):
 
 
     def update(self, dt):
-        # Read frame from camera
-        ret, frame = self.capture.read()
-
-        if ret:
-            self.current_frame = frame
-            # Get GPS location
-            self.current_location = self.gps.get_location()
+        # Only blit the newest annotated frame; capture and inference run in DetectionPipeline
+        result = self.pipeline.latest_result()
+        if result is None or result.seq == self.last_displayed_seq:
+            return
+        self.last_displayed_seq = result.seq
+
+        self.current_frame = result.frame
+        self.current_frame_time = result.timestamp
+        self.current_location = result.location
+        self.current_detections = result.detections
+        if self.current_location:
             self.gps_label.text = f"GPS: {self.current_location['latitude']:.4f}, {self.current_location['longitude']:.4f}"
 
-            # Perform ML inference
-            self.current_detections, frame_with_boxes = self.detection_engine.detect(frame)
-
-            if self.current_detections:
-                alert_message = ", ".join([f"{d['class']} ({d['confidence']:.2f})" for d in self.current_detections])
-                self.show_alert(f"Defect Detected: {alert_message}")
-            else:
-                self.hide_alert(None) # Hide alert if no defects
-
-            # Convert it to texture for display
-            buf1 = cv2.flip(frame_with_boxes, 0)
-            buf = buf1.tobytes()
-            image_texture = Texture.create(
-                size=(frame_with_boxes.shape[1], frame_with_boxes.shape[0]), colorfmt='bgr')
-            image_texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
-            # Display image from the texture
-            self.video_display.texture = image_texture
+        stats = self.pipeline.stats()
+        gate_stats = self.inference_gate.stats()
+        self.stats_label.text = (f"Detection: {stats['inference_fps']} fps | "
+                                 f"processed {stats['processed']} | dropped {stats['dropped']} | "
+                                 f"skipped {gate_stats['skipped']} | "
+                                 f"outbox {self.outbox_depth}")
+
+        if self.current_detections:
+            alert_message = ", ".join([f"{d['class']} ({d['confidence']:.2f})" for d in self.current_detections])
+            self.show_alert(f"Defect Detected: {alert_message}")
+        else:
+            self.hide_alert(None) # Hide alert if no defects
+
+        # Convert it to texture for display
+        frame_with_boxes = result.annotated_frame
+        buf1 = cv2.flip(frame_with_boxes, 0)
+        buf = buf1.tobytes()
+        image_texture = Texture.create(
+            size=(frame_with_boxes.shape[1], frame_with_boxes.shape[0]), colorfmt='bgr')
+        image_texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
+        # Display image from the texture
+        self.video_display.texture = image_texture
 
     def on_stop(self):
-        # Release the camera and close the metadata file
+        # Stop the worker threads, release the camera and flush the metadata file
+        self.pipeline.stop()
         self.capture.release()
-        self.metadata_file.close()
+        self.recording_policy.flush()
+        self.frame_writer.close()
+        if self.session_container is not None:
+            # Writes the index footer of the open segment
+            self.session_container.close()
+        if self.cloud_sync:
+            self.cloud_sync.stop()
+            print(f"Cloud sync stats: {self.cloud_sync.stats()}")
+        self.outbox.close()
+        print(f"Recording stats: {self.recording_stats()}")
 
 if __name__ == '__main__':
     SentinelApp().run()
@@ -0,0 +1,126 @@
+import threading
+
+import cv2
+
+IMAGE_FORMATS = {
+    # format -> (file extension, content type, OpenCV quality flag)
+    'jpg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+VARIANTS = ('crop', 'thumb')
+
+
+class UploadTransform:
+    """
+    Shrinks defect imagery before it goes over the cellular link.
+
+    The locally recorded frame stays full resolution. What is uploaded is
+    - 'crop': the union of the detection boxes plus `crop_margin` of context,
+      re-encoded at `quality` as JPEG or WebP, and
+    - 'thumb': the whole frame scaled to `thumb_height`, for quick triage.
+
+    CloudSyncWorker renders a variant from the recorded JPEG right before the
+    first upload attempt. Bytes in and out are counted per variant, so
+    `stats()` gives bytes per defect for tuning quality, margin and format.
+    """
+    def __init__(self, image_format='jpg', quality=80, crop_margin=0.25, min_crop_size=96, thumb_height=160,
+                 thumb_quality=60):
+        """
+        :param image_format: 'jpg' or 'webp'.
+        :param quality: Encoder quality (1-100) of the crop.
+        :param crop_margin: Context added around the detection boxes, as a fraction of their union's width/height.
+        :param min_crop_size: Crops are grown to at least this many pixels per side.
+        :param thumb_height: Height in pixels of the whole-frame thumbnail.
+        :param thumb_quality: Encoder quality (1-100) of the thumbnail.
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown upload image format '{image_format}'; expected one of {sorted(IMAGE_FORMATS)}.")
+        self.image_format = image_format
+        self.quality = quality
+        self.crop_margin = crop_margin
+        self.min_crop_size = min_crop_size
+        self.thumb_height = thumb_height
+        self.thumb_quality = thumb_quality
+
+        self._lock = threading.Lock()
+        self._frames = 0
+        self._defects = 0
+        self._source_bytes = 0
+        self._variant_bytes = {variant: 0 for variant in VARIANTS}
+        self._variant_count = {variant: 0 for variant in VARIANTS}
+
+    @property
+    def extension(self):
+        return IMAGE_FORMATS[self.image_format][0]
+
+    @property
+    def content_type(self):
+        return IMAGE_FORMATS[self.image_format][1]
+
+    def crop_box(self, frame_shape, detections):
+        """Pixel box (x0, y0, x1, y1) around all detections plus margin, clipped to the frame."""
+        height, width = frame_shape[:2]
+        if not detections:
+            return [0, 0, width, height]
+        x0 = min(d['bbox'][0] for d in detections)
+        y0 = min(d['bbox'][1] for d in detections)
+        x1 = max(d['bbox'][2] for d in detections)
+        y1 = max(d['bbox'][3] for d in detections)
+        pad_x = max((x1 - x0) * self.crop_margin, (self.min_crop_size - (x1 - x0)) / 2, 0)
+        pad_y = max((y1 - y0) * self.crop_margin, (self.min_crop_size - (y1 - y0)) / 2, 0)
+        return [max(0, int(x0 - pad_x)), max(0, int(y0 - pad_y)),
+                min(width, int(x1 + pad_x)), min(height, int(y1 + pad_y))]
+
+    def spec(self, variant, frame_shape, detections):
+        """The JSON-serialisable description of a variant stored with its outbox entry."""
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown upload variant '{variant}'; expected one of {VARIANTS}.")
+        return {"variant": variant, "box": self.crop_box(frame_shape, detections), "defects": len(detections)}
+
+    def render(self, frame, spec, source_bytes=0):
+        """Encodes the variant described by `spec` (see spec()) from a decoded frame and returns the bytes."""
+        if spec['variant'] == 'crop':
+            x0, y0, x1, y1 = spec['box']
+            image, quality = frame[y0:y1, x0:x1], self.quality
+        else:
+            height, width = frame.shape[:2]
+            scale = min(1.0, self.thumb_height / height)
+            image = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+            quality = self.thumb_quality
+
+        ok, buffer = cv2.imencode(self.extension, image, [IMAGE_FORMATS[self.image_format][2], quality])
+        if not ok:
+            raise ValueError(f"{self.image_format} encoding failed")
+        data = buffer.tobytes()
+
+        with self._lock:
+            self._variant_bytes[spec['variant']] += len(data)
+            self._variant_count[spec['variant']] += 1
+            if spec['variant'] == 'crop':
+                # Counted once per frame, against the full-resolution original
+                self._frames += 1
+                self._defects += spec['defects']
+                self._source_bytes += source_bytes
+        return data
+
+    def stats(self):
+        with self._lock:
+            defects = self._defects
+            uploaded = sum(self._variant_bytes.values())
+
+            def per_defect(n):
+                return round(n / defects) if defects else 0
+
+            return {
+                "format": self.image_format,
+                "frames": self._frames,
+                "defects": defects,
+                "variants": {variant: {"count": self._variant_count[variant],
+                                       "bytes": self._variant_bytes[variant],
+                                       "bytes_per_defect": per_defect(self._variant_bytes[variant])}
+                             for variant in VARIANTS},
+                "source_bytes_per_defect": per_defect(self._source_bytes),
+                "uploaded_bytes_per_defect": per_defect(uploaded),
+                "saved_ratio": round(1 - uploaded / self._source_bytes, 3) if self._source_bytes else 0.0,
+            }
@@ -1,94 +1,712 @@
 import sqlite3
 import datetime
-import os
-import shutil
-import glob
 import csv
 import io
-from flask import make_response # Removed request
+import json
+import math
+import queue
+import threading
+from flask import Response, make_response, stream_with_context
+
+from geo_utils import haversine_m
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Spatial queries return at most this many rows per page
+MAX_PAGE_SIZE = 1000
+METERS_PER_DEGREE_LAT = 111320.0
+
+# Rollup bucket -> length of the 'YYYY-MM-DD HH' timestamp prefix it groups by
+ROLLUP_GRANULARITIES = {'day': 10, 'hour': 13}
+
+# Observations closer than this to an existing cluster centroid are merged into it
+DEFAULT_CLUSTER_RADIUS_M = 8.0
+# Grid cells are sized in degrees so that one cell spans at least the merge radius
+# in both directions up to 60 degrees of latitude (cos(60) = 0.5).
+CLUSTER_CELL_METERS_PER_DEGREE = METERS_PER_DEGREE_LAT * 0.5
+
+
+def _cluster_cell(latitude, longitude, radius_m):
+    size = radius_m / CLUSTER_CELL_METERS_PER_DEGREE
+    return int(math.floor(latitude / size)), int(math.floor(longitude / size))
+
+
+def _assign_cluster(conn, pothole_id, latitude, longitude, timestamp, confidence, radius_m=DEFAULT_CLUSTER_RADIUS_M):
+    """
+    Maps one observation to a canonical pothole cluster: the nearest cluster
+    centroid within `radius_m` in the surrounding 3x3 grid cells, or a new one.
+    Must run on the writer connection, inside the insert's transaction.
+    """
+    cell_lat, cell_lon = _cluster_cell(latitude, longitude, radius_m)
+    keys = [f"{cell_lat + i}:{cell_lon + j}" for i in (-1, 0, 1) for j in (-1, 0, 1)]
+    candidates = conn.execute(
+        f"SELECT id, latitude, longitude, hit_count FROM pothole_clusters WHERE cell_key IN ({','.join('?' * len(keys))})",
+        keys).fetchall()
+
+    nearest = min(((haversine_m(latitude, longitude, c[1], c[2]), c) for c in candidates),
+                  key=lambda match: match[0], default=None)
+    if nearest and nearest[0] <= radius_m:
+        cluster_id, c_lat, c_lon, hits = nearest[1]
+        # Running mean of the observations keeps the centroid on the physical pothole
+        new_lat = (c_lat * hits + latitude) / (hits + 1)
+        new_lon = (c_lon * hits + longitude) / (hits + 1)
+        new_cell = '%d:%d' % _cluster_cell(new_lat, new_lon, radius_m)
+        conn.execute('''
+            UPDATE pothole_clusters
+            SET latitude = ?, longitude = ?, cell_key = ?, hit_count = hit_count + 1,
+                max_confidence = MAX(COALESCE(max_confidence, 0), COALESCE(?, 0)),
+                first_seen = MIN(first_seen, ?), last_seen = MAX(last_seen, ?)
+            WHERE id = ?
+        ''', (new_lat, new_lon, new_cell, confidence, timestamp, timestamp, cluster_id))
+    else:
+        cluster_id = conn.execute('''
+            INSERT INTO pothole_clusters (latitude, longitude, cell_key, hit_count, max_confidence, first_seen, last_seen)
+            VALUES (?, ?, ?, 1, ?, ?, ?)
+        ''', (latitude, longitude, f"{cell_lat}:{cell_lon}", confidence, timestamp, timestamp)).lastrowid
+
+    conn.execute("UPDATE potholes SET cluster_id = ? WHERE id = ?", (cluster_id, pothole_id))
+    return cluster_id
+
+
+def _backfill_clusters(conn, data_manager):
+    """Clusters every existing observation, oldest first, with the DataManager's merge radius."""
+    rows = conn.execute("SELECT id, latitude, longitude, timestamp, confidence FROM potholes "
+                        "WHERE cluster_id IS NULL ORDER BY timestamp").fetchall()
+    for pothole_id, latitude, longitude, timestamp, confidence in rows:
+        _assign_cluster(conn, pothole_id, latitude, longitude, timestamp, confidence, data_manager.cluster_radius_m)
+
+
+def _refresh_clusters(conn, cluster_ids, radius_m):
+    """
+    Recomputes centroid, hit count, max confidence and first/last seen of
+    clusters that lost observations, from the observations left. Clusters with
+    none left are deleted. Returns the number of clusters deleted.
+    """
+    deleted = 0
+    for cluster_id in cluster_ids:
+        hits, latitude, longitude, max_confidence, first_seen, last_seen = conn.execute(
+            "SELECT COUNT(*), AVG(latitude), AVG(longitude), MAX(confidence), MIN(timestamp), MAX(timestamp) "
+            "FROM potholes WHERE cluster_id = ?", (cluster_id,)).fetchone()
+        if not hits:
+            deleted += conn.execute("DELETE FROM pothole_clusters WHERE id = ?", (cluster_id,)).rowcount
+            continue
+        conn.execute('''
+            UPDATE pothole_clusters
+            SET latitude = ?, longitude = ?, cell_key = ?, hit_count = ?, max_confidence = ?,
+                first_seen = ?, last_seen = ?
+            WHERE id = ?
+        ''', (latitude, longitude, '%d:%d' % _cluster_cell(latitude, longitude, radius_m), hits, max_confidence,
+              first_seen, last_seen, cluster_id))
+    return deleted
+
+
+def _rollup_from_raw(conn):
+    """Recomputes every rollup counter from the raw potholes rows."""
+    counts = {('total', ''): conn.execute("SELECT COUNT(*) FROM potholes").fetchone()[0]}
+    for granularity, length in ROLLUP_GRANULARITIES.items():
+        for bucket, count in conn.execute(
+                f"SELECT substr(timestamp, 1, {length}), COUNT(*) FROM potholes GROUP BY 1"):
+            counts[(granularity, bucket)] = count
+    return counts
+
+
+def _rebuild_rollup(conn, data_manager=None):
+    conn.execute("DELETE FROM pothole_rollup")
+    conn.executemany("INSERT INTO pothole_rollup VALUES (?, ?, ?)",
+                     [(granularity, bucket, count) for (granularity, bucket), count in _rollup_from_raw(conn).items()])
+
+
+# Schema migrations, applied in order. PRAGMA user_version records how many have run.
+# A step is either a SQL statement or a callable taking the connection and the DataManager (for its settings).
+MIGRATIONS = [
+    # 1: original table
+    ['''
+        CREATE TABLE IF NOT EXISTS potholes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            timestamp DATETIME NOT NULL,
+            session_timestamp TEXT,
+            image_filename TEXT,
+            confidence REAL
+        )
+    '''],
+    # 2: indexes for time-range, session and location queries
+    [
+        "CREATE INDEX IF NOT EXISTS idx_potholes_timestamp ON potholes (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_potholes_session ON potholes (session_timestamp, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_potholes_lat_lon ON potholes (latitude, longitude)",
+    ],
+    # 3: R*Tree spatial index kept in sync with potholes by triggers
+    [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS potholes_rtree USING rtree (id, min_lat, max_lat, min_lon, max_lon)",
+        "INSERT OR REPLACE INTO potholes_rtree SELECT id, latitude, latitude, longitude, longitude FROM potholes",
+        '''CREATE TRIGGER IF NOT EXISTS potholes_rtree_insert AFTER INSERT ON potholes BEGIN
+            INSERT INTO potholes_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS potholes_rtree_update AFTER UPDATE OF latitude, longitude ON potholes BEGIN
+            UPDATE potholes_rtree SET min_lat = new.latitude, max_lat = new.latitude,
+                                      min_lon = new.longitude, max_lon = new.longitude WHERE id = new.id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS potholes_rtree_delete AFTER DELETE ON potholes BEGIN
+            DELETE FROM potholes_rtree WHERE id = old.id;
+        END''',
+    ],
+    # 4: canonical pothole clusters for repeated observations of the same defect
+    [
+        '''CREATE TABLE IF NOT EXISTS pothole_clusters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            cell_key TEXT NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            max_confidence REAL,
+            first_seen DATETIME NOT NULL,
+            last_seen DATETIME NOT NULL
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_clusters_cell ON pothole_clusters (cell_key)",
+        "CREATE INDEX IF NOT EXISTS idx_clusters_lat_lon ON pothole_clusters (latitude, longitude)",
+        "CREATE INDEX IF NOT EXISTS idx_clusters_last_seen ON pothole_clusters (last_seen)",
+        "ALTER TABLE potholes ADD COLUMN cluster_id INTEGER REFERENCES pothole_clusters (id)",
+        "CREATE INDEX IF NOT EXISTS idx_potholes_cluster ON potholes (cluster_id)",
+        _backfill_clusters,
+    ],
+    # 5: per-hour / per-day / total counters maintained by triggers on insert and delete
+    [
+        '''CREATE TABLE IF NOT EXISTS pothole_rollup (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (granularity, bucket)
+        ) WITHOUT ROWID''',
+        '''CREATE TRIGGER IF NOT EXISTS potholes_rollup_insert AFTER INSERT ON potholes BEGIN
+            INSERT INTO pothole_rollup VALUES ('total', '', 1)
+                ON CONFLICT (granularity, bucket) DO UPDATE SET count = count + 1;
+            INSERT INTO pothole_rollup VALUES ('day', substr(new.timestamp, 1, 10), 1)
+                ON CONFLICT (granularity, bucket) DO UPDATE SET count = count + 1;
+            INSERT INTO pothole_rollup VALUES ('hour', substr(new.timestamp, 1, 13), 1)
+                ON CONFLICT (granularity, bucket) DO UPDATE SET count = count + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS potholes_rollup_delete AFTER DELETE ON potholes BEGIN
+            UPDATE pothole_rollup SET count = count - 1 WHERE granularity = 'total' AND bucket = '';
+            UPDATE pothole_rollup SET count = count - 1 WHERE granularity = 'day' AND bucket = substr(old.timestamp, 1, 10);
+            UPDATE pothole_rollup SET count = count - 1 WHERE granularity = 'hour' AND bucket = substr(old.timestamp, 1, 13);
+            DELETE FROM pothole_rollup WHERE count <= 0 AND granularity != 'total';
+        END''',
+        _rebuild_rollup,
+    ],
+    # 6: IMU impacts fused with the nearest GPS fix and the preceding vision detection
+    [
+        '''CREATE TABLE IF NOT EXISTS impact_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME NOT NULL,
+            g_force REAL NOT NULL,
+            duration_s REAL,
+            latitude REAL,
+            longitude REAL,
+            gps_gap_s REAL,
+            session_timestamp TEXT,
+            detection_confidence REAL,
+            detection_track_id INTEGER,
+            detection_lag_s REAL,
+            correlation REAL
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_impacts_timestamp ON impact_events (timestamp)",
+    ],
+    # 7: recorded session directories and their disk usage, maintained by the retention engine
+    [
+        '''CREATE TABLE IF NOT EXISTS sessions (
+            session_timestamp TEXT PRIMARY KEY,
+            started_at DATETIME NOT NULL,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            files INTEGER NOT NULL DEFAULT 0,
+            scanned_mtime REAL NOT NULL DEFAULT 0,
+            state TEXT NOT NULL DEFAULT 'active',
+            pruned_at REAL
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_sessions_state_started ON sessions (state, started_at)",
+    ],
+]
+
+SESSION_COLUMNS = ('session_timestamp', 'started_at', 'bytes', 'files', 'scanned_mtime', 'state', 'pruned_at')
+
+IMPACT_EVENT_COLUMNS = ('timestamp', 'g_force', 'duration_s', 'latitude', 'longitude', 'gps_gap_s',
+                        'session_timestamp', 'detection_confidence', 'detection_track_id', 'detection_lag_s', 'correlation')
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet', 'arrow')
+EXPORT_COLUMNS = ['ID', 'Latitude', 'Longitude', 'Timestamp', 'Confidence']
+EXPORT_CHUNK_SIZE = 5000
+
+INSERT_POTHOLE_SQL = ("INSERT INTO potholes (latitude, longitude, timestamp, session_timestamp, image_filename, confidence) "
+                      "VALUES (?, ?, ?, ?, ?, ?)")
+
+
+def _format_timestamp(timestamp):
+    """Stores timestamps as 'YYYY-MM-DD HH:MM:SS' text so range queries can use the index."""
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.strftime(TIMESTAMP_FORMAT)
+    return timestamp
+
+
+def _parse_bound(value):
+    """Normalizes a YYYY-MM-DD or ISO timestamp filter bound to the stored format."""
+    try:
+        return datetime.datetime.fromisoformat(value).strftime(TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date '{value}'. Use YYYY-MM-DD or an ISO timestamp.")
+
+
+class _StreamSink:
+    """Write-only file object that hands out written bytes as they are produced."""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parse_timestamp(value):
+    """Parses stored timestamps, tolerating rows written with fractional seconds."""
+    try:
+        return datetime.datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value)
+
+
+class _WriteOp:
+    """A batch of statements executed by the writer thread; callers may wait on the result."""
+    def __init__(self, statements):
+        self.statements = statements # list of (sql, params, many) or callables taking the connection
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        if self.error:
+            raise self.error
+        return self.result
+
 
 class DataManager:
-    def __init__(self, db_path='database.db', local_data_dir=None, retention_days=30):
+    """
+    SQLite storage for pothole records.
+
+    The database runs in WAL mode so readers never block the writer. All writes
+    go through a single writer thread that drains its queue and commits
+    everything pending in one transaction; every other thread (main loop,
+    Flask requests, cleanup) reads through its own connection.
+    """
+    def __init__(self, db_path='database.db', write_batch_size=500, write_flush_interval=0.05,
+                 cluster_radius_m=DEFAULT_CLUSTER_RADIUS_M):
         self.db_path = db_path
-        self.local_data_dir = local_data_dir
-        self.retention_days = retention_days
+        self.cluster_radius_m = cluster_radius_m
+        self.write_batch_size = write_batch_size
+        self.write_flush_interval = write_flush_interval
         self.conn = self._init_db()
 
+        self._local = threading.local()
+        self._read_conns = []
+        self._read_conns_lock = threading.Lock()
+
+        self._write_queue = queue.Queue()
+        self._writer_running = True
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS potholes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL,
-                timestamp DATETIME NOT NULL,
-                session_timestamp TEXT,
-                image_filename TEXT,
-                confidence REAL
-            )
-        ''')
-        conn.commit()
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate(conn)
         return conn
 
-    def add_pothole_entry(self, latitude, longitude, timestamp, session_timestamp=None, image_filename=None, confidence=None):
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO potholes (latitude, longitude, timestamp, session_timestamp, image_filename, confidence) VALUES (?, ?, ?, ?, ?, ?)",
-                       (latitude, longitude, timestamp, session_timestamp, image_filename, confidence))
-        self.conn.commit()
-        return cursor.lastrowid
-
-    def cleanup_old_data(self):
-        """Cleans up old data (image directories and DB entries) based on retention policy."""
-        if not self.local_data_dir or not os.path.exists(self.local_data_dir):
-            print(f"Cleanup: Data root directory {self.local_data_dir} does not exist or is not set.")
+    def _migrate(self, conn):
+        """Applies any migrations newer than the database's user_version."""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for index, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.execute("BEGIN")
+            for statement in statements:
+                if callable(statement):
+                    statement(conn, self)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {index}")
+            conn.execute("COMMIT")
+            print(f"DataManager: Applied schema migration {index}")
+
+    def _reader(self):
+        """Returns this thread's read connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
+
+    def release_reader(self):
+        """
+        Closes this thread's read connection, if any. Call it when a short-lived
+        thread (e.g. a Flask request thread) is done reading, or its connection
+        and file descriptor stay open until close().
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
             return
+        self._local.conn = None
+        with self._read_conns_lock:
+            self._read_conns.remove(conn)
+        conn.close()
 
-        cutoff_date = datetime.datetime.now() - datetime.timedelta(days=self.retention_days)
+    # --- Writer thread ---
+    def _submit_write(self, statements, wait=False, timeout=None):
+        op = _WriteOp(statements)
+        self._write_queue.put(op)
+        return op.wait(timeout) if wait else op
 
-        # Clean up file system directories
-        for session_dir_path in glob.glob(os.path.join(self.local_data_dir, '*')):
-            if os.path.isdir(session_dir_path):
+    def _writer_loop(self):
+        while self._writer_running or not self._write_queue.empty():
+            try:
+                batch = [self._write_queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            # Group everything that arrives within the flush interval into one transaction
+            while len(batch) < self.write_batch_size:
                 try:
-                    dir_name = os.path.basename(session_dir_path)
-                    try:
-                        session_date = datetime.datetime.strptime(dir_name, '%Y-%m-%d_%H-%M-%S')
-                    except ValueError:
-                        session_date = datetime.datetime.strptime(dir_name.split('_')[0], '%Y-%m-%d')
-                    
-                    if session_date < cutoff_date:
-                        print(f"Cleanup: Deleting old session directory {session_dir_path}")
-                        shutil.rmtree(session_dir_path)
-                except Exception as e:
-                    print(f"Cleanup: Error processing directory {session_dir_path}: {e}")
-
-        # Clean up database entries
+                    batch.append(self._write_queue.get(timeout=self.write_flush_interval))
+                except queue.Empty:
+                    break
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
         try:
-            cursor = self.conn.cursor()
-            cutoff_timestamp_str = cutoff_date.strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute("DELETE FROM potholes WHERE timestamp < ?", (cutoff_timestamp_str,))
-            self.conn.commit()
-            print(f"Cleanup: Deleted database entries older than {cutoff_date}")
+            self.conn.execute("BEGIN")
+            for op in batch:
+                op.result = self._run_statements(op.statements)
+            self.conn.execute("COMMIT")
         except Exception as e:
-            print(f"Cleanup: Error cleaning database: {e}")
+            self.conn.execute("ROLLBACK")
+            print(f"DataManager: Batch write failed, retrying statements individually: {e}")
+            # Isolate the failing operation so the rest of the batch is not lost
+            for op in batch:
+                try:
+                    self.conn.execute("BEGIN")
+                    op.result = self._run_statements(op.statements)
+                    self.conn.execute("COMMIT")
+                except Exception as op_error:
+                    self.conn.execute("ROLLBACK")
+                    op.error = op_error
+        for op in batch:
+            op.done.set()
+
+    def _run_statements(self, statements):
+        result = None
+        for statement in statements:
+            if callable(statement):
+                result = statement(self.conn)
+                continue
+            sql, params, many = statement
+            cursor = self.conn.executemany(sql, params) if many else self.conn.execute(sql, params)
+            result = cursor.lastrowid if sql.lstrip().upper().startswith('INSERT') and not many else cursor.rowcount
+        return result
+
+    def flush(self, timeout=None):
+        """Blocks until every write queued so far has been committed."""
+        self._submit_write([], wait=True, timeout=timeout)
+
+    # --- Writes ---
+    def add_pothole_entry(self, latitude, longitude, timestamp, session_timestamp=None, image_filename=None, confidence=None,
+                          wait=False):
+        """
+        Queues a pothole observation for the writer thread, which also assigns
+        it to a pothole cluster.
+        Returns the new row id when `wait` is True, otherwise None without blocking.
+        """
+        row = (latitude, longitude, _format_timestamp(timestamp), session_timestamp, image_filename, confidence)
+        result = self._submit_write([lambda conn: self._insert_potholes(conn, [row])], wait=wait)
+        return result if wait else None
+
+    def add_pothole_entries(self, rows, wait=True):
+        """
+        Bulk-inserts rows of (latitude, longitude, timestamp, session_timestamp,
+        image_filename, confidence) in a single transaction.
+        """
+        rows = [(r[0], r[1], _format_timestamp(r[2])) + tuple(r[3:]) for r in rows]
+        self._submit_write([lambda conn: self._insert_potholes(conn, rows)], wait=wait)
+
+    def add_impact_event(self, event, session_timestamp=None, wait=False):
+        """
+        Queues a fused impact event (as produced by SensorFusion.add_g_force) for the writer thread.
+        Returns the new row id when `wait` is True, otherwise None without blocking.
+        """
+        row = dict(event, session_timestamp=session_timestamp)
+        row['timestamp'] = _format_timestamp(datetime.datetime.fromisoformat(row['timestamp']))
+        sql = (f"INSERT INTO impact_events ({', '.join(IMPACT_EVENT_COLUMNS)}) "
+               f"VALUES ({', '.join('?' for _ in IMPACT_EVENT_COLUMNS)})")
+        result = self._submit_write([(sql, tuple(row.get(c) for c in IMPACT_EVENT_COLUMNS), False)], wait=wait)
+        return result if wait else None
+
+    def _insert_potholes(self, conn, rows):
+        pothole_id = None
+        for row in rows:
+            pothole_id = conn.execute(INSERT_POTHOLE_SQL, row).lastrowid
+            _assign_cluster(conn, pothole_id, row[0], row[1], row[2], row[5], self.cluster_radius_m)
+        return pothole_id
+
+    def delete_session_potholes(self, session_timestamp):
+        """
+        Deletes every pothole observation recorded in a session, e.g. before it
+        is reprocessed with a newer model, and refreshes the clusters they
+        belonged to. Returns the number of rows deleted.
+        """
+        def delete(conn):
+            cluster_ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT cluster_id FROM potholes WHERE session_timestamp = ? AND cluster_id IS NOT NULL",
+                (session_timestamp,))]
+            deleted = conn.execute("DELETE FROM potholes WHERE session_timestamp = ?", (session_timestamp,)).rowcount
+            _refresh_clusters(conn, cluster_ids, self.cluster_radius_m)
+            return deleted
+
+        return self._submit_write([delete], wait=True)
+
+    # --- Retention ---
+    def record_session_usage(self, session_timestamp, started_at, bytes_used, files, scanned_mtime):
+        """
+        Creates or updates a session's disk usage as last scanned. Its retention
+        state is left unchanged, unless a deleted session's directory reappeared.
+        """
+        self._submit_write([(
+            "INSERT INTO sessions (session_timestamp, started_at, bytes, files, scanned_mtime) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (session_timestamp) DO UPDATE SET bytes = excluded.bytes, files = excluded.files, "
+            "scanned_mtime = excluded.scanned_mtime, "
+            "state = CASE WHEN state = 'deleted' THEN 'active' ELSE state END",
+            (session_timestamp, _format_timestamp(started_at), bytes_used, files, scanned_mtime), False)], wait=True)
 
-    def export_pothole_data(self):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, latitude, longitude, timestamp, confidence FROM potholes ORDER BY timestamp DESC")
-        potholes = cursor.fetchall()
+    def set_session_state(self, session_timestamp, state, bytes_used, files, pruned_at=None):
+        self._submit_write([(
+            "UPDATE sessions SET state = ?, bytes = ?, files = ?, pruned_at = ? WHERE session_timestamp = ?",
+            (state, bytes_used, files, pruned_at, session_timestamp), False)], wait=True)
 
+    def get_sessions(self, states=None, started_before=None):
+        """Returns tracked sessions as dicts, oldest first, optionally filtered by state and start time."""
+        query = f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions WHERE 1 = 1"
+        params = []
+        if states:
+            query += f" AND state IN ({', '.join('?' for _ in states)})"
+            params.extend(states)
+        if started_before:
+            query += " AND started_at < ?"
+            params.append(_format_timestamp(started_before))
+        query += " ORDER BY started_at"
+        return [dict(zip(SESSION_COLUMNS, row)) for row in self._reader().execute(query, tuple(params))]
+
+    def get_session_usage(self):
+        """Total bytes and files of every session still on disk, from the tracked sizes (no directory walk)."""
+        total_bytes, files = self._reader().execute(
+            "SELECT COALESCE(SUM(bytes), 0), COALESCE(SUM(files), 0) FROM sessions WHERE state != 'deleted'").fetchone()
+        return {"bytes": total_bytes, "files": files}
+
+    def get_protected_images(self, session_timestamp, min_confidence):
+        """Image filenames of a session referenced by pothole records at or above `min_confidence`."""
+        rows = self._reader().execute(
+            "SELECT DISTINCT image_filename FROM potholes WHERE session_timestamp = ? AND confidence >= ? "
+            "AND image_filename IS NOT NULL", (session_timestamp, min_confidence))
+        return {row[0] for row in rows}
+
+    def get_session_image_locations(self, session_timestamp):
+        """Maps each image filename of a session's pothole records to the (latitude, longitude) stored with it."""
+        rows = self._reader().execute(
+            "SELECT image_filename, latitude, longitude FROM potholes WHERE session_timestamp = ? "
+            "AND image_filename IS NOT NULL AND latitude IS NOT NULL AND longitude IS NOT NULL",
+            (session_timestamp,))
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def delete_expired_rows(self, cutoff, keep_confidence=None, limit=500):
+        """
+        Deletes at most `limit` rows older than `cutoff` from each of potholes,
+        impact_events and pothole_clusters, in one short transaction, so callers
+        can spread a large cleanup over many small batches.
+        Potholes at or above `keep_confidence` are kept, and so are the clusters they belong to.
+        Clusters that lose observations have their aggregates recomputed from the rest.
+        Returns the number of rows deleted per table.
+        """
+        cutoff = _format_timestamp(cutoff)
+        keep = keep_confidence if keep_confidence is not None else float('inf')
+        counts = {}
+
+        def delete(conn):
+            expired = conn.execute(
+                "SELECT id, cluster_id FROM potholes WHERE timestamp < ? AND (confidence IS NULL OR confidence < ?) "
+                "LIMIT ?", (cutoff, keep, limit)).fetchall()
+            conn.executemany("DELETE FROM potholes WHERE id = ?", [(pothole_id,) for pothole_id, _ in expired])
+            counts["potholes"] = len(expired)
+            emptied = _refresh_clusters(conn, {cluster_id for _, cluster_id in expired if cluster_id is not None},
+                                        self.cluster_radius_m)
+            counts["impact_events"] = conn.execute(
+                "DELETE FROM impact_events WHERE id IN (SELECT id FROM impact_events WHERE timestamp < ? LIMIT ?)",
+                (cutoff, limit)).rowcount
+            # Clusters last seen before the cutoff have no observations left, except kept high-confidence ones
+            counts["pothole_clusters"] = emptied + conn.execute(
+                "DELETE FROM pothole_clusters WHERE id IN (SELECT id FROM pothole_clusters c WHERE last_seen < ? "
+                "AND NOT EXISTS (SELECT 1 FROM potholes p WHERE p.cluster_id = c.id) LIMIT ?)",
+                (cutoff, limit)).rowcount
+
+        self._submit_write([delete], wait=True)
+        return counts
+
+    def export_pothole_data(self, export_format='csv', start=None, end=None, bbox=None, session_timestamp=None,
+                            chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Streams the potholes table as CSV, NDJSON, Parquet or Arrow IPC.
+
+        Rows are read from a dedicated cursor `chunk_size` at a time and written
+        to the response as they are produced, so memory stays constant and the
+        first bytes are sent immediately regardless of table size.
+
+        :param start: Optional inclusive lower bound (YYYY-MM-DD or ISO timestamp).
+        :param end: Optional exclusive upper bound (YYYY-MM-DD or ISO timestamp).
+        :param bbox: Optional (min_lat, min_lon, max_lat, max_lon).
+        :param session_timestamp: Optional session to export.
+        """
+        if export_format not in EXPORT_FORMATS:
+            return make_response({"error": f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}."}, 400)
+        try:
+            query, params = self._export_query(start, end, bbox, session_timestamp)
+        except ValueError as e:
+            return make_response({"error": str(e)}, 400)
+
+        if export_format in ('parquet', 'arrow'):
+            try:
+                import pyarrow # noqa: F401 - optional dependency, only needed for columnar exports
+            except ImportError:
+                return make_response({"error": "pyarrow is required for Parquet/Arrow export."}, 501)
+
+        mimetype, extension, encoder = {
+            'csv': ('text/csv', 'csv', self._encode_csv),
+            'ndjson': ('application/x-ndjson', 'ndjson', self._encode_ndjson),
+            'parquet': ('application/vnd.apache.parquet', 'parquet', self._encode_parquet),
+            'arrow': ('application/vnd.apache.arrow.stream', 'arrows', self._encode_arrow),
+        }[export_format]
+
+        output = Response(stream_with_context(encoder(self._iter_export_chunks(query, params, chunk_size))),
+                          mimetype=mimetype)
+        output.headers["Content-Disposition"] = f"attachment; filename=pothole_data.{extension}"
+        return output
+
+    def _export_query(self, start, end, bbox, session_timestamp):
+        query = "SELECT p.id, p.latitude, p.longitude, p.timestamp, p.confidence FROM potholes p"
+        conditions, params = [], []
+        if bbox:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            query += " JOIN potholes_rtree r ON r.id = p.id"
+            conditions.append("r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ? "
+                              "AND p.latitude BETWEEN ? AND ? AND p.longitude BETWEEN ? AND ?")
+            params.extend([min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon])
+        if start:
+            conditions.append("p.timestamp >= ?")
+            params.append(_parse_bound(start))
+        if end:
+            conditions.append("p.timestamp < ?")
+            params.append(_parse_bound(end))
+        if session_timestamp:
+            conditions.append("p.session_timestamp = ?")
+            params.append(session_timestamp)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY p.timestamp DESC"
+        return query, params
+
+    def _iter_export_chunks(self, query, params, chunk_size):
+        """Yields lists of rows from a dedicated connection that lives as long as the stream."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _encode_csv(chunks):
         si = io.StringIO()
         cw = csv.writer(si)
-        
-        cw.writerow(['ID', 'Latitude', 'Longitude', 'Timestamp', 'Confidence'])
-        
-        for pothole in potholes:
-            cw.writerow(pothole)
-        
-        output = make_response(si.getvalue())
-        output.headers["Content-Disposition"] = "attachment; filename=pothole_data.csv"
-        output.headers["Content-type"] = "text/csv"
-        return output
+        cw.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            cw.writerows(rows)
+            yield si.getvalue()
+            si.seek(0)
+            si.truncate()
+        yield si.getvalue()
+
+    @staticmethod
+    def _encode_ndjson(chunks):
+        keys = [c.lower() for c in EXPORT_COLUMNS]
+        for rows in chunks:
+            yield "".join(json.dumps(dict(zip(keys, row))) + "\n" for row in rows)
+
+    @staticmethod
+    def _arrow_schema():
+        import pyarrow as pa
+        return pa.schema([('id', pa.int64()), ('latitude', pa.float64()), ('longitude', pa.float64()),
+                          ('timestamp', pa.string()), ('confidence', pa.float64())])
+
+    @staticmethod
+    def _arrow_batches(chunks, schema):
+        import pyarrow as pa
+        for rows in chunks:
+            columns = list(zip(*rows))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+    def _encode_parquet(self, chunks):
+        import pyarrow.parquet as pq
+        sink = _StreamSink()
+        schema = self._arrow_schema()
+        # Opened up front so an export matching no rows is still a valid, empty file
+        writer = pq.ParquetWriter(sink, schema)
+        for batch in self._arrow_batches(chunks, schema):
+            # One row group per chunk; its bytes can be sent as soon as it is written
+            writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+    def _encode_arrow(self, chunks):
+        import pyarrow as pa
+        sink = _StreamSink()
+        schema = self._arrow_schema()
+        writer = pa.ipc.new_stream(sink, schema)
+        for batch in self._arrow_batches(chunks, schema):
+            writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
 
     def get_historical_potholes_data(self, date_filter_str=None):
         query = "SELECT id, latitude, longitude, timestamp, confidence FROM potholes"
@@ -96,43 +714,165 @@ class DataManager:
 
         if date_filter_str:
             try:
-                datetime.datetime.strptime(date_filter_str, '%Y-%m-%d')
-                query += " WHERE DATE(timestamp) = ?"
-                params.append(date_filter_str)
+                day = datetime.datetime.strptime(date_filter_str, '%Y-%m-%d')
+                # A half-open range instead of DATE(timestamp) = ? so the timestamp index is used
+                query += " WHERE timestamp >= ? AND timestamp < ?"
+                params.extend([day.strftime(TIMESTAMP_FORMAT), (day + datetime.timedelta(days=1)).strftime(TIMESTAMP_FORMAT)])
             except ValueError:
                 # Return an error or handle invalid date gracefully
                 return {"error": "Invalid date format. Use YYYY-MM-DD."}, 400
         
         query += " ORDER BY timestamp DESC"
 
-        cursor = self.conn.cursor()
+        cursor = self._reader().cursor()
         cursor.execute(query, tuple(params))
         potholes_data = cursor.fetchall()
 
-        potholes_list = []
-        for pothole in potholes_data:
-            potholes_list.append({
-                "id": pothole[0],
-                "latitude": pothole[1],
-                "longitude": pothole[2],
-                "timestamp": datetime.datetime.strptime(pothole[3], '%Y-%m-%d %H:%M:%S').isoformat(),
-                "confidence": pothole[4]
-            })
+        potholes_list = [self._pothole_summary(pothole) for pothole in potholes_data]
         
         return potholes_list, 200
 
+    @staticmethod
+    def _pothole_summary(row):
+        """Formats an (id, latitude, longitude, timestamp, confidence) row for the API."""
+        return {
+            "id": row[0],
+            "latitude": row[1],
+            "longitude": row[2],
+            "timestamp": _parse_timestamp(row[3]).isoformat(),
+            "confidence": row[4]
+        }
+
+    def get_potholes_in_bbox(self, min_lat, min_lon, max_lat, max_lon, limit=500, cursor=None):
+        """
+        Returns potholes inside a map viewport using the R*Tree index.
+        Pages are ordered by id; pass the returned `next_cursor` to get the next page.
+        """
+        if min_lat > max_lat or min_lon > max_lon:
+            return {"error": "min_lat/min_lon must not be greater than max_lat/max_lon."}, 400
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        # The R*Tree stores 32-bit bounds, so re-check the exact coordinates on the joined row
+        query = '''
+            SELECT p.id, p.latitude, p.longitude, p.timestamp, p.confidence
+            FROM potholes_rtree r JOIN potholes p ON p.id = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+              AND p.latitude BETWEEN ? AND ? AND p.longitude BETWEEN ? AND ?
+              AND r.id > ?
+            ORDER BY r.id
+            LIMIT ?
+        '''
+        params = (min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon, int(cursor or 0), limit + 1)
+        rows = self._reader().execute(query, params).fetchall()
+
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return {
+            "potholes": [self._pothole_summary(row) for row in rows[:limit]],
+            "next_cursor": next_cursor
+        }, 200
+
+    def get_potholes_within_radius(self, latitude, longitude, radius_m, limit=500, offset=0):
+        """
+        Returns potholes within `radius_m` meters of a point, nearest first.
+        The R*Tree narrows the search to the enclosing bounding box before the
+        exact haversine distance is computed.
+        """
+        if radius_m <= 0:
+            return {"error": "radius_m must be positive."}, 400
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        offset = max(0, int(offset))
+
+        d_lat = radius_m / METERS_PER_DEGREE_LAT
+        d_lon = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(latitude)), 1e-6))
+        query = '''
+            SELECT p.id, p.latitude, p.longitude, p.timestamp, p.confidence
+            FROM potholes_rtree r JOIN potholes p ON p.id = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+        '''
+        rows = self._reader().execute(query, (latitude - d_lat, latitude + d_lat,
+                                              longitude - d_lon, longitude + d_lon)).fetchall()
+
+        matches = []
+        for row in rows:
+            distance = haversine_m(latitude, longitude, row[1], row[2])
+            if distance <= radius_m:
+                matches.append((distance, row))
+        matches.sort(key=lambda m: (m[0], m[1][0]))
+
+        page = matches[offset:offset + limit]
+        potholes = [dict(self._pothole_summary(row), distance_m=round(distance, 2)) for distance, row in page]
+        return {
+            "potholes": potholes,
+            "total": len(matches),
+            "next_offset": offset + limit if offset + limit < len(matches) else None
+        }, 200
+
+    def get_pothole_clusters(self, min_lat=None, min_lon=None, max_lat=None, max_lon=None, min_hits=1,
+                             limit=500, cursor=None):
+        """
+        Returns canonical pothole clusters (one per physical defect), optionally
+        limited to a bounding box. Pages are ordered by id; pass `next_cursor` back.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        query = ("SELECT id, latitude, longitude, hit_count, max_confidence, first_seen, last_seen "
+                 "FROM pothole_clusters WHERE id > ? AND hit_count >= ?")
+        params = [int(cursor or 0), int(min_hits)]
+        if None not in (min_lat, min_lon, max_lat, max_lon):
+            query += " AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?"
+            params.extend([min_lat, max_lat, min_lon, max_lon])
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self._reader().execute(query, tuple(params)).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return {
+            "clusters": [self._cluster_summary(row) for row in rows[:limit]],
+            "next_cursor": next_cursor
+        }, 200
+
+    def get_cluster_details(self, cluster_id, max_observations=100):
+        """Returns one cluster together with its most recent raw observations."""
+        reader = self._reader()
+        row = reader.execute("SELECT id, latitude, longitude, hit_count, max_confidence, first_seen, last_seen "
+                             "FROM pothole_clusters WHERE id = ?", (cluster_id,)).fetchone()
+        if not row:
+            return {"error": "Cluster not found"}, 404
+
+        observations = reader.execute(
+            "SELECT id, latitude, longitude, timestamp, confidence FROM potholes "
+            "WHERE cluster_id = ? ORDER BY timestamp DESC LIMIT ?", (cluster_id, max_observations)).fetchall()
+        cluster = self._cluster_summary(row)
+        cluster["observations"] = [self._pothole_summary(o) for o in observations]
+        return cluster, 200
+
+    @staticmethod
+    def _cluster_summary(row):
+        return {
+            "id": row[0],
+            "latitude": row[1],
+            "longitude": row[2],
+            "hit_count": row[3],
+            "max_confidence": row[4],
+            "first_seen": _parse_timestamp(row[5]).isoformat(),
+            "last_seen": _parse_timestamp(row[6]).isoformat()
+        }
+
     def get_summary_statistics_data(self):
-        cursor = self.conn.cursor()
+        """Answers the dashboard summary from the pothole_rollup counters instead of scanning potholes."""
+        cursor = self._reader().cursor()
 
-        total_defects = cursor.execute("SELECT COUNT(*) FROM potholes").fetchone()[0]
+        total_row = cursor.execute("SELECT count FROM pothole_rollup WHERE granularity = 'total' AND bucket = ''").fetchone()
+        total_defects = total_row[0] if total_row else 0
 
         today = datetime.date.today()
-        start_of_today_str = today.strftime('%Y-%m-%d %H:%M:%S')
-        defects_today = cursor.execute("SELECT COUNT(*) FROM potholes WHERE timestamp >= ?", (start_of_today_str,)).fetchone()[0]
+        defects_today = cursor.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM pothole_rollup WHERE granularity = 'day' AND bucket >= ?",
+            (today.isoformat(),)).fetchone()[0]
 
         seven_days_ago = today - datetime.timedelta(days=7)
-        start_of_seven_days_ago_str = seven_days_ago.strftime('%Y-%m-%d %H:%M:%S')
-        defects_7_days = cursor.execute("SELECT COUNT(*) FROM potholes WHERE timestamp >= ?", (start_of_seven_days_ago_str,)).fetchone()[0]
+        defects_7_days = cursor.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM pothole_rollup WHERE granularity = 'day' AND bucket >= ?",
+            (seven_days_ago.isoformat(),)).fetchone()[0]
         
         return {
             "total_defects": total_defects,
@@ -141,9 +881,73 @@ class DataManager:
             "most_common_defect": "Pothole" # Currently only one type
         }, 200
 
+    def get_defect_counts(self, granularity='day', start=None, end=None):
+        """
+        Returns per-hour or per-day defect counts from the rollup.
+        `start` (inclusive) and `end` (exclusive) are YYYY-MM-DD or ISO timestamps.
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            return {"error": f"granularity must be one of: {', '.join(ROLLUP_GRANULARITIES)}."}, 400
+        length = ROLLUP_GRANULARITIES[granularity]
+        query = "SELECT bucket, count FROM pothole_rollup WHERE granularity = ?"
+        params = [granularity]
+        try:
+            if start:
+                query += " AND bucket >= ?"
+                params.append(_parse_bound(start)[:length])
+            if end:
+                query += " AND bucket < ?"
+                params.append(_parse_bound(end)[:length])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        query += " ORDER BY bucket"
+        rows = self._reader().execute(query, tuple(params)).fetchall()
+        return [{"bucket": bucket, "count": count} for bucket, count in rows], 200
+
+    def get_impact_events(self, start=None, end=None, limit=500):
+        """
+        Returns fused impact events, newest first.
+        `start` (inclusive) and `end` (exclusive) are YYYY-MM-DD or ISO timestamps.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        query = f"SELECT id, {', '.join(IMPACT_EVENT_COLUMNS)} FROM impact_events WHERE 1 = 1"
+        params = []
+        try:
+            if start:
+                query += " AND timestamp >= ?"
+                params.append(_parse_bound(start))
+            if end:
+                query += " AND timestamp < ?"
+                params.append(_parse_bound(end))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        events = []
+        for row in self._reader().execute(query, tuple(params)):
+            event = dict(zip(('id',) + IMPACT_EVENT_COLUMNS, row))
+            event['timestamp'] = _parse_timestamp(event['timestamp']).isoformat()
+            events.append(event)
+        return events, 200
+
+    def check_rollup(self, repair=False):
+        """
+        Compares the rollup counters with counts recomputed from raw rows.
+        Returns the mismatched buckets; with `repair` the rollup is rebuilt.
+        """
+        expected = _rollup_from_raw(self._reader())
+        actual = {(g, b): c for g, b, c in self._reader().execute("SELECT granularity, bucket, count FROM pothole_rollup")}
+        mismatches = [{"granularity": g, "bucket": b, "expected": expected.get((g, b), 0), "actual": actual.get((g, b), 0)}
+                      for (g, b) in sorted(set(expected) | set(actual))
+                      if expected.get((g, b), 0) != actual.get((g, b), 0)]
+        if repair and mismatches:
+            self._submit_write([_rebuild_rollup], wait=True)
+        return mismatches
+
     def get_defect_details(self, defect_id):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, latitude, longitude, timestamp, session_timestamp, image_filename, confidence FROM potholes WHERE id = ?", (defect_id,))
+        cursor = self._reader().cursor()
+        cursor.execute("SELECT id, latitude, longitude, timestamp, session_timestamp, image_filename, confidence, cluster_id FROM potholes WHERE id = ?", (defect_id,))
         defect = cursor.fetchone()
 
         if not defect:
@@ -158,12 +962,42 @@ class DataManager:
             "id": defect[0],
             "latitude": defect[1],
             "longitude": defect[2],
-            "timestamp": datetime.datetime.strptime(defect[3], '%Y-%m-%d %H:%M:%S').isoformat(),
+            "timestamp": _parse_timestamp(defect[3]).isoformat(),
             "session_timestamp": defect[4],
             "image_filename": defect[5],
             "confidence": defect[6],
+            "cluster_id": defect[7],
             "image_url": image_url
         }, 200
 
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        """Commits pending writes, stops the writer thread and closes every connection."""
+        self._writer_running = False
+        self._writer_thread.join(timeout=10)
+        with self._read_conns_lock:
+            for conn in self._read_conns:
+                conn.close()
+            self._read_conns.clear()
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DataManager maintenance commands.")
+    parser.add_argument('command', choices=['check-rollup', 'rebuild-rollup'])
+    parser.add_argument('--db', default='database.db')
+    args = parser.parse_args()
+
+    data_manager = DataManager(db_path=args.db)
+    mismatches = data_manager.check_rollup(repair=args.command == 'rebuild-rollup')
+    for mismatch in mismatches:
+        print(f"{mismatch['granularity']:>5} {mismatch['bucket'] or '-':<13} expected {mismatch['expected']}, "
+              f"found {mismatch['actual']}")
+    if not mismatches:
+        print("✅ Rollup is consistent with the potholes table.")
+    elif args.command == 'rebuild-rollup':
+        print(f"✅ Rebuilt rollup ({len(mismatches)} buckets corrected).")
+    else:
+        print(f"❌ {len(mismatches)} rollup buckets are out of date. Run 'rebuild-rollup' to fix them.")
+    data_manager.close()
@@ -1,31 +1,48 @@
 import os
 import cv2
-from ultralytics import YOLO
+import numpy as np
+
+from inference_backends import load_backend
+
+# For this project, we are primarily interested in 'Pothole'
+TARGET_CLASSES = ('Pothole',)
 
 class DetectionEngine:
     """
     A class to encapsulate the YOLOv8 model loading and inference logic.
+    The actual runtime (ultralytics, ONNX Runtime, OpenVINO, TorchScript) is
+    chosen from the model file by `inference_backends.load_backend`.
     """
-    def __init__(self, model_path):
+    def __init__(self, model_path, **backend_kwargs):
         """
         Initializes the DetectionEngine by loading the YOLOv8 model.
-        :param model_path: The absolute or relative path to the .pt model file.
+        :param model_path: Path to a .pt model, or an exported .onnx / .torchscript /
+                           OpenVINO IR (.xml or *_openvino_model directory).
+        :param backend_kwargs: Optional img_size, conf_threshold and iou_threshold overrides.
         """
-        self.model = self._load_model(model_path)
+        self.model = self._load_model(model_path, **backend_kwargs)
+        self.target_class_ids = self._resolve_target_class_ids()
 
-    def _load_model(self, model_path):
+    def _load_model(self, model_path, **backend_kwargs):
         """
-        Loads the YOLOv8 model from the specified path.
-        Returns the model object or None if the model file doesn't exist.
+        Loads the YOLOv8 model from the specified path through the matching backend.
+        Returns the backend object or None if the model file doesn't exist.
         """
         if os.path.exists(model_path):
-            model = YOLO(model_path)
-            print(f"✅ DetectionEngine: Model loaded successfully from {model_path}")
-            return model
+            backend = load_backend(model_path, **backend_kwargs)
+            print(f"✅ DetectionEngine: Model loaded successfully from {model_path} ({type(backend).__name__})")
+            return backend
         else:
             print(f"❌ ERROR: DetectionEngine - Model not found at {model_path}. Detection will be disabled.")
             return None
 
+    def _resolve_target_class_ids(self):
+        """Maps TARGET_CLASSES to the model's class ids once, so filtering is a single mask."""
+        if not self.model:
+            return np.empty(0, dtype=np.int64)
+        return np.array([class_id for class_id, name in self.model.names.items() if name in TARGET_CLASSES],
+                        dtype=np.int64)
+
     def detect(self, frame):
         """
         Performs object detection on a single frame.
@@ -41,29 +58,60 @@ class DetectionEngine:
         if not self.model:
             return [], frame
 
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames, batch_size=16):
+        """
+        Performs object detection on several frames, running each chunk of
+        `batch_size` frames through the model in a single forward pass.
+
+        Args:
+            frames: A sequence of input images/frames from OpenCV.
+            batch_size: Maximum number of frames sent to the model at once.
+
+        Returns:
+            A list with one `(detected_defects, frame)` tuple per input frame,
+            in the same order and format as `detect()`.
+        """
+        frames = list(frames)
+        if not self.model:
+            return [([], frame) for frame in frames]
+
+        outputs = []
+        for start in range(0, len(frames), batch_size):
+            chunk = frames[start:start + batch_size]
+            for frame, (class_ids, confidences, boxes) in zip(chunk, self.model.predict(chunk)):
+                outputs.append(self._postprocess(frame, class_ids, confidences, boxes))
+        return outputs
+
+    def _postprocess(self, frame, class_ids, confidences, boxes):
+        """Filters the arrays down to target classes and draws them on the frame."""
+        mask = np.isin(class_ids, self.target_class_ids)
+        class_ids, confidences, boxes = class_ids[mask], confidences[mask], boxes[mask].astype(np.int32)
+
         detected_defects = []
-        # Perform inference
-        results = self.model(frame, verbose=False) # verbose=False suppresses console output
-
-        for r in results:
-            # The ultralytics results object can be iterated over directly
-            for box in r.boxes:
-                class_id = int(box.cls[0])
-                confidence = float(box.conf[0])
-                class_name = self.model.names.get(class_id, 'Unknown') # Use .get for safety
-                
-                # For this project, we are primarily interested in 'Pothole'
-                if class_name == 'Pothole':
-                    detected_defects.append({
-                        'class': class_name,
-                        'confidence': round(confidence, 2)
-                    })
-                    
-                    # Draw bounding box and label on the frame
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2) # Red for potholes
-                    label = f"{class_name} {confidence:.2f}"
-                    cv2.putText(frame, label, (x1, y1 - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-        
-        return detected_defects, frame
+        for class_id, confidence, (x1, y1, x2, y2) in zip(class_ids.tolist(), confidences.tolist(), boxes.tolist()):
+            class_name = self.model.names.get(class_id, 'Unknown') # Use .get for safety
+            detected_defects.append({
+                'class': class_name,
+                'confidence': round(confidence, 2),
+                'bbox': [x1, y1, x2, y2]
+            })
+
+        return detected_defects, draw_detections(frame, detected_defects)
+
+
+def draw_detections(frame, detections, offset=(0, 0)):
+    """
+    Draws bounding boxes and labels on the frame in place and returns it.
+    `offset` is added to every bbox, e.g. when the boxes belong to a crop of `frame`.
+    """
+    dx, dy = offset
+    for detection in detections:
+        x1, y1, x2, y2 = detection['bbox']
+        x1, y1, x2, y2 = x1 + dx, y1 + dy, x2 + dx, y2 + dy
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2) # Red for potholes
+        label = f"{detection['class']} {detection['confidence']:.2f}"
+        cv2.putText(frame, label, (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+    return frame
@@ -0,0 +1,123 @@
+import asyncio
+import collections
+import threading
+
+
+class Subscription:
+    """
+    One client's view of an EventHub.
+
+    Events published with a `coalesce_key` replace any pending event with the
+    same key, so a slow client only ever receives the latest telemetry or
+    status value instead of a backlog. Other events (samples, impacts,
+    detections) queue up to `max_pending`; past that the oldest are dropped and
+    the client is told to resynchronise with a full snapshot.
+    """
+    def __init__(self, max_pending=256, loop=None):
+        self._pending = collections.OrderedDict() # key -> (event_type, data)
+        self._max_pending = max_pending
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._loop = loop
+        self._async_event = asyncio.Event() if loop else None
+        self.dropped = 0
+        self.needs_resync = False
+
+    def _push(self, event_type, data, coalesce_key):
+        with self._cond:
+            if coalesce_key is not None:
+                key = ('coalesced', coalesce_key)
+                self._pending.pop(key, None)
+            else:
+                self._seq += 1
+                key = ('event', self._seq)
+            self._pending[key] = (event_type, data)
+            if len(self._pending) > self._max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+                self.needs_resync = True
+            self._cond.notify()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._async_event.set)
+            except RuntimeError:
+                pass # The client's event loop has already shut down
+
+    def _drain(self):
+        events = list(self._pending.values())
+        self._pending.clear()
+        if self.needs_resync:
+            self.needs_resync = False
+            events.insert(0, ('resync', {}))
+        return events
+
+    def get(self, timeout=None):
+        """Blocks until events are pending (or timeout) and returns them all, oldest first."""
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+            return self._drain()
+
+    async def get_async(self, timeout=None):
+        """asyncio flavour of get() for subscriptions created with a loop."""
+        try:
+            await asyncio.wait_for(self._async_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._async_event.clear()
+        with self._cond:
+            return self._drain()
+
+
+class EventHub:
+    """
+    Fan-out of delta events (telemetry, G-force samples, impacts, detections,
+    hardware status) from the background loops to push clients (SSE/WebSocket).
+    Publishing with no subscribers is a no-op, and idle subscribers cost nothing.
+    """
+    def __init__(self, max_pending=256):
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._last_values = {}
+
+    def subscribe(self, loop=None):
+        """Registers a client. Pass the running asyncio loop to use Subscription.get_async()."""
+        subscription = Subscription(self.max_pending, loop)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_type, data, coalesce_key=None):
+        """Sends an event to every subscriber."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._push(event_type, data, coalesce_key)
+
+    def publish_if_changed(self, event_type, data, coalesce_key=None):
+        """Publishes a coalescable event only when `data` differs from the last one sent."""
+        key = coalesce_key or event_type
+        # Compare, record and push under one lock so concurrent publishers cannot deliver out of order
+        # relative to the recorded value (Subscription._push never calls back into the hub)
+        with self._lock:
+            if self._last_values.get(key) == data:
+                return False
+            self._last_values[key] = data
+            for subscription in self._subscribers:
+                subscription._push(event_type, data, key)
+        return True
+
+
+def format_sse(event_type, data_json):
+    """Formats one Server-Sent Events message."""
+    return f"event: {event_type}\ndata: {data_json}\n\n"
@@ -0,0 +1,159 @@
+import ast
+import collections
+import csv
+import json
+import os
+import threading
+
+from session_container import SessionReader, image_filename, is_container_session
+
+
+class DetectionEventStore:
+    """
+    Append-only log of structured detection events with an in-memory tail index.
+
+    Every event gets a monotonically increasing integer id that doubles as a
+    cursor: clients remember the last id they have seen and ask only for newer
+    events. The newest `tail_size` events are kept in memory, so reading the
+    latest N or everything after a recent cursor never touches the disk; the
+    NDJSON log on disk is only read once at startup to rebuild that tail.
+    """
+    def __init__(self, log_path, tail_size=1000, legacy_data_dir=None):
+        """
+        :param log_path: Path of the NDJSON event log.
+        :param tail_size: Number of most recent events kept in memory.
+        :param legacy_data_dir: Optional session root; on first start its metadata.csv
+                                files are imported so existing detections stay visible.
+        """
+        self.log_path = log_path
+        self._tail = collections.deque(maxlen=tail_size)
+        self._lock = threading.Lock() # Guards the tail; never held during disk I/O
+        self._write_lock = threading.Lock() # Serializes appends so log order matches ids
+        self._last_id = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        if not os.path.exists(log_path) and legacy_data_dir:
+            self._import_legacy_sessions(legacy_data_dir)
+        self._load_tail()
+        self._log = open(log_path, 'a')
+
+    @property
+    def last_id(self):
+        with self._lock:
+            return self._last_id
+
+    def append(self, event):
+        """
+        Assigns the next id to `event`, appends it to the log and the tail, and returns it.
+        Readers are only blocked for the in-memory append, not for the disk write.
+        """
+        with self._write_lock:
+            event = dict(event, id=self._last_id + 1)
+            self._log.write(json.dumps(event) + "\n")
+            self._log.flush()
+            with self._lock:
+                self._tail.append(event)
+                self._last_id = event['id']
+            return event
+
+    def latest(self, limit=50):
+        """Returns the newest `limit` events, newest first."""
+        with self._lock:
+            count = min(limit, len(self._tail))
+            return [self._tail[-i] for i in range(1, count + 1)]
+
+    def since(self, cursor, limit=50):
+        """
+        Returns the oldest `limit` events with an id greater than `cursor`, oldest
+        first, so a client that advances its cursor to the last id returned never
+        skips events. Cursors older than the in-memory tail start at the tail.
+        """
+        newer = []
+        with self._lock:
+            for event in reversed(self._tail):
+                if event['id'] <= cursor:
+                    break
+                newer.append(event)
+        return newer[::-1][:limit]
+
+    def close(self):
+        with self._write_lock:
+            self._log.close()
+
+    def _load_tail(self):
+        """Reads only the end of the log, enough to refill the in-memory tail."""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            block_size = 64 * 1024
+            data = b''
+            while position > 0 and data.count(b'\n') <= self._tail.maxlen:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                data = f.read(read_size) + data
+        lines = data.splitlines()
+        if position > 0:
+            lines = lines[1:] # The first line may be cut in half
+        for line in lines[-self._tail.maxlen:]:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            self._tail.append(event)
+            self._last_id = max(self._last_id, event['id'])
+
+    def _import_legacy_sessions(self, data_dir):
+        """One-time import of detections recorded in session metadata.csv files and session containers."""
+        events = []
+        for session in sorted(os.listdir(data_dir)):
+            session_dir = os.path.join(data_dir, session)
+            if os.path.isdir(session_dir) and is_container_session(session_dir):
+                events.extend(self._container_events(session, session_dir))
+                continue
+            metadata_path = os.path.join(session_dir, 'metadata.csv')
+            if not os.path.isfile(metadata_path):
+                continue
+            with open(metadata_path, 'r', newline='') as csvfile:
+                for row in csv.DictReader(csvfile):
+                    try:
+                        detections = ast.literal_eval(row.get('detections') or '[]')
+                    except (ValueError, SyntaxError):
+                        continue
+                    for detection in detections:
+                        events.append(make_detection_event(session, row.get('filename'), detection,
+                                                           row.get('timestamp', 0), row.get('latitude', 0.0),
+                                                           row.get('longitude', 0.0)))
+        events.sort(key=lambda e: e['timestamp'])
+        with open(self.log_path, 'w') as log:
+            for index, event in enumerate(events, start=1):
+                log.write(json.dumps(dict(event, id=index)) + "\n")
+        if events:
+            print(f"DetectionEventStore: Imported {len(events)} detections from existing sessions")
+
+    @staticmethod
+    def _container_events(session, session_dir):
+        events = []
+        with SessionReader(session_dir) as reader:
+            # Only records with a detection have a nonzero max confidence in the index
+            for i in (reader.index['max_confidence'] > 0).nonzero()[0].tolist():
+                record = reader.record(i)
+                for detection in record['detections']:
+                    events.append(make_detection_event(session, image_filename(record), detection, record['timestamp'],
+                                                       record['latitude'] or 0.0, record['longitude'] or 0.0))
+        return events
+
+
+def make_detection_event(session_timestamp, image_filename, detection, timestamp, latitude, longitude):
+    """Builds the structured event stored for one detection in one saved frame."""
+    return {
+        "type": detection.get('class', 'N/A'),
+        "confidence": float(detection.get('confidence', 0.0)),
+        "timestamp": int(timestamp),
+        "latitude": float(latitude),
+        "longitude": float(longitude),
+        "session_timestamp": session_timestamp,
+        "image_url": f"/images/{session_timestamp}/{image_filename}",
+    }
@@ -0,0 +1,118 @@
+import collections
+import threading
+import time
+
+# A single published camera frame together with its detection result.
+# `frame` is the untouched capture, `annotated_frame` has the boxes drawn on it.
+# Consumers must treat both arrays as read-only since they are shared.
+# `inferred` is False when the detector skipped the model (e.g. InferenceGate) and re-served older detections.
+FramePacket = collections.namedtuple(
+    'FramePacket', ['seq', 'timestamp', 'frame', 'annotated_frame', 'detections', 'inferred'],
+    defaults=(True,)
+)
+
+
+class FrameBus:
+    """
+    Owns the camera and runs detection exactly once per captured frame.
+
+    A single capture thread reads from the camera, runs the DetectionEngine and
+    publishes the result to a small ring buffer with monotonically increasing
+    sequence numbers. Any number of consumers (the logging loop, MJPEG clients)
+    subscribe by remembering the last sequence number they have seen, so the
+    inference cost does not grow with the number of viewers.
+    """
+    def __init__(self, capture, detection_engine, is_active=None, capacity=8, idle_sleep=1.0):
+        """
+        :param capture: An opened cv2.VideoCapture (or anything with a read() method).
+        :param detection_engine: The DetectionEngine used to annotate each frame.
+        :param is_active: Optional callable; capture pauses while it returns False.
+        :param capacity: Number of recent packets kept in the ring buffer.
+        :param idle_sleep: Seconds to sleep between checks while inactive.
+        """
+        self.capture = capture
+        self.detection_engine = detection_engine
+        self.is_active = is_active or (lambda: True)
+        self.idle_sleep = idle_sleep
+
+        self._ring = collections.deque(maxlen=capacity)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Starts the capture thread (idempotent)."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the capture thread and wakes up any waiting subscribers."""
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    @property
+    def last_seq(self):
+        with self._cond:
+            return self._seq
+
+    def latest(self):
+        """Returns the most recently published packet, or None."""
+        with self._cond:
+            return self._ring[-1] if self._ring else None
+
+    def wait_for_next(self, after_seq, timeout=None):
+        """
+        Blocks until a packet newer than `after_seq` is published.
+
+        Slow consumers always get the newest packet rather than a backlog,
+        so they skip frames instead of falling further behind.
+        Returns None on timeout or when the bus is stopped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._running and self._seq <= after_seq:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            if self._seq <= after_seq or not self._ring:
+                return None
+            return self._ring[-1]
+
+    def packets_since(self, after_seq):
+        """Returns every buffered packet newer than `after_seq`, oldest first."""
+        with self._cond:
+            return [p for p in self._ring if p.seq > after_seq]
+
+    def publish(self, frame, detections, annotated_frame, inferred=True):
+        """Appends a new packet to the ring and notifies subscribers."""
+        with self._cond:
+            self._seq += 1
+            packet = FramePacket(self._seq, time.time(), frame, annotated_frame, detections, inferred)
+            self._ring.append(packet)
+            self._cond.notify_all()
+        return packet
+
+    def _capture_loop(self):
+        while self._running:
+            if not self.is_active():
+                time.sleep(self.idle_sleep)
+                continue
+
+            success, frame = self.capture.read()
+            if not success:
+                time.sleep(0.1)
+                continue
+
+            # detect() draws on the frame it is given, keep the original clean
+            detections, annotated_frame = self.detection_engine.detect(frame.copy())
+            inferred = not getattr(self.detection_engine, 'last_skipped', False)
+            self.publish(frame, detections, annotated_frame, inferred)
@@ -0,0 +1,202 @@
+import csv
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+
+class FrameWriter:
+    """
+    Background persistence service for session recording.
+
+    Callers hand frames (and optional metadata.csv rows) to `submit()`, or
+    frames for a session container to `submit_record()`; neither ever blocks: JPEG encoding, disk writes, CSV group commits and periodic
+    fsync all happen on a single writer thread. When storage cannot keep up the
+    bounded queue fills, new items are rejected and `backpressure` is reported,
+    so detection and HTTP latency never depend on disk speed.
+    """
+    def __init__(self, max_queue=64, jpeg_quality=95, commit_rows=20, commit_interval=1.0,
+                 fsync_interval=5.0, high_watermark=0.75):
+        """
+        :param max_queue: Maximum number of pending items before submit() starts rejecting.
+        :param jpeg_quality: cv2.IMWRITE_JPEG_QUALITY used when encoding frames.
+        :param commit_rows: Flush buffered CSV rows once this many are pending.
+        :param commit_interval: ...or once this many seconds have passed since the last flush.
+        :param fsync_interval: Seconds between fsyncs of the open CSV files and written images.
+        :param high_watermark: Queue fill ratio above which backpressure is reported.
+        """
+        self.jpeg_quality = jpeg_quality
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval
+        self.fsync_interval = fsync_interval
+        self.high_watermark = high_watermark
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._csv_files = {} # path -> (file, writer)
+        self._csv_headers = {}
+        self._pending_rows = {} # path -> [rows]
+        self._pending_row_count = 0
+        self._unsynced_paths = set()
+        self._last_commit = time.monotonic()
+        self._last_fsync = time.monotonic()
+
+        self.written = 0
+        self.rejected = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self._write_seconds = 0.0
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def register_csv(self, csv_path, header):
+        """Declares the header written when `csv_path` is first created by the writer."""
+        self._csv_headers[csv_path] = header
+
+    def submit(self, image_path=None, frame=None, csv_path=None, csv_row=None):
+        """
+        Queues a frame to be encoded to `image_path` and/or a row for `csv_path`.
+        Returns False (and counts a rejection) when the queue is full.
+        """
+        return self._put((image_path, frame, csv_path, csv_row, None))
+
+    def submit_record(self, container, timestamp, frame, latitude=None, longitude=None, detections=None,
+                      image_path=None):
+        """
+        Queues a frame to be encoded once and appended to a SessionWriter
+        `container` with its location and detections. With `image_path` the same
+        JPEG is also written as a standalone file (e.g. as an upload source).
+        Returns False (and counts a rejection) when the queue is full.
+        """
+        return self._put((image_path, frame, None, None, (container, timestamp, latitude, longitude, detections)))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.rejected += 1
+            return False
+
+    @property
+    def backpressure(self):
+        return self._queue.qsize() >= self._queue.maxsize * self.high_watermark
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "bytes_written": self.bytes_written,
+            "avg_write_ms": round(self._write_seconds * 1000 / self.written, 2) if self.written else 0.0,
+            "backpressure": self.backpressure,
+        }
+
+    def close(self, timeout=10):
+        """
+        Stops the writer thread, which drains the queue, commits pending rows,
+        fsyncs and closes all files before exiting. Waits up to `timeout` seconds.
+        """
+        self._running = False
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            # The files belong to the writer thread until it exits, so they are not touched here
+            print(f"FrameWriter: Still draining {self._queue.qsize()} items after {timeout}s; "
+                  f"the writer thread will close the files when done")
+
+    def _run(self):
+        while self._running or not self._queue.empty():
+            try:
+                item = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                image_path, frame, csv_path, csv_row, record = item
+                if frame is not None and (image_path or record):
+                    self._write_image(image_path, frame, record)
+                if csv_path and csv_row is not None:
+                    self._pending_rows.setdefault(csv_path, []).append(csv_row)
+                    self._pending_row_count += 1
+
+            now = time.monotonic()
+            if self._pending_row_count >= self.commit_rows or (
+                    self._pending_row_count and now - self._last_commit >= self.commit_interval):
+                self._commit_rows()
+            if now - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+
+        self._commit_rows()
+        self._fsync()
+        for f, _ in self._csv_files.values():
+            f.close()
+        self._csv_files.clear()
+
+    def _write_image(self, image_path, frame, record=None):
+        start = time.perf_counter()
+        try:
+            ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                raise ValueError("JPEG encoding failed")
+            data = buffer.tobytes()
+            if record is not None:
+                container, timestamp, latitude, longitude, detections = record
+                container.append(timestamp, data, latitude, longitude, detections)
+            if image_path:
+                os.makedirs(os.path.dirname(image_path), exist_ok=True)
+                with open(image_path, 'wb') as f:
+                    f.write(data)
+                self._unsynced_paths.add(image_path)
+            self.bytes_written += len(data)
+            self.written += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"FrameWriter: Error writing {image_path or 'session record'}: {e}")
+        self._write_seconds += time.perf_counter() - start
+
+    def _csv_writer(self, csv_path):
+        if csv_path not in self._csv_files:
+            is_new = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+            os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+            f = open(csv_path, 'a', newline='')
+            writer = csv.writer(f)
+            if is_new and csv_path in self._csv_headers:
+                writer.writerow(self._csv_headers[csv_path])
+            self._csv_files[csv_path] = (f, writer)
+        return self._csv_files[csv_path]
+
+    def _commit_rows(self):
+        """Group-commits every buffered CSV row with one write + flush per file."""
+        for csv_path, rows in self._pending_rows.items():
+            try:
+                f, writer = self._csv_writer(csv_path)
+                writer.writerows(rows)
+                f.flush()
+            except Exception as e:
+                self.errors += 1
+                print(f"FrameWriter: Error writing rows to {csv_path}: {e}")
+        self._pending_rows.clear()
+        self._pending_row_count = 0
+        self._last_commit = time.monotonic()
+
+    def _fsync(self):
+        for f, _ in self._csv_files.values():
+            try:
+                os.fsync(f.fileno())
+            except (OSError, ValueError):
+                pass
+        for path in self._unsynced_paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+        self._unsynced_paths.clear()
+        self._last_fsync = time.monotonic()
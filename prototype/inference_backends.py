@@ -0,0 +1,257 @@
+import ast
+import json
+import os
+
+import cv2
+import numpy as np
+
+# Defaults match ultralytics' predict() so every backend returns comparable boxes
+DEFAULT_IMG_SIZE = 640
+DEFAULT_CONF_THRESHOLD = 0.25
+DEFAULT_IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+_MAX_WH = 7680 # Per-class box offset used for class-aware NMS
+
+
+def letterbox(frame, new_shape=DEFAULT_IMG_SIZE, color=(114, 114, 114)):
+    """
+    Resizes a BGR frame to fit `new_shape` while keeping its aspect ratio and
+    pads the remainder, the same way ultralytics prepares exported models.
+
+    Returns:
+        The padded image, the scale ratio and the (left, top) padding in pixels.
+    """
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    h, w = frame.shape[:2]
+    ratio = min(new_shape[0] / h, new_shape[1] / w)
+    new_unpad = (int(round(w * ratio)), int(round(h * ratio)))
+    dw, dh = (new_shape[1] - new_unpad[0]) / 2, (new_shape[0] - new_unpad[1]) / 2
+
+    if (w, h) != new_unpad:
+        frame = cv2.resize(frame, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    padded = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return padded, ratio, (left, top)
+
+
+def preprocess(frames, img_size=DEFAULT_IMG_SIZE):
+    """Letterboxes a list of BGR frames into one NCHW float32 RGB tensor in [0, 1]."""
+    batch, metas = [], []
+    for frame in frames:
+        padded, ratio, pad = letterbox(frame, img_size)
+        batch.append(padded[:, :, ::-1].transpose(2, 0, 1)) # BGR HWC -> RGB CHW
+        metas.append((ratio, pad, frame.shape[:2]))
+    tensor = np.ascontiguousarray(np.stack(batch)).astype(np.float32) / 255.0
+    return tensor, metas
+
+
+def non_max_suppression(boxes, scores, iou_threshold):
+    """
+    Greedy NMS over xyxy boxes.
+
+    Returns:
+        The indices of the kept boxes, highest score first.
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        inter_w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        inter_h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess(prediction, metas, conf_threshold=DEFAULT_CONF_THRESHOLD, iou_threshold=DEFAULT_IOU_THRESHOLD):
+    """
+    Decodes raw YOLOv8 output of shape (N, 4 + num_classes, num_anchors).
+
+    Returns:
+        One `(class_ids, confidences, boxes)` tuple of NumPy arrays per image,
+        with xyxy boxes scaled back to the original frame size.
+    """
+    outputs = []
+    for pred, (ratio, (pad_x, pad_y), (orig_h, orig_w)) in zip(prediction, metas):
+        pred = pred.T # (num_anchors, 4 + num_classes)
+        class_scores = pred[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(class_ids)), class_ids]
+
+        mask = confidences > conf_threshold
+        xywh, class_ids, confidences = pred[mask, :4], class_ids[mask], confidences[mask]
+
+        boxes = np.empty_like(xywh)
+        boxes[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+        boxes[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+        boxes[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+        boxes[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+
+        # Offset boxes by class so NMS never suppresses across classes
+        keep = non_max_suppression(boxes + class_ids[:, None] * _MAX_WH, confidences, iou_threshold)[:MAX_DETECTIONS]
+        class_ids, confidences, boxes = class_ids[keep], confidences[keep], boxes[keep]
+
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / ratio).clip(0, orig_w)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / ratio).clip(0, orig_h)
+        outputs.append((class_ids.astype(np.int64), confidences.astype(np.float32), boxes.astype(np.float32)))
+    return outputs
+
+
+def _parse_names(names):
+    """Normalizes class names stored as a dict, a dict repr string, or a list."""
+    if isinstance(names, str):
+        names = ast.literal_eval(names)
+    if isinstance(names, (list, tuple)):
+        names = dict(enumerate(names))
+    return {int(k): v for k, v in names.items()}
+
+
+class UltralyticsBackend:
+    """Runs a native ultralytics `.pt` model in PyTorch eager mode."""
+    def __init__(self, model_path, img_size=DEFAULT_IMG_SIZE, conf_threshold=DEFAULT_CONF_THRESHOLD,
+                 iou_threshold=DEFAULT_IOU_THRESHOLD):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.names = _parse_names(self.model.names)
+        self.img_size = img_size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+
+    def predict(self, frames):
+        results = self.model(list(frames), imgsz=self.img_size, conf=self.conf_threshold,
+                             iou=self.iou_threshold, verbose=False) # verbose=False suppresses console output
+        return [self.result_arrays(r) for r in results]
+
+    @staticmethod
+    def result_arrays(result):
+        """(class_ids, confidences, boxes) of one ultralytics result, like postprocess() returns per image."""
+        if result.boxes is None or len(result.boxes) == 0:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32),
+                    np.empty((0, 4), dtype=np.float32))
+        return (result.boxes.cls.cpu().numpy().astype(np.int64),
+                result.boxes.conf.cpu().numpy(),
+                result.boxes.xyxy.cpu().numpy())
+
+
+class _ExportedBackend:
+    """
+    Shared letterbox preprocessing and NumPy postprocessing for exported models.
+    Subclasses only implement `_forward(tensor)` returning the raw output array.
+    """
+    def __init__(self, img_size=DEFAULT_IMG_SIZE, conf_threshold=DEFAULT_CONF_THRESHOLD,
+                 iou_threshold=DEFAULT_IOU_THRESHOLD):
+        self.img_size = img_size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.names = {}
+        # Exported models may have a static batch dimension of 1
+        self.max_batch = None
+
+    def predict(self, frames):
+        frames = list(frames)
+        step = self.max_batch or len(frames) or 1
+        outputs = []
+        for start in range(0, len(frames), step):
+            tensor, metas = preprocess(frames[start:start + step], self.img_size)
+            prediction = self._forward(tensor)
+            outputs.extend(postprocess(prediction, metas, self.conf_threshold, self.iou_threshold))
+        return outputs
+
+    def _forward(self, tensor):
+        raise NotImplementedError
+
+
+class OnnxBackend(_ExportedBackend):
+    """Runs an ONNX export through ONNX Runtime on the CPU."""
+    def __init__(self, model_path, **kwargs):
+        super().__init__(**kwargs)
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        if isinstance(model_input.shape[0], int):
+            self.max_batch = model_input.shape[0]
+        if isinstance(model_input.shape[2], int):
+            self.img_size = model_input.shape[2]
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if 'names' in metadata:
+            self.names = _parse_names(metadata['names'])
+
+    def _forward(self, tensor):
+        return self.session.run(None, {self.input_name: tensor})[0]
+
+
+class OpenVINOBackend(_ExportedBackend):
+    """Runs an OpenVINO IR export (`.xml` + `.bin`, or the `_openvino_model` directory)."""
+    def __init__(self, model_path, **kwargs):
+        super().__init__(**kwargs)
+        import openvino as ov
+        if os.path.isdir(model_path):
+            model_path = next(os.path.join(model_path, f) for f in os.listdir(model_path) if f.endswith('.xml'))
+        core = ov.Core()
+        model = core.read_model(model_path)
+        input_shape = model.inputs[0].get_partial_shape()
+        if input_shape[0].is_static:
+            self.max_batch = input_shape[0].get_length()
+        self.compiled_model = core.compile_model(model, 'CPU')
+
+        metadata_path = os.path.join(os.path.dirname(model_path), 'metadata.yaml')
+        if os.path.exists(metadata_path):
+            import yaml
+            with open(metadata_path) as f:
+                metadata = yaml.safe_load(f) or {}
+            self.names = _parse_names(metadata.get('names', {}))
+            self.img_size = metadata.get('imgsz', [self.img_size])[0]
+
+    def _forward(self, tensor):
+        return self.compiled_model(tensor)[self.compiled_model.outputs[0]]
+
+
+class TorchScriptBackend(_ExportedBackend):
+    """Runs a TorchScript export with torch.jit, skipping the ultralytics eager wrapper."""
+    def __init__(self, model_path, **kwargs):
+        super().__init__(**kwargs)
+        import torch
+        self.torch = torch
+        extra_files = {'config.txt': ''}
+        self.model = torch.jit.load(model_path, map_location='cpu', _extra_files=extra_files)
+        self.model.eval()
+        if extra_files['config.txt']:
+            metadata = json.loads(extra_files['config.txt'])
+            self.names = _parse_names(metadata.get('names', {}))
+            self.img_size = metadata.get('imgsz', [self.img_size])[0]
+            self.max_batch = metadata.get('batch') or None
+
+    def _forward(self, tensor):
+        with self.torch.inference_mode():
+            output = self.model(self.torch.from_numpy(tensor))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.numpy()
+
+
+def load_backend(model_path, **kwargs):
+    """
+    Picks an inference backend from the model path.
+
+    `.onnx` -> ONNX Runtime, `.xml` or a `*_openvino_model` directory -> OpenVINO,
+    `.torchscript` -> TorchScript, anything else -> ultralytics (`.pt`).
+    """
+    path = model_path.rstrip('/\\')
+    if path.endswith('.onnx'):
+        return OnnxBackend(path, **kwargs)
+    if path.endswith('.xml') or path.endswith('_openvino_model'):
+        return OpenVINOBackend(path, **kwargs)
+    if path.endswith('.torchscript'):
+        return TorchScriptBackend(path, **kwargs)
+    return UltralyticsBackend(path, **kwargs)
@@ -0,0 +1,121 @@
+import time
+
+import cv2
+
+from detection import draw_detections
+
+
+class InferenceGate:
+    """
+    Gating stage in front of DetectionEngine.detect().
+
+    - Only the road region of interest (`roi`) is sent to the model; sky and
+      hood never reach it. Boxes are shifted back to full-frame coordinates.
+    - A cheap frame difference on a small greyscale thumbnail of the ROI skips
+      inference when the scene has not changed since the last inferred frame.
+    - When `speed_source()` reports (near) standstill, inference runs at most
+      once every `stationary_interval_s` seconds.
+
+    A skipped frame gets the last detections (marked 'stale') redrawn on it, so
+    the overlay does not flicker, and `max_skip_s` bounds how stale they can get.
+    `detect()` has the same signature as DetectionEngine.detect(), so the gate
+    can be handed to FrameBus or DetectionPipeline in place of the engine.
+    """
+    def __init__(self, detection_engine, roi=(0.0, 0.0, 1.0, 1.0), motion_threshold=2.0, max_skip_s=2.0,
+                 speed_source=None, stationary_speed_kmh=3.0, stationary_interval_s=1.0, thumb_size=(64, 36)):
+        """
+        :param detection_engine: The DetectionEngine doing the actual inference.
+        :param roi: Road region as fractions of the frame: (x_min, y_min, x_max, y_max).
+        :param motion_threshold: Mean absolute grey-level difference (0-255) below which a frame counts as unchanged.
+        :param max_skip_s: Inference always runs at least this often, changed or not.
+        :param speed_source: Optional callable returning the current speed in km/h.
+        :param stationary_speed_kmh: Speeds below this count as standing still.
+        :param stationary_interval_s: Minimum seconds between inferences while standing still.
+        :param thumb_size: (width, height) of the thumbnail used for frame differencing.
+        """
+        x_min, y_min, x_max, y_max = roi
+        if not (0.0 <= x_min < x_max <= 1.0 and 0.0 <= y_min < y_max <= 1.0):
+            raise ValueError(f"Invalid ROI {roi}; expected fractions with x_min < x_max and y_min < y_max.")
+        self.detection_engine = detection_engine
+        self.roi = roi
+        self.motion_threshold = motion_threshold
+        self.max_skip_s = max_skip_s
+        self.speed_source = speed_source
+        self.stationary_speed_kmh = stationary_speed_kmh
+        self.stationary_interval_s = stationary_interval_s
+        self.thumb_size = thumb_size
+
+        self._last_thumb = None
+        self._last_inference = None
+        self._last_detections = []
+
+        self.frames = 0
+        self.inferences = 0
+        self.skipped_static = 0
+        self.skipped_stationary = 0
+        self.last_skipped = False
+
+    def roi_bounds(self, frame):
+        """Pixel bounds (x0, y0, x1, y1) of the ROI for this frame size."""
+        height, width = frame.shape[:2]
+        x_min, y_min, x_max, y_max = self.roi
+        return int(x_min * width), int(y_min * height), int(x_max * width), int(y_max * height)
+
+    def detect(self, frame):
+        """
+        Returns (detections, annotated_frame) like DetectionEngine.detect(), with
+        bboxes in full-frame coordinates. Draws on `frame` in place.
+        """
+        self.frames += 1
+        x0, y0, x1, y1 = self.roi_bounds(frame)
+        roi = frame[y0:y1, x0:x1]
+        thumb = cv2.resize(cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY), self.thumb_size, interpolation=cv2.INTER_AREA)
+
+        skip_reason = self._skip_reason(thumb)
+        self.last_skipped = skip_reason is not None
+        if skip_reason == 'stationary':
+            self.skipped_stationary += 1
+        elif skip_reason == 'static':
+            self.skipped_static += 1
+        else:
+            # The engine draws on what it is given; give it a copy and draw on the full frame below.
+            # (A full-width ROI slice is already contiguous, so ascontiguousarray() would return a view.)
+            detections, _ = self.detection_engine.detect(roi.copy())
+            for detection in detections:
+                bx1, by1, bx2, by2 = detection['bbox']
+                detection['bbox'] = [bx1 + x0, by1 + y0, bx2 + x0, by2 + y0]
+            self._last_detections = detections
+            self._last_thumb = thumb
+            self._last_inference = time.monotonic()
+            self.inferences += 1
+
+        cv2.rectangle(frame, (x0, y0), (x1 - 1, y1 - 1), (128, 128, 128), 1)
+        draw_detections(frame, self._last_detections)
+        # Re-served detections are marked so trackers don't count them as new observations
+        return [dict(d, stale=True) if self.last_skipped else dict(d) for d in self._last_detections], frame
+
+    def stats(self):
+        skipped = self.skipped_static + self.skipped_stationary
+        return {
+            "frames": self.frames,
+            "inferences": self.inferences,
+            "skipped": skipped,
+            "skipped_static": self.skipped_static,
+            "skipped_stationary": self.skipped_stationary,
+            "skip_ratio": round(skipped / self.frames, 3) if self.frames else 0.0,
+        }
+
+    def _skip_reason(self, thumb):
+        """Returns 'stationary', 'static' or None (run inference)."""
+        if self._last_inference is None:
+            return None
+        since_last = time.monotonic() - self._last_inference
+        if since_last >= self.max_skip_s:
+            return None
+        if self.speed_source is not None and since_last < self.stationary_interval_s:
+            if self.speed_source() < self.stationary_speed_kmh:
+                return 'stationary'
+        difference = cv2.absdiff(thumb, self._last_thumb).mean()
+        if difference < self.motion_threshold:
+            return 'static'
+        return None
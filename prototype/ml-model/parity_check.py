@@ -0,0 +1,95 @@
+import argparse
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Add the parent directory (prototype) to sys.path to allow importing modules from it
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from inference_backends import load_backend
+
+DEFAULT_FRAMES_GLOB = os.path.join(os.path.dirname(__file__), '..', 'car_software', 'data', '*', 'frame_*.jpg')
+
+
+def box_iou(a, b):
+    """Pairwise IoU between two sets of xyxy boxes, shape (len(a), len(b))."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = (br - tl).clip(0).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare(reference, candidate, iou_threshold):
+    """
+    Greedily matches candidate detections to reference detections of the same class.
+    Returns (matched, reference_count, candidate_count, max_confidence_delta).
+    """
+    ref_cls, ref_conf, ref_boxes = reference
+    cand_cls, cand_conf, cand_boxes = candidate
+    if len(ref_cls) == 0 or len(cand_cls) == 0:
+        return 0, len(ref_cls), len(cand_cls), 0.0
+
+    iou = box_iou(ref_boxes, cand_boxes)
+    iou[ref_cls[:, None] != cand_cls[None, :]] = 0.0
+    matched, max_delta = 0, 0.0
+    for i in np.argsort(-ref_conf):
+        j = int(iou[i].argmax())
+        if iou[i, j] >= iou_threshold:
+            matched += 1
+            max_delta = max(max_delta, abs(float(ref_conf[i]) - float(cand_conf[j])))
+            iou[:, j] = 0.0
+    return matched, len(ref_cls), len(cand_cls), max_delta
+
+
+def main():
+    """
+    Checks that an exported model (ONNX / OpenVINO / TorchScript) produces the
+    same detections as the reference ultralytics `.pt` model on recorded frames.
+    Exits with a non-zero status when the match rate is below --min-match.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--reference', default=os.path.join(os.path.dirname(__file__), 'yolov8n.pt'))
+    parser.add_argument('--candidate', required=True, help='Exported model to compare against the reference.')
+    parser.add_argument('--frames', default=DEFAULT_FRAMES_GLOB, help='Glob of frames to compare on.')
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--min-match', type=float, default=0.95)
+    args = parser.parse_args()
+
+    frame_paths = sorted(glob.glob(args.frames))[:args.limit]
+    if not frame_paths:
+        print(f"❌ No frames found for {args.frames}")
+        sys.exit(1)
+
+    reference = load_backend(args.reference)
+    candidate = load_backend(args.candidate)
+
+    matched = ref_total = cand_total = 0
+    max_delta = 0.0
+    for path in frame_paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        m, r, c, d = compare(reference.predict([frame])[0], candidate.predict([frame])[0], args.iou)
+        matched, ref_total, cand_total = matched + m, ref_total + r, cand_total + c
+        max_delta = max(max_delta, d)
+
+    recall = matched / ref_total if ref_total else 1.0
+    precision = matched / cand_total if cand_total else 1.0
+    print(f"Frames: {len(frame_paths)} | reference boxes: {ref_total} | candidate boxes: {cand_total}")
+    print(f"Recall vs reference: {recall:.3f} | precision vs reference: {precision:.3f} | "
+          f"max confidence delta: {max_delta:.3f}")
+
+    if min(recall, precision) < args.min_match:
+        print("❌ Parity check failed.")
+        sys.exit(1)
+    print("✅ Parity check passed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Add the parent directory (prototype) to sys.path to allow importing modules from it
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from inference_backends import DEFAULT_IMG_SIZE, load_backend, preprocess
+from parity_check import box_iou, compare
+
+ML_MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTOTYPE_DIR = os.path.abspath(os.path.join(ML_MODEL_DIR, '..'))
+DEFAULT_WEIGHTS = os.path.join(ML_MODEL_DIR, 'runs', 'detect', 'train', 'weights', 'best.pt')
+DEFAULT_CALIB_DIR = os.path.join(PROTOTYPE_DIR, 'dataset_synthetic', 'images', 'val')
+DEFAULT_LABELS_DIR = os.path.join(PROTOTYPE_DIR, 'dataset_synthetic', 'labels', 'val')
+# The YOLOv8 Detect head is very sensitive to INT8 rounding, so it stays in FP32 by default
+DETECT_HEAD_PREFIX = '/model.22/'
+
+
+def list_images(image_dir):
+    return sorted(p for ext in ('*.jpg', '*.jpeg', '*.png') for p in glob.glob(os.path.join(image_dir, '**', ext), recursive=True))
+
+
+class FrameCalibrationReader:
+    """Feeds letterboxed calibration frames to onnxruntime's static quantizer one at a time."""
+    def __init__(self, image_paths, input_name, img_size=DEFAULT_IMG_SIZE):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.img_size = img_size
+        self._iter = iter(self.image_paths)
+
+    def get_next(self):
+        for path in self._iter:
+            frame = cv2.imread(path)
+            if frame is not None:
+                tensor, _ = preprocess([frame], self.img_size)
+                return {self.input_name: tensor}
+        return None
+
+    def rewind(self):
+        self._iter = iter(self.image_paths)
+
+
+def export_fp32_onnx(weights, img_size):
+    """Exports the FP32 `.pt` weights to a static-shape ONNX model next to them."""
+    from ultralytics import YOLO
+    print(f"Exporting {weights} to ONNX (FP32)...")
+    return YOLO(weights).export(format='onnx', imgsz=img_size, dynamic=False, simplify=True)
+
+
+def quantize_int8(fp32_path, int8_path, calib_paths, img_size, keep_head_fp32=True):
+    """Runs post-training static quantization (QDQ, per-channel weights) on the FP32 ONNX model."""
+    import onnx
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    fp32_model = onnx.load(fp32_path)
+    input_name = fp32_model.graph.input[0].name
+    nodes_to_exclude = [n.name for n in fp32_model.graph.node if n.name.startswith(DETECT_HEAD_PREFIX)] if keep_head_fp32 else []
+
+    print(f"Calibrating INT8 model on {len(calib_paths)} frames...")
+    quantize_static(
+        fp32_path, int8_path,
+        FrameCalibrationReader(calib_paths, input_name, img_size),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=nodes_to_exclude,
+    )
+
+    # Keep the ultralytics metadata (class names, imgsz) so OnnxBackend can read it
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    return int8_path
+
+
+def load_yolo_labels(label_path, frame_shape):
+    """Reads a YOLO label file into (class_ids, xyxy boxes) in pixel coordinates."""
+    if not os.path.exists(label_path):
+        return np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float32)
+    rows = np.loadtxt(label_path, ndmin=2)
+    if rows.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float32)
+    h, w = frame_shape[:2]
+    cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+    boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1).astype(np.float32)
+    return rows[:, 0].astype(np.int64), boxes
+
+
+def evaluate(backend, frames, labels, iou_threshold=0.5, warmup=3):
+    """Measures per-frame latency and precision/recall against ground-truth labels."""
+    for frame in frames[:warmup]:
+        backend.predict([frame])
+
+    latencies, predictions = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        predictions.append(backend.predict([frame])[0])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    true_positives = gt_total = pred_total = 0
+    for (pred_cls, _, pred_boxes), (gt_cls, gt_boxes) in zip(predictions, labels):
+        gt_total += len(gt_cls)
+        pred_total += len(pred_cls)
+        if len(gt_cls) and len(pred_cls):
+            iou = box_iou(gt_boxes, pred_boxes)
+            iou[gt_cls[:, None] != pred_cls[None, :]] = 0.0
+            for i in range(len(gt_cls)):
+                j = int(iou[i].argmax())
+                if iou[i, j] >= iou_threshold:
+                    true_positives += 1
+                    iou[:, j] = 0.0
+
+    latencies = np.array(latencies)
+    return predictions, {
+        'latency_ms_mean': round(float(latencies.mean()), 2),
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 2),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 2),
+        'precision': round(true_positives / pred_total, 4) if pred_total else None,
+        'recall': round(true_positives / gt_total, 4) if gt_total else None,
+    }
+
+
+def main():
+    """
+    Exports the FP32 detector to ONNX, quantizes it to INT8 with static
+    calibration on sample frames, and writes a report comparing accuracy and
+    CPU latency of both models. Point `MODEL_PATH` at the resulting
+    `*_int8.onnx` file to run it through DetectionEngine.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS, help='FP32 .pt weights to quantize.')
+    parser.add_argument('--calib-dir', default=DEFAULT_CALIB_DIR,
+                        help='Calibration images, e.g. dataset_synthetic/images/val or a car_software/data session.')
+    parser.add_argument('--calib-size', type=int, default=200)
+    parser.add_argument('--eval-dir', default=DEFAULT_CALIB_DIR)
+    parser.add_argument('--labels-dir', default=DEFAULT_LABELS_DIR, help='YOLO labels for --eval-dir (optional).')
+    parser.add_argument('--eval-size', type=int, default=100)
+    parser.add_argument('--img-size', type=int, default=DEFAULT_IMG_SIZE)
+    parser.add_argument('--quantize-head', action='store_true', help='Also quantize the Detect head.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    calib_paths = list_images(args.calib_dir)
+    if not calib_paths:
+        print(f"❌ No calibration images found in {args.calib_dir}")
+        sys.exit(1)
+    random.Random(args.seed).shuffle(calib_paths)
+    calib_paths = calib_paths[:args.calib_size]
+
+    fp32_path = export_fp32_onnx(args.weights, args.img_size)
+    int8_path = os.path.splitext(fp32_path)[0] + '_int8.onnx'
+    quantize_int8(fp32_path, int8_path, calib_paths, args.img_size, keep_head_fp32=not args.quantize_head)
+
+    eval_paths = list_images(args.eval_dir)[:args.eval_size]
+    frames, labels = [], []
+    for path in eval_paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        frames.append(frame)
+        label_path = os.path.join(args.labels_dir, os.path.splitext(os.path.basename(path))[0] + '.txt')
+        labels.append(load_yolo_labels(label_path, frame.shape))
+
+    fp32_preds, fp32_stats = evaluate(load_backend(fp32_path, img_size=args.img_size), frames, labels)
+    int8_preds, int8_stats = evaluate(load_backend(int8_path, img_size=args.img_size), frames, labels)
+
+    matched = fp32_total = 0
+    for ref, cand in zip(fp32_preds, int8_preds):
+        m, r, _, _ = compare(ref, cand, 0.5)
+        matched, fp32_total = matched + m, fp32_total + r
+
+    report = {
+        'weights': os.path.abspath(args.weights),
+        'calibration_images': len(calib_paths),
+        'eval_images': len(frames),
+        'fp32': dict(fp32_stats, path=fp32_path, size_mb=round(os.path.getsize(fp32_path) / 1e6, 2)),
+        'int8': dict(int8_stats, path=int8_path, size_mb=round(os.path.getsize(int8_path) / 1e6, 2)),
+        'int8_agreement_with_fp32': round(matched / fp32_total, 4) if fp32_total else None,
+        'speedup': round(fp32_stats['latency_ms_mean'] / int8_stats['latency_ms_mean'], 2),
+    }
+    report_path = os.path.splitext(int8_path)[0] + '_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("\n--- Quantization Report ---")
+    for name in ('fp32', 'int8'):
+        s = report[name]
+        print(f"{name.upper()}: mean {s['latency_ms_mean']} ms | p95 {s['latency_ms_p95']} ms | "
+              f"precision {s['precision']} | recall {s['recall']} | {s['size_mb']} MB")
+    print(f"INT8 agreement with FP32: {report['int8_agreement_with_fp32']} | speedup: {report['speedup']}x")
+    print(f"Report written to {report_path}")
+    print(f"To use it, set MODEL_PATH={int8_path}")
+
+
+if __name__ == '__main__':
+    main()
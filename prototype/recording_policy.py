@@ -0,0 +1,144 @@
+import collections
+
+import cv2
+
+from geo_utils import haversine_m
+
+RECORDING_MODES = ('all', 'detections', 'preroll', 'distance')
+
+# A frame offered to the policy; `location` is a GPS dict with latitude/longitude/timestamp
+RecordedFrame = collections.namedtuple('RecordedFrame', ['timestamp', 'frame', 'location', 'detections'])
+
+
+def dhash(frame, hash_size=8):
+    """64-bit difference hash of a BGR frame, robust to small noise and compression changes."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+class RecordingPolicy:
+    """
+    Decides which of the frames offered by the recorder are actually persisted.
+
+    Modes:
+    - 'all':        keep every offered frame (the original behaviour).
+    - 'detections': keep only frames with at least one detection.
+    - 'preroll':    keep frames with detections plus `pre_roll_seconds` of frames
+                    before them (held in an in-memory ring) and `post_roll_seconds` after.
+    - 'distance':   keep a frame every `min_distance_m` meters of GPS displacement,
+                    and always keep frames with detections.
+
+    With `dedup` enabled, non-detection frames whose perceptual hash is within
+    `dedup_max_distance` bits of the last kept frame are skipped as well.
+    """
+    def __init__(self, mode='preroll', pre_roll_seconds=5, post_roll_seconds=5, min_distance_m=10.0,
+                 dedup=True, dedup_max_distance=5):
+        if mode not in RECORDING_MODES:
+            raise ValueError(f"Unknown recording mode '{mode}'. Expected one of {RECORDING_MODES}.")
+        self.mode = mode
+        self.pre_roll_seconds = pre_roll_seconds
+        self.post_roll_seconds = post_roll_seconds
+        self.min_distance_m = min_distance_m
+        self.dedup = dedup
+        self.dedup_max_distance = dedup_max_distance
+
+        self._ring = collections.deque()
+        self._post_roll_until = None
+        self._last_saved_location = None
+        self._last_saved_hash = None
+
+        self.offered = 0
+        self.kept = 0
+        self.skipped_by_policy = 0
+        self.skipped_as_duplicate = 0
+
+    def offer(self, timestamp, frame, location=None, detections=None):
+        """
+        Offers one frame to the policy.
+
+        Returns:
+            A list of RecordedFrame to persist now (possibly empty, possibly
+            including buffered pre-roll frames), oldest first.
+        """
+        self.offered += 1
+        item = RecordedFrame(timestamp, frame, location, detections or [])
+
+        if self.mode == 'all':
+            candidates = [item]
+        elif self.mode == 'detections':
+            candidates = [item] if item.detections else []
+        elif self.mode == 'distance':
+            candidates = [item] if item.detections or self._moved_enough(location) else []
+        else:
+            candidates = self._offer_preroll(item)
+
+        if not candidates and self.mode != 'preroll':
+            self.skipped_by_policy += 1
+
+        to_save = []
+        for candidate in candidates:
+            frame_hash = dhash(candidate.frame) if self.dedup else None
+            if not candidate.detections and self._is_duplicate(frame_hash):
+                self.skipped_as_duplicate += 1
+                continue
+            to_save.append(candidate)
+            self._last_saved_hash = frame_hash
+            self._last_saved_location = candidate.location or self._last_saved_location
+        self.kept += len(to_save)
+        return to_save
+
+    def flush(self):
+        """Drops any buffered pre-roll frames, e.g. at the end of a session."""
+        self.skipped_by_policy += len(self._ring)
+        self._ring.clear()
+
+    def stats(self, avg_frame_bytes=None):
+        """
+        Per-session counters. Pass the average encoded size of a kept frame to
+        get an estimate of the bytes not written because of the policy.
+        """
+        skipped = self.skipped_by_policy + self.skipped_as_duplicate
+        stats = {
+            "mode": self.mode,
+            "offered": self.offered,
+            "kept": self.kept,
+            "skipped_by_policy": self.skipped_by_policy,
+            "skipped_as_duplicate": self.skipped_as_duplicate,
+            "buffered": len(self._ring),
+        }
+        if avg_frame_bytes is not None:
+            stats["bytes_saved_estimate"] = int(skipped * avg_frame_bytes)
+        return stats
+
+    def _offer_preroll(self, item):
+        if item.detections:
+            candidates = list(self._ring) + [item]
+            self._ring.clear()
+            self._post_roll_until = item.timestamp + self.post_roll_seconds
+            return candidates
+        if self._post_roll_until is not None and item.timestamp <= self._post_roll_until:
+            return [item]
+
+        self._ring.append(item)
+        while self._ring and item.timestamp - self._ring[0].timestamp > self.pre_roll_seconds:
+            self._ring.popleft()
+            self.skipped_by_policy += 1
+        return []
+
+    def _moved_enough(self, location):
+        if not location:
+            return False
+        if self._last_saved_location is None:
+            return True
+        return haversine_m(self._last_saved_location['latitude'], self._last_saved_location['longitude'],
+                           location['latitude'], location['longitude']) >= self.min_distance_m
+
+    def _is_duplicate(self, frame_hash):
+        if frame_hash is None or self._last_saved_hash is None:
+            return False
+        return bin(frame_hash ^ self._last_saved_hash).count('1') <= self.dedup_max_distance
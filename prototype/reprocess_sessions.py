@@ -0,0 +1,315 @@
+import argparse
+import collections
+import concurrent.futures
+import csv
+import datetime
+import glob
+import json
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+from car_software import config
+from data_manager import DataManager
+from detection import DetectionEngine
+from session_container import SessionReader, image_filename, is_container_session
+
+FRAME_TIMESTAMP_PATTERN = re.compile(r'frame_(\d+)')
+
+
+def decode_frame(source):
+    """
+    Runs in a worker process; returns the decoded BGR frame or None if it is unreadable.
+    `source` is an image path or a (segment path, offset, length) record in a session container.
+    """
+    if isinstance(source, str):
+        return cv2.imread(source, cv2.IMREAD_COLOR)
+    path, offset, length = source
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def load_session_frames(session_dir):
+    """
+    Lists a session's frames in capture order as (filename, timestamp, latitude, longitude, source).
+    Location comes from metadata.csv, or from the records of a container session; frames missing
+    from metadata.csv have latitude/longitude None.
+    """
+    if is_container_session(session_dir):
+        with SessionReader(session_dir) as reader:
+            frames = []
+            for i in range(len(reader)):
+                record = reader.record(i)
+                frames.append((image_filename(record), record['timestamp'], record['latitude'], record['longitude'],
+                               reader.locate(i)))
+            return frames
+
+    metadata = {}
+    metadata_path = os.path.join(session_dir, 'metadata.csv')
+    if os.path.isfile(metadata_path):
+        with open(metadata_path, 'r', newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                try:
+                    metadata[row['filename']] = (int(float(row['timestamp'])), float(row['latitude']),
+                                                 float(row['longitude']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+    frames = []
+    for path in sorted(glob.glob(os.path.join(session_dir, 'frame_*.jpg'))):
+        filename = os.path.basename(path)
+        if filename in metadata:
+            frames.append((filename,) + metadata[filename] + (path,))
+            continue
+        match = FRAME_TIMESTAMP_PATTERN.match(filename)
+        frames.append((filename, int(match.group(1)) if match else None, None, None, path))
+    return frames
+
+
+class Checkpoint:
+    """
+    Progress of a reprocessing run, saved after every committed batch so an
+    interrupted run resumes where the database left off.
+    """
+    def __init__(self, path, model_path):
+        self.path = path
+        self.state = {"model": model_path, "completed_sessions": [], "current_session": None, "frames_done": 0}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+            if saved.get("model") != self.state["model"]:
+                # Sessions completed with another model still need to be run through this one
+                print(f"⚠️ Checkpoint was written for model {saved.get('model')}, "
+                      f"reprocessing every session with {self.state['model']}")
+                return self
+            self.state.update(saved)
+        return self
+
+    def frames_done(self, session):
+        return self.state["frames_done"] if self.state["current_session"] == session else 0
+
+    def is_completed(self, session):
+        return session in self.state["completed_sessions"]
+
+    def advance(self, session, frames_done):
+        self.state["current_session"] = session
+        self.state["frames_done"] = frames_done
+        self._save()
+
+    def complete(self, session):
+        self.state["completed_sessions"].append(session)
+        self.state["current_session"] = None
+        self.state["frames_done"] = 0
+        self._save()
+
+    def _save(self):
+        # Write-then-rename so a crash never leaves a truncated checkpoint
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def decode_in_pool(pool, paths, prefetch):
+    """Yields decoded frames in order while keeping at most `prefetch` decodes in flight."""
+    pending = collections.deque()
+    paths = iter(paths)
+    for path in paths:
+        pending.append(pool.submit(decode_frame, path))
+        if len(pending) >= prefetch:
+            break
+    while pending:
+        frame = pending.popleft().result()
+        next_path = next(paths, None)
+        if next_path is not None:
+            pending.append(pool.submit(decode_frame, next_path))
+        yield frame
+
+
+class Reprocessor:
+    """Runs DetectionEngine over recorded sessions and bulk-inserts the detections through DataManager."""
+    def __init__(self, detection_engine, data_manager, checkpoint, pool, batch_size=16, commit_frames=512,
+                 replace_existing=True, report_interval=10.0):
+        """
+        :param batch_size: Frames per DetectionEngine.detect_batch() call.
+        :param commit_frames: Frames processed between database commits and checkpoint saves.
+        :param replace_existing: Delete a session's existing pothole rows before reprocessing it from the start,
+                                 so a rerun (e.g. with a newer model) does not duplicate them.
+        :param report_interval: Seconds between progress lines.
+        """
+        self.detection_engine = detection_engine
+        self.data_manager = data_manager
+        self.checkpoint = checkpoint
+        self.pool = pool
+        self.batch_size = batch_size
+        self.commit_frames = commit_frames
+        self.replace_existing = replace_existing
+        self.report_interval = report_interval
+
+        self.images = 0
+        self.detections = 0
+        self.skipped = 0
+        self._started = None
+        self._last_report = 0.0
+
+    def run(self, session_dirs):
+        self._started = time.monotonic()
+        for session_dir in session_dirs:
+            session = os.path.basename(session_dir.rstrip(os.sep))
+            if self.checkpoint.is_completed(session):
+                print(f"⏭️ {session}: already processed")
+                continue
+            self._process_session(session, session_dir)
+        return self.summary()
+
+    def summary(self):
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            "images": self.images,
+            "detections": self.detections,
+            "skipped_frames": self.skipped,
+            "elapsed_s": round(elapsed, 1),
+            "images_per_s": round(self.images / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def _process_session(self, session, session_dir):
+        frames = self._locate_frames(session, load_session_frames(session_dir))
+        if not any(f[2] is not None for f in frames):
+            # Nothing could be reinserted, so keep whatever rows the session already has
+            print(f"⚠️ {session}: no frame has a location (no metadata.csv or stored rows), skipping")
+            return
+        start = self.checkpoint.frames_done(session)
+        if start == 0 and self.replace_existing:
+            deleted = self.data_manager.delete_session_potholes(session)
+            print(f"🧹 {session}: removed {deleted} existing pothole rows")
+        print(f"▶️ {session}: {len(frames) - start} of {len(frames)} frames to process")
+
+        todo = frames[start:]
+        decoded = decode_in_pool(self.pool, [f[4] for f in todo],
+                                 prefetch=self.batch_size * 4)
+        rows = []
+        done = start
+        batch = []
+        for info, frame in zip(todo, decoded):
+            batch.append((info, frame))
+            if len(batch) == self.batch_size:
+                rows.extend(self._detect(session, batch))
+                done += len(batch)
+                batch = []
+                if done - start >= self.commit_frames or len(rows) >= self.commit_frames:
+                    self._commit(session, rows, done)
+                    start, rows = done, []
+                self._report()
+        if batch:
+            rows.extend(self._detect(session, batch))
+            done += len(batch)
+        self._commit(session, rows, done)
+        self.checkpoint.complete(session)
+        self._report(force=True)
+
+    def _locate_frames(self, session, frames):
+        """
+        Fills in the location of frames without a metadata.csv row (e.g. sessions written by the Flask app)
+        from the pothole rows already stored for the same image, so replacing those rows does not lose them.
+        """
+        if all(f[2] is not None for f in frames):
+            return frames
+        locations = self.data_manager.get_session_image_locations(session)
+        located = []
+        for filename, timestamp, latitude, longitude, source in frames:
+            if latitude is None and filename in locations:
+                latitude, longitude = locations[filename]
+            located.append((filename, timestamp, latitude, longitude, source))
+        return located
+
+    def _detect(self, session, batch):
+        """Runs one batch through the model and returns DB rows for its detections."""
+        usable = [(info, frame) for info, frame in batch if frame is not None and info[2] is not None]
+        self.skipped += len(batch) - len(usable)
+        self.images += len(usable)
+        if not usable:
+            return []
+
+        rows = []
+        results = self.detection_engine.detect_batch([frame for _, frame in usable], batch_size=self.batch_size)
+        for ((filename, timestamp, latitude, longitude, _), _), (detections, _) in zip(usable, results):
+            for detection in detections:
+                rows.append((latitude, longitude, datetime.datetime.fromtimestamp(timestamp), session, filename,
+                             detection['confidence']))
+        self.detections += len(rows)
+        return rows
+
+    def _commit(self, session, rows, frames_done):
+        # One large transaction per commit; the checkpoint only moves once the rows are durable
+        if rows:
+            self.data_manager.add_pothole_entries(rows, wait=True)
+        self.checkpoint.advance(session, frames_done)
+
+    def _report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        summary = self.summary()
+        print(f"📈 {summary['images']} images, {summary['detections']} detections, "
+              f"{summary['images_per_s']} images/s")
+
+
+def main():
+    """Re-runs pothole detection over recorded session directories and backfills the potholes table."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--data-dir', default=config.LOCAL_DATA_DIR, help='Root directory holding session folders.')
+    parser.add_argument('--sessions', nargs='*', help='Only these session folder names (default: all).')
+    parser.add_argument('--model', default=config.MODEL_PATH)
+    parser.add_argument('--db', default='database.db')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='JPEG decode processes.')
+    parser.add_argument('--commit-frames', type=int, default=512,
+                        help='Frames processed between bulk inserts and checkpoint saves.')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <data-dir>/.reprocess_checkpoint.json).')
+    parser.add_argument('--restart', action='store_true', help='Ignore any existing checkpoint.')
+    parser.add_argument('--keep-existing', action='store_true',
+                        help="Add to each session's existing pothole rows instead of replacing them.")
+    parser.add_argument('--output', help='Optional path for a JSON summary.')
+    args = parser.parse_args()
+
+    session_dirs = sorted(d for d in glob.glob(os.path.join(args.data_dir, '*')) if os.path.isdir(d))
+    if args.sessions:
+        session_dirs = [d for d in session_dirs if os.path.basename(d) in set(args.sessions)]
+    if not session_dirs:
+        print(f"❌ No session directories found in {args.data_dir}")
+        return
+
+    detection_engine = DetectionEngine(model_path=args.model)
+    if not detection_engine.model:
+        return
+
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.data_dir, '.reprocess_checkpoint.json'), args.model)
+    if not args.restart:
+        checkpoint.load()
+
+    data_manager = DataManager(db_path=args.db)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+            reprocessor = Reprocessor(detection_engine, data_manager, checkpoint, pool,
+                                      batch_size=args.batch_size, commit_frames=args.commit_frames,
+                                      replace_existing=not args.keep_existing)
+            summary = reprocessor.run(session_dirs)
+    finally:
+        data_manager.close()
+
+    print(f"✅ Reprocessing finished: {json.dumps(summary)}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+import ast
+import csv
+import datetime
+import os
+import shutil
+import time
+
+from session_container import MANIFEST_FILE, SessionReader, is_container_session
+
+SESSION_DIR_FORMAT = '%Y-%m-%d_%H-%M-%S'
+# Files kept in a session as long as any of its images (or container segments) are protected
+SESSION_INDEX_FILES = ('metadata.csv', MANIFEST_FILE)
+
+
+def parse_session_start(name):
+    """Start time encoded in a session directory name, or None if it is not a session directory."""
+    try:
+        return datetime.datetime.strptime(name, SESSION_DIR_FORMAT)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.strptime(name.split('_')[0], '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def directory_usage(path):
+    """(bytes, files) used by everything under `path`."""
+    total_bytes, files = 0, 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total_bytes += os.path.getsize(os.path.join(root, filename))
+                files += 1
+            except OSError:
+                continue
+    return total_bytes, files
+
+
+class RetentionEngine:
+    """
+    Incremental replacement for the daily full-scan cleanup of recorded sessions.
+
+    Every session directory is tracked in the `sessions` table with its byte
+    size. A pass lists the data root once and rescans only directories whose
+    mtime changed, so the disk total comes from the table instead of a walk.
+    It then frees space in two ways:
+    - age: sessions older than `retention_days`, and database rows older than
+      that, deleted in batches of `batch_size` rows;
+    - quota: when tracked usage exceeds `quota_bytes` (the high watermark) or
+      free disk space drops below `min_free_bytes`, the oldest sessions are
+      pruned until usage falls to `low_watermark` of the quota.
+
+    Files are deleted `batch_size` at a time with `batch_pause_s` between
+    batches, so a large cleanup never competes with live detection for I/O.
+    Images still referenced by pothole records at or above `keep_confidence`
+    (in the database, the session's metadata.csv or the index of its container
+    segments; a segment is kept whole) or by uploads that
+    `protected_paths` reports as unsynced are kept. A session that still holds
+    such images stays 'pruned' and is re-examined every `recheck_s` seconds.
+    The session being recorded (`active_session()`) is never touched.
+    """
+    def __init__(self, data_manager, data_dir, retention_days=30, quota_bytes=None, low_watermark=0.8,
+                 min_free_bytes=0, keep_confidence=0.8, batch_size=200, batch_pause_s=0.05, recheck_s=3600.0,
+                 protected_paths=None, active_session=None):
+        """
+        :param data_manager: DataManager holding the sessions table and pothole records.
+        :param data_dir: Root directory of the session folders.
+        :param retention_days: Sessions and rows older than this are deleted (None disables age-based deletion).
+        :param quota_bytes: High watermark for the total size of all sessions (None disables the quota).
+        :param low_watermark: Fraction of `quota_bytes` that quota pruning brings usage down to.
+        :param min_free_bytes: Free disk space below which quota pruning runs regardless of usage.
+        :param keep_confidence: Images of detections at or above this confidence are never deleted.
+        :param batch_size: Files (and rows per table) deleted per batch.
+        :param batch_pause_s: Sleep between batches.
+        :param recheck_s: How often a session kept for protected images is examined again.
+        :param protected_paths: Optional callable(session_dir) returning paths that must be kept, e.g.
+                                CloudOutbox.pending_files.
+        :param active_session: Optional callable returning the name of the session being recorded.
+        """
+        self.data_manager = data_manager
+        self.data_dir = data_dir
+        self.retention_days = retention_days
+        self.quota_bytes = quota_bytes
+        self.low_watermark = low_watermark
+        self.min_free_bytes = min_free_bytes
+        self.keep_confidence = keep_confidence
+        self.batch_size = batch_size
+        self.batch_pause_s = batch_pause_s
+        self.recheck_s = recheck_s
+        self.protected_paths = protected_paths
+        self.active_session = active_session
+
+        self.files_deleted = 0
+        self.bytes_freed = 0
+        self.rows_deleted = 0
+        self.last_run = None
+        self.last_usage = None
+
+    def run_once(self):
+        """One incremental retention pass. Returns a report of what was freed."""
+        start = time.monotonic()
+        freed_before, files_before, rows_before = self.bytes_freed, self.files_deleted, self.rows_deleted
+        self.sync_sessions()
+
+        if self.retention_days is not None:
+            cutoff = datetime.datetime.now() - datetime.timedelta(days=self.retention_days)
+            for session in self._prunable(self.data_manager.get_sessions(started_before=cutoff)):
+                self._prune(session)
+            self._expire_rows(cutoff)
+
+        if self._over_quota():
+            target = self.quota_bytes * self.low_watermark if self.quota_bytes else 0
+            for session in self._prunable(self.data_manager.get_sessions()):
+                if self.data_manager.get_session_usage()["bytes"] <= target and not self._low_on_disk():
+                    break
+                self._prune(session)
+
+        self.last_run = datetime.datetime.now().isoformat(timespec='seconds')
+        self.last_usage = self.data_manager.get_session_usage()
+        return {
+            "bytes_freed": self.bytes_freed - freed_before,
+            "files_deleted": self.files_deleted - files_before,
+            "rows_deleted": self.rows_deleted - rows_before,
+            "usage": self.last_usage,
+            "elapsed_s": round(time.monotonic() - start, 2),
+        }
+
+    def stats(self):
+        """Counters and the usage measured by the last pass; does not touch the database."""
+        return {
+            "files_deleted": self.files_deleted,
+            "bytes_freed": self.bytes_freed,
+            "rows_deleted": self.rows_deleted,
+            "usage": self.last_usage,
+            "quota_bytes": self.quota_bytes,
+            "last_run": self.last_run,
+        }
+
+    def sync_sessions(self):
+        """Brings the sessions table up to date, rescanning only new or changed directories."""
+        if not self.data_dir or not os.path.isdir(self.data_dir):
+            return
+        known = {s['session_timestamp']: s for s in self.data_manager.get_sessions()}
+        on_disk = set()
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                started_at = parse_session_start(entry.name) if entry.is_dir() else None
+                if started_at is None:
+                    continue
+                on_disk.add(entry.name)
+                mtime = entry.stat().st_mtime
+                session = known.get(entry.name)
+                if session is None or mtime > session['scanned_mtime'] or session['state'] == 'deleted':
+                    bytes_used, files = directory_usage(entry.path)
+                    self.data_manager.record_session_usage(entry.name, started_at, bytes_used, files, mtime)
+        # Directories removed by hand no longer count towards the quota
+        for name, session in known.items():
+            if name not in on_disk and session['state'] != 'deleted':
+                self.data_manager.set_session_state(name, 'deleted', 0, 0)
+
+    def _prunable(self, sessions):
+        active = self.active_session() if self.active_session else None
+        now = time.time()
+        for session in sessions:
+            if session['session_timestamp'] == active or session['state'] == 'deleted':
+                continue
+            if session['state'] == 'pruned' and now - (session['pruned_at'] or 0) < self.recheck_s:
+                continue
+            yield session
+
+    def _over_quota(self):
+        if self.quota_bytes and self.data_manager.get_session_usage()["bytes"] > self.quota_bytes:
+            return True
+        return self._low_on_disk()
+
+    def _low_on_disk(self):
+        if not self.min_free_bytes or not os.path.isdir(self.data_dir):
+            return False
+        return shutil.disk_usage(self.data_dir).free < self.min_free_bytes
+
+    def _protected(self, name, session_dir):
+        """Absolute paths in a session that must survive pruning."""
+        filenames = self.data_manager.get_protected_images(name, self.keep_confidence)
+        filenames |= self._metadata_protected(session_dir)
+        protected = {os.path.join(session_dir, filename) for filename in filenames}
+        if self.protected_paths:
+            unsynced = self.protected_paths(session_dir)
+            protected |= unsynced
+            if unsynced:
+                # Renderings of pending uploads live in upload/
+                upload_dir = os.path.join(session_dir, 'upload')
+                protected |= {os.path.join(root, f) for root, _, files in os.walk(upload_dir) for f in files}
+        if any(os.path.exists(path) for path in protected):
+            protected |= {os.path.join(session_dir, filename) for filename in SESSION_INDEX_FILES}
+        return protected
+
+    def _metadata_protected(self, session_dir):
+        """
+        Frames whose metadata.csv detections include one at or above `keep_confidence`,
+        or for a container session the segments holding such frames.
+        """
+        if is_container_session(session_dir):
+            with SessionReader(session_dir) as reader:
+                return {os.path.basename(path) for path in reader.segment_paths(self.keep_confidence)}
+        metadata_path = os.path.join(session_dir, 'metadata.csv')
+        protected = set()
+        if not os.path.isfile(metadata_path):
+            return protected
+        with open(metadata_path, 'r', newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                try:
+                    detections = ast.literal_eval(row.get('detections') or '[]')
+                except (ValueError, SyntaxError):
+                    continue
+                if any(d.get('confidence', 0) >= self.keep_confidence for d in detections):
+                    protected.add(row['filename'])
+        return protected
+
+    def _prune(self, session):
+        """Deletes a session's unprotected files in rate-limited batches, then updates its tracked size."""
+        name = session['session_timestamp']
+        session_dir = os.path.join(self.data_dir, name)
+        if not os.path.isdir(session_dir):
+            self.data_manager.set_session_state(name, 'deleted', 0, 0)
+            return
+        protected = self._protected(name, session_dir)
+
+        batch = []
+        for root, _, filenames in os.walk(session_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                if path not in protected:
+                    batch.append(path)
+                if len(batch) >= self.batch_size:
+                    self._delete_files(batch)
+                    batch = []
+        self._delete_files(batch)
+
+        # Remove directories left empty, deepest first
+        for root, _, _ in sorted(os.walk(session_dir), key=lambda walked: -len(walked[0])):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+        if os.path.isdir(session_dir):
+            bytes_used, files = directory_usage(session_dir)
+            self.data_manager.set_session_state(name, 'pruned', bytes_used, files, pruned_at=time.time())
+            print(f"Retention: Pruned session {name}, kept {files} protected files")
+        else:
+            self.data_manager.set_session_state(name, 'deleted', 0, 0)
+            print(f"Retention: Deleted session {name}")
+
+    def _delete_files(self, paths):
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError as e:
+                print(f"Retention: Could not delete {path}: {e}")
+                continue
+            self.files_deleted += 1
+            self.bytes_freed += size
+        if paths:
+            time.sleep(self.batch_pause_s)
+
+    def _expire_rows(self, cutoff):
+        while True:
+            counts = self.data_manager.delete_expired_rows(cutoff, self.keep_confidence, self.batch_size)
+            deleted = sum(counts.values())
+            self.rows_deleted += deleted
+            if deleted == 0:
+                break
+            time.sleep(self.batch_pause_s)
@@ -0,0 +1,165 @@
+import bisect
+import collections
+import datetime
+
+import numpy as np
+
+
+class SensorBuffer:
+    """
+    Fixed-capacity, time-ordered ring buffer of (timestamp, value) samples for
+    one sensor. Memory is bounded by `capacity` however long the session runs.
+    """
+    def __init__(self, capacity):
+        self._times = collections.deque(maxlen=capacity)
+        self._values = collections.deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self._times)
+
+    def append(self, timestamp, value):
+        """Adds a sample. Samples older than the newest one are dropped to keep the buffer sorted."""
+        if self._times and timestamp < self._times[-1]:
+            return False
+        self._times.append(timestamp)
+        self._values.append(value)
+        return True
+
+    def nearest(self, timestamp, max_gap=None):
+        """Returns the (timestamp, value) sample closest in time, or None if none is within `max_gap` seconds."""
+        if not self._times:
+            return None
+        index = bisect.bisect_left(self._times, timestamp)
+        candidates = [i for i in (index - 1, index) if 0 <= i < len(self._times)]
+        best = min(candidates, key=lambda i: abs(self._times[i] - timestamp))
+        if max_gap is not None and abs(self._times[best] - timestamp) > max_gap:
+            return None
+        return self._times[best], self._values[best]
+
+    def latest_before(self, timestamp, max_age=None):
+        """Returns the newest sample at or before `timestamp`, or None if it is older than `max_age` seconds."""
+        index = bisect.bisect_right(self._times, timestamp) - 1
+        if index < 0:
+            return None
+        if max_age is not None and timestamp - self._times[index] > max_age:
+            return None
+        return self._times[index], self._values[index]
+
+    def window(self, start, end):
+        """Returns every (timestamp, value) sample with start <= timestamp <= end, oldest first."""
+        lo = bisect.bisect_left(self._times, start)
+        hi = bisect.bisect_right(self._times, end)
+        return [(self._times[i], self._values[i]) for i in range(lo, hi)]
+
+
+class SensorFusion:
+    """
+    Time-aligned fusion of IMU g-force, vision detections and GPS fixes.
+
+    Each sensor feeds its own SensorBuffer. An impact is the excursion of the
+    g-force signal above `impact_threshold`; when it ends, it is reported once
+    (at its peak) and joined with:
+    - the GPS fix nearest in time to the peak,
+    - the most recent vision detection in the `detection_window_s` seconds
+      before the peak (the camera sees a pothole before the wheel hits it),
+    - the correlation between g-force and detection confidence over that
+      window, joined sample by sample on the nearest detection timestamp.
+    """
+    def __init__(self, impact_threshold=2.0, capacity=600, detection_window_s=3.0, gps_max_gap_s=2.0):
+        """
+        :param impact_threshold: G-force at or above which a sample belongs to an impact.
+        :param capacity: Samples kept per sensor buffer.
+        :param detection_window_s: How far back from an impact to look for a vision detection.
+        :param gps_max_gap_s: Maximum time between an impact and the GPS fix attached to it.
+        """
+        self.impact_threshold = impact_threshold
+        self.detection_window_s = detection_window_s
+        self.gps_max_gap_s = gps_max_gap_s
+
+        self.g_force = SensorBuffer(capacity)
+        self.detections = SensorBuffer(capacity)
+        self.gps = SensorBuffer(capacity)
+
+        self._impact_start = None
+        self._impact_peak = None # (timestamp, g_force)
+        self.impacts = 0
+        self.impacts_with_detection = 0
+
+    def add_gps(self, timestamp, latitude, longitude):
+        self.gps.append(timestamp, (latitude, longitude))
+
+    def add_detections(self, timestamp, detections):
+        """Records the most confident of a frame's detections. Stale (re-served) detections are ignored."""
+        fresh = [d for d in detections if not d.get('stale')]
+        if fresh:
+            self.detections.append(timestamp, max(fresh, key=lambda d: d['confidence']))
+
+    def add_g_force(self, timestamp, g_force):
+        """
+        Records one IMU sample. Returns the fused impact event (a dict) when this
+        sample ends an impact, otherwise None.
+        """
+        self.g_force.append(timestamp, g_force)
+        if g_force >= self.impact_threshold:
+            if self._impact_start is None:
+                self._impact_start = timestamp
+            if self._impact_peak is None or g_force > self._impact_peak[1]:
+                self._impact_peak = (timestamp, g_force)
+            return None
+        if self._impact_start is None:
+            return None
+        event = self._fuse(self._impact_start, timestamp, *self._impact_peak)
+        self._impact_start = self._impact_peak = None
+        return event
+
+    def stats(self):
+        return {
+            "impacts": self.impacts,
+            "impacts_with_detection": self.impacts_with_detection,
+            "buffered": {"g_force": len(self.g_force), "detections": len(self.detections), "gps": len(self.gps)},
+        }
+
+    def _fuse(self, start, end, peak_time, peak_g_force):
+        event = {
+            "timestamp": datetime.datetime.fromtimestamp(peak_time).isoformat(),
+            "g_force": peak_g_force,
+            "duration_s": round(end - start, 3),
+            "latitude": None,
+            "longitude": None,
+            "gps_gap_s": None,
+            "detection_confidence": None,
+            "detection_track_id": None,
+            "detection_lag_s": None,
+            "correlation": self._correlation(peak_time - self.detection_window_s, peak_time),
+        }
+
+        fix = self.gps.nearest(peak_time, max_gap=self.gps_max_gap_s)
+        if fix is not None:
+            fix_time, (event["latitude"], event["longitude"]) = fix
+            event["gps_gap_s"] = round(abs(peak_time - fix_time), 3)
+
+        detection = self.detections.latest_before(peak_time, max_age=self.detection_window_s)
+        if detection is not None:
+            detection_time, detection = detection
+            event["detection_confidence"] = detection['confidence']
+            event["detection_track_id"] = detection.get('track_id')
+            event["detection_lag_s"] = round(peak_time - detection_time, 3)
+            self.impacts_with_detection += 1
+
+        self.impacts += 1
+        return event
+
+    def _correlation(self, start, end):
+        """Pearson correlation of g-force and detection confidence over [start, end], or None if undefined."""
+        samples = self.g_force.window(start, end)
+        if len(samples) < 3:
+            return None
+        g_forces = np.array([g for _, g in samples], dtype=np.float64)
+        confidences = np.zeros(len(samples))
+        for i, (timestamp, _) in enumerate(samples):
+            nearest = self.detections.nearest(timestamp, max_gap=0.5)
+            if nearest is not None:
+                confidences[i] = nearest[1]['confidence']
+        if g_forces.std() == 0 or confidences.std() == 0:
+            return None
+        return round(float(np.corrcoef(g_forces, confidences)[0, 1]), 3)
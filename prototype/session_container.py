@@ -0,0 +1,399 @@
+import ast
+import csv
+import glob
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Segment file layout (all integers little-endian):
+#   header   SEGMENT_MAGIC
+#   records  RECORD_HEADER, JPEG bytes, UTF-8 JSON metadata   (repeated)
+#   index    INDEX_DTYPE entries, one per record               (written on close)
+#   trailer  FOOTER: index offset, record count, FOOTER_MAGIC  (written on close)
+# A segment without a trailer (e.g. after a crash) is indexed by scanning its
+# records; a truncated last record is ignored.
+SEGMENT_MAGIC = b'SRSEGv01'
+FOOTER_MAGIC = b'SRSIDXv1'
+RECORD_MAGIC = b'REC1'
+RECORD_HEADER = struct.Struct('<4sdddfII') # magic, timestamp, latitude, longitude, max confidence, JPEG/meta length
+FOOTER = struct.Struct('<QQ8s')
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'), ('latitude', '<f8'), ('longitude', '<f8'),
+                        ('max_confidence', '<f4'), ('offset', '<u8'), ('jpeg_len', '<u4'), ('meta_len', '<u4')])
+SEGMENT_GLOB = 'segment_*.seg'
+SEGMENT_PATTERN = re.compile(r'segment_(\d+)\.seg$')
+# Marks a directory as a container session. Segments without it are leftovers of an interrupted conversion.
+MANIFEST_FILE = 'session.json'
+MANIFEST = {"format": "segments", "version": 1}
+# Subdirectory convert_session() writes segments to before moving them into the session
+CONVERT_STAGING_DIR = '.converting'
+
+
+def is_container_session(session_dir):
+    # Not tied to any one segment: retention may delete segments without protected frames
+    return os.path.isfile(os.path.join(session_dir, MANIFEST_FILE))
+
+
+def _write_manifest(session_dir):
+    path = os.path.join(session_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(MANIFEST, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def frame_name(timestamp):
+    """Stable per-frame name inside a container session (millisecond resolution, so frames never collide)."""
+    return f"frame_{int(round(timestamp * 1000))}"
+
+
+def image_filename(record):
+    """
+    File name a record is referred to by outside the container (pothole rows,
+    image URLs): its original file for converted sessions, otherwise the name of
+    the standalone JPEG written for defect frames.
+    """
+    return record.get('source_filename') or f"{frame_name(record['timestamp'])}.jpg"
+
+
+class SessionWriter:
+    """
+    Append-only writer of a session as rolling segment files.
+
+    Each frame is stored once as its encoded JPEG together with its GPS fix
+    and structured detections (JSON), instead of one small file per frame plus
+    a CSV row. A segment is closed with an index footer once it reaches
+    `segment_bytes`, so losing power costs at most the unsynced tail of the
+    open segment, and SessionReader can still index it by scanning.
+    """
+    def __init__(self, session_dir, segment_bytes=64 * 1024 * 1024, fsync_interval=5.0):
+        """
+        :param session_dir: Directory the segment files are written to.
+        :param segment_bytes: Size after which the current segment is closed and a new one started.
+        :param fsync_interval: Seconds between fsyncs of the open segment.
+        """
+        self.session_dir = session_dir
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(session_dir, exist_ok=True)
+        # A reopened session continues in a new segment; existing ones are never modified.
+        # Numbered after the highest existing one, since retention may have deleted earlier segments.
+        numbers = [int(m.group(1)) for m in (SEGMENT_PATTERN.search(p) for p in
+                                             glob.glob(os.path.join(session_dir, SEGMENT_GLOB))) if m]
+        self._next_segment = max(numbers, default=-1) + 1
+        if not is_container_session(session_dir):
+            _write_manifest(session_dir)
+        self._lock = threading.Lock()
+        self._file = None
+        self._index = []
+        self._last_fsync = time.monotonic()
+        self.records = 0
+        self.bytes_written = 0
+
+    def append(self, timestamp, jpeg_bytes, latitude=None, longitude=None, detections=None, **extra):
+        """Appends one encoded frame. Extra keyword arguments are stored in the record's JSON metadata."""
+        detections = detections or []
+        meta = json.dumps(dict(extra, detections=detections), default=str).encode('utf-8')
+        max_confidence = max((d.get('confidence', 0.0) for d in detections), default=0.0)
+        latitude = math.nan if latitude is None else latitude
+        longitude = math.nan if longitude is None else longitude
+        header = RECORD_HEADER.pack(RECORD_MAGIC, timestamp, latitude, longitude, max_confidence,
+                                    len(jpeg_bytes), len(meta))
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            offset = self._file.tell()
+            self._file.write(header)
+            self._file.write(jpeg_bytes)
+            self._file.write(meta)
+            self._index.append((timestamp, latitude, longitude, max_confidence, offset, len(jpeg_bytes), len(meta)))
+            self.records += 1
+            self.bytes_written += len(header) + len(jpeg_bytes) + len(meta)
+            if self._file.tell() >= self.segment_bytes:
+                self._close_segment()
+            elif time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._close_segment()
+
+    def _open_segment(self):
+        path = os.path.join(self.session_dir, f"segment_{self._next_segment:05d}.seg")
+        self._next_segment += 1
+        self._file = open(path, 'xb')
+        self._file.write(SEGMENT_MAGIC)
+        self._index = []
+
+    def _close_segment(self):
+        index_offset = self._file.tell()
+        self._file.write(np.array(self._index, dtype=INDEX_DTYPE).tobytes())
+        self._file.write(FOOTER.pack(index_offset, len(self._index), FOOTER_MAGIC))
+        self._sync()
+        self._file.close()
+        self._file = None
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+
+class _Segment:
+    """One memory-mapped segment file and its index."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(SEGMENT_MAGIC):
+            self.mm, self.index = None, np.empty(0, dtype=INDEX_DTYPE)
+            return
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a session segment")
+        self.index = self._read_footer(size)
+        if self.index is None:
+            self.index = self._scan(size)
+
+    def _read_footer(self, size):
+        if size < len(SEGMENT_MAGIC) + FOOTER.size:
+            return None
+        index_offset, count, magic = FOOTER.unpack_from(self.mm, size - FOOTER.size)
+        if magic != FOOTER_MAGIC or index_offset + count * INDEX_DTYPE.itemsize != size - FOOTER.size:
+            return None
+        # Copy so no buffer export keeps the mmap from closing
+        return np.frombuffer(self.mm, dtype=INDEX_DTYPE, count=count, offset=index_offset).copy()
+
+    def _scan(self, size):
+        """Rebuilds the index of a segment that was never closed."""
+        entries = []
+        offset = len(SEGMENT_MAGIC)
+        while offset + RECORD_HEADER.size <= size:
+            magic, timestamp, latitude, longitude, max_confidence, jpeg_len, meta_len = \
+                RECORD_HEADER.unpack_from(self.mm, offset)
+            end = offset + RECORD_HEADER.size + jpeg_len + meta_len
+            if magic != RECORD_MAGIC or end > size:
+                break
+            entries.append((timestamp, latitude, longitude, max_confidence, offset, jpeg_len, meta_len))
+            offset = end
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def jpeg(self, entry):
+        start = int(entry['offset']) + RECORD_HEADER.size
+        return self.mm[start:start + int(entry['jpeg_len'])]
+
+    def meta(self, entry):
+        start = int(entry['offset']) + RECORD_HEADER.size + int(entry['jpeg_len'])
+        return json.loads(self.mm[start:start + int(entry['meta_len'])].decode('utf-8'))
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self._file.close()
+
+
+class SessionReader:
+    """
+    Random access to a container session by record number or timestamp.
+
+    Segments are memory-mapped and only their indexes are loaded, so opening
+    a session is cheap regardless of its length. The merged index is kept
+    sorted by timestamp for binary search.
+    """
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        self.segments = [_Segment(path) for path in sorted(glob.glob(os.path.join(session_dir, SEGMENT_GLOB)))]
+        indexes = [segment.index for segment in self.segments]
+        index = np.concatenate(indexes) if indexes else np.empty(0, dtype=INDEX_DTYPE)
+        segment_ids = np.concatenate([np.full(len(i), n, dtype=np.int32) for n, i in enumerate(indexes)]) \
+            if indexes else np.empty(0, dtype=np.int32)
+        order = np.argsort(index['timestamp'], kind='stable')
+        self.index = index[order]
+        self._segment_ids = segment_ids[order]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def timestamps(self):
+        return self.index['timestamp']
+
+    def nearest(self, timestamp):
+        """Record number closest in time to `timestamp`, or None for an empty session."""
+        if not len(self.index):
+            return None
+        i = int(np.searchsorted(self.timestamps, timestamp))
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.index)]
+        return min(candidates, key=lambda j: abs(self.timestamps[j] - timestamp))
+
+    def between(self, start=None, end=None):
+        """Record numbers with start <= timestamp < end."""
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, start, side='left'))
+        hi = len(self.index) if end is None else int(np.searchsorted(self.timestamps, end, side='left'))
+        return range(lo, hi)
+
+    def record(self, i):
+        """Timestamp, location and detections of record `i` (no JPEG decoding)."""
+        entry = self.index[i]
+        meta = self.segments[self._segment_ids[i]].meta(entry)
+        latitude, longitude = float(entry['latitude']), float(entry['longitude'])
+        return dict(meta,
+                    name=frame_name(float(entry['timestamp'])),
+                    timestamp=float(entry['timestamp']),
+                    latitude=None if math.isnan(latitude) else latitude,
+                    longitude=None if math.isnan(longitude) else longitude)
+
+    def read_jpeg(self, i):
+        """Encoded JPEG bytes of record `i`."""
+        return self.segments[self._segment_ids[i]].jpeg(self.index[i])
+
+    def read_frame(self, i):
+        """Decoded BGR frame of record `i`."""
+        return cv2.imdecode(np.frombuffer(self.read_jpeg(i), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def locate(self, i):
+        """(segment path, byte offset, length) of record `i`'s JPEG, for readers in other processes."""
+        entry = self.index[i]
+        return (self.segments[self._segment_ids[i]].path, int(entry['offset']) + RECORD_HEADER.size,
+                int(entry['jpeg_len']))
+
+    def segment_paths(self, min_confidence):
+        """Paths of the segments holding at least one detection at or above `min_confidence`."""
+        hits = np.unique(self._segment_ids[self.index['max_confidence'] >= min_confidence])
+        return {self.segments[n].path for n in hits.tolist()}
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+def convert_session(session_dir, segment_bytes=64 * 1024 * 1024, remove_source=False):
+    """
+    Converts a frame_*.jpg + metadata.csv session into segment files in the
+    same directory. JPEGs are copied as-is (no re-encoding). Segments are
+    written to a staging subdirectory and read back and compared byte for byte;
+    only then are they moved into the session, followed by the session.json
+    manifest that marks the conversion complete, and `remove_source` deletes
+    the original files. A failed or interrupted conversion leaves the session
+    in its original layout.
+    Returns the number of frames converted.
+    """
+    metadata = {}
+    metadata_path = os.path.join(session_dir, 'metadata.csv')
+    if os.path.isfile(metadata_path):
+        with open(metadata_path, 'r', newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                try:
+                    detections = ast.literal_eval(row.get('detections') or '[]')
+                except (ValueError, SyntaxError):
+                    detections = []
+                metadata[row['filename']] = (float(row['timestamp']), float(row['latitude']),
+                                             float(row['longitude']), detections)
+
+    frames = []
+    for path in glob.glob(os.path.join(session_dir, 'frame_*.jpg')):
+        filename = os.path.basename(path)
+        if filename in metadata:
+            timestamp, latitude, longitude, detections = metadata[filename]
+        else:
+            try:
+                timestamp = float(filename[len('frame_'):].split('_')[0].split('.')[0])
+            except ValueError:
+                timestamp = os.path.getmtime(path)
+            latitude = longitude = None
+            detections = []
+        frames.append((timestamp, path, latitude, longitude, detections))
+    frames.sort(key=lambda f: (f[0], f[1]))
+    if not frames:
+        return 0
+
+    # Segments left behind by an interrupted conversion
+    for path in glob.glob(os.path.join(session_dir, SEGMENT_GLOB)):
+        os.remove(path)
+    staging_dir = os.path.join(session_dir, CONVERT_STAGING_DIR)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    try:
+        writer = SessionWriter(staging_dir, segment_bytes=segment_bytes, fsync_interval=float('inf'))
+        for timestamp, path, latitude, longitude, detections in frames:
+            with open(path, 'rb') as f:
+                writer.append(timestamp, f.read(), latitude, longitude, detections,
+                              source_filename=os.path.basename(path))
+        writer.close()
+
+        with SessionReader(staging_dir) as reader:
+            converted = {reader.record(i).get('source_filename'): i for i in range(len(reader))}
+            for _, path, _, _, _ in frames:
+                with open(path, 'rb') as f:
+                    source = f.read()
+                i = converted.get(os.path.basename(path))
+                if i is None or reader.read_jpeg(i) != source:
+                    raise ValueError(f"Verification failed for {path}; source files were kept")
+            segment_paths = [segment.path for segment in reader.segments]
+
+        for path in segment_paths:
+            os.replace(path, os.path.join(session_dir, os.path.basename(path)))
+        _write_manifest(session_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    if remove_source:
+        for _, path, _, _, _ in frames:
+            os.remove(path)
+        if os.path.isfile(metadata_path):
+            os.remove(metadata_path)
+    return len(frames)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from car_software import config
+
+    parser = argparse.ArgumentParser(description="Session container maintenance commands.")
+    parser.add_argument('command', choices=['convert', 'info'])
+    parser.add_argument('--data-dir', default=config.LOCAL_DATA_DIR)
+    parser.add_argument('--sessions', nargs='*', help='Only these session folder names (default: all).')
+    parser.add_argument('--segment-mb', type=int, default=64)
+    parser.add_argument('--remove-source', action='store_true',
+                        help='Delete frame_*.jpg and metadata.csv once the converted session verifies.')
+    args = parser.parse_args()
+
+    session_dirs = sorted(d for d in glob.glob(os.path.join(args.data_dir, '*')) if os.path.isdir(d))
+    if args.sessions:
+        session_dirs = [d for d in session_dirs if os.path.basename(d) in set(args.sessions)]
+
+    for session_dir in session_dirs:
+        name = os.path.basename(session_dir)
+        if args.command == 'info':
+            if not is_container_session(session_dir):
+                print(f"{name}: legacy layout")
+                continue
+            with SessionReader(session_dir) as reader:
+                span = f"{reader.timestamps[0]:.3f} - {reader.timestamps[-1]:.3f}" if len(reader) else "empty"
+                print(f"{name}: {len(reader)} frames in {len(reader.segments)} segments ({span})")
+        elif is_container_session(session_dir):
+            print(f"⏭️ {name}: already converted")
+        else:
+            try:
+                count = convert_session(session_dir, segment_bytes=args.segment_mb * 1024 * 1024,
+                                        remove_source=args.remove_source)
+                print(f"✅ {name}: converted {count} frames")
+            except Exception as e:
+                print(f"❌ {name}: {e}")
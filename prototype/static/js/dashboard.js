@@ -103,7 +103,8 @@ document.addEventListener('DOMContentLoaded', function () {
             if (impactEventsHistory && impactEventsHistory.length > 0) {
                 // Map impact events to data points, assuming impactEventsHistory contains indices or can be aligned
                 const impactData = impactEventsHistory.map((event, index) => ({
-                    x: gForceHistory.length - impactEventsHistory.length + index, // Approximate index for plotting
+                    // Pushed impacts carry their exact sample index, polled ones are approximated
+                    x: event.x !== undefined ? event.x : gForceHistory.length - impactEventsHistory.length + index,
                     y: event.g_force
                 }));
                 gForceChart.data.datasets.push({
@@ -158,89 +159,167 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
-    async function fetchData() {
-        try {
-            const response = await fetch('/data');
-            const data = await response.json();
+    function renderState(data) {
+        // Update speed gauge
+        const maxSpeed = 100; // Max speed for gauge (km/h)
+        const speed = data.current_speed;
+        const rotation = -90 + (speed / maxSpeed) * 180;
+        if (gaugeNeedle) {
+            gaugeNeedle.style.transform = `translateX(-50%) rotate(${rotation}deg)`;
+        }
+        if (gaugeValue) {
+            gaugeValue.textContent = speed.toFixed(0);
+        }
+        
+        // Update other telemetry values
+        gpsValue.textContent = `${data.latitude.toFixed(4)}, ${data.longitude.toFixed(4)}`;
+        // Update suspension status with visual classes
+        suspensionStatus.textContent = data.suspension_status; // Keep text for accessibility
+        suspensionStatus.classList.remove('status-active', 'status-stabilizing', 'status-default'); // Clean previous classes
+        if (data.suspension_status === 'ACTIVE') {
+            suspensionStatus.classList.add('status-active');
+        } else if (data.suspension_status === 'STABILIZING') {
+            suspensionStatus.classList.add('status-stabilizing');
+        } else {
+            suspensionStatus.classList.add('status-default'); // Fallback or for other states
+        }
 
-            // Update speed gauge
-            const maxSpeed = 100; // Max speed for gauge (km/h)
-            const speed = data.current_speed;
-            const rotation = -90 + (speed / maxSpeed) * 180;
-            if (gaugeNeedle) {
-                gaugeNeedle.style.transform = `translateX(-50%) rotate(${rotation}deg)`;
-            }
-            if (gaugeValue) {
-                gaugeValue.textContent = speed.toFixed(0);
-            }
-            
-            // Update other telemetry values
-            gpsValue.textContent = `${data.latitude.toFixed(4)}, ${data.longitude.toFixed(4)}`;
-            // Update suspension status with visual classes
-            suspensionStatus.textContent = data.suspension_status; // Keep text for accessibility
-            suspensionStatus.classList.remove('status-active', 'status-stabilizing', 'status-default'); // Clean previous classes
-            if (data.suspension_status === 'ACTIVE') {
-                suspensionStatus.classList.add('status-active');
-            } else if (data.suspension_status === 'STABILIZING') {
-                suspensionStatus.classList.add('status-stabilizing');
+        // Update status indicators
+        updateStatusIndicator(obdStatus, data.obd_status);
+        updateStatusIndicator(gpsStatus, data.gps_status);
+        updateStatusIndicator(imuStatus, data.imu_status);
+
+        // Update G-Force Chart
+        // The g_force_history from the backend is a Python deque, which becomes an array in JS.
+        // Ensure to convert it to a regular array if not already.
+        const gForceHistoryArray = Array.from(data.g_force_history);
+        updateGForceChart(gForceHistoryArray, data.impact_events_history);
+
+        // Handle pothole alert
+        if (data.pothole_detected) {
+            potholeAlert.classList.remove('hidden');
+            // Remove existing severity classes
+            potholeAlert.classList.remove('severity-low', 'severity-medium', 'severity-high');
+
+            // Apply new severity class based on confidence
+            const confidence = data.pothole_confidence;
+            if (confidence < 0.6) {
+                potholeAlert.classList.add('severity-low');
+            } else if (confidence < 0.8) {
+                potholeAlert.classList.add('severity-medium');
             } else {
-                suspensionStatus.classList.add('status-default'); // Fallback or for other states
+                potholeAlert.classList.add('severity-high');
             }
 
-            // Update status indicators
-            updateStatusIndicator(obdStatus, data.obd_status);
-            updateStatusIndicator(gpsStatus, data.gps_status);
-            updateStatusIndicator(imuStatus, data.imu_status);
-
-            // Update G-Force Chart
-            // The g_force_history from the backend is a Python deque, which becomes an array in JS.
-            // Ensure to convert it to a regular array if not already.
-            const gForceHistoryArray = Array.from(data.g_force_history);
-            updateGForceChart(gForceHistoryArray, data.impact_events_history);
-
-            // Handle pothole alert
-            if (data.pothole_detected) {
-                potholeAlert.classList.remove('hidden');
-                // Remove existing severity classes
-                potholeAlert.classList.remove('severity-low', 'severity-medium', 'severity-high');
-
-                // Apply new severity class based on confidence
-                const confidence = data.pothole_confidence;
-                if (confidence < 0.6) {
-                    potholeAlert.classList.add('severity-low');
-                } else if (confidence < 0.8) {
-                    potholeAlert.classList.add('severity-medium');
-                } else {
-                    potholeAlert.classList.add('severity-high');
-                }
-
-                if (!lastPotholeDetected && potholeAudio) {
-                    potholeAudio.play();
-                }
-                lastPotholeDetected = true;
-            } else {
-                potholeAlert.classList.add('hidden');
-                potholeAlert.classList.remove('severity-low', 'severity-medium', 'severity-high'); // Clean up
-                lastPotholeDetected = false;
+            if (!lastPotholeDetected && potholeAudio) {
+                potholeAudio.play();
             }
+            lastPotholeDetected = true;
+        } else {
+            potholeAlert.classList.add('hidden');
+            potholeAlert.classList.remove('severity-low', 'severity-medium', 'severity-high'); // Clean up
+            lastPotholeDetected = false;
+        }
 
-            // Check for new events
-            if (data.latest_event) {
-                const firstRow = eventLogBody.firstChild;
-                if (!firstRow || firstRow.cells[0].textContent !== new Date(data.latest_event.timestamp).toLocaleTimeString()) {
-                    addEventToLog(data.latest_event.timestamp, data.latest_event.type, data.latest_event.details);
-                }
+        // Check for new events
+        if (data.latest_event) {
+            const firstRow = eventLogBody.firstChild;
+            if (!firstRow || firstRow.cells[0].textContent !== new Date(data.latest_event.timestamp).toLocaleTimeString()) {
+                addEventToLog(data.latest_event.timestamp, data.latest_event.type, data.latest_event.details);
             }
+        }
+    }
 
+    function showConnectionError() {
+        updateStatusIndicator(obdStatus, 'ERROR');
+        updateStatusIndicator(gpsStatus, 'ERROR');
+        updateStatusIndicator(imuStatus, 'ERROR');
+    }
+
+    // Polling fallback for browsers without EventSource
+    async function fetchData() {
+        try {
+            const response = await fetch('/data');
+            renderState(await response.json());
         } catch (error) {
             console.error("Error fetching data:", error);
-            updateStatusIndicator(obdStatus, 'ERROR');
-            updateStatusIndicator(gpsStatus, 'ERROR');
-            updateStatusIndicator(imuStatus, 'ERROR');
+            showConnectionError();
         }
     }
 
-    setInterval(fetchData, 500);
+    // --- Live updates pushed by the server (Server-Sent Events) ---
+    // The server sends one full snapshot on connect and then only deltas; the
+    // local copy is patched and redrawn at most once per animation frame.
+    const G_FORCE_HISTORY_LENGTH = 60;
+    let liveState = null;
+    let sampleCount = 0;
+    let renderPending = false;
+
+    function scheduleRender() {
+        if (renderPending || !liveState) return;
+        renderPending = true;
+        requestAnimationFrame(() => {
+            renderPending = false;
+            // Keep only impacts whose sample is still visible on the chart
+            liveState.impact_events_history = liveState.impact_events_history.filter(event => {
+                event.x = liveState.g_force_history.length - 1 - (sampleCount - event.sample);
+                return event.x >= 0;
+            });
+            renderState(liveState);
+        });
+    }
+
+    function connectEvents() {
+        const source = new EventSource('/events');
+
+        source.addEventListener('snapshot', (e) => {
+            liveState = JSON.parse(e.data);
+            liveState.impact_events_history = liveState.impact_events_history.map(event => ({ ...event, sample: sampleCount }));
+            scheduleRender();
+        });
+
+        ['telemetry', 'hardware_status', 'pothole'].forEach(type => {
+            source.addEventListener(type, (e) => {
+                if (!liveState) return;
+                Object.assign(liveState, JSON.parse(e.data));
+                scheduleRender();
+            });
+        });
+
+        source.addEventListener('g_force', (e) => {
+            if (!liveState) return;
+            liveState.g_force_history.push(JSON.parse(e.data).value);
+            if (liveState.g_force_history.length > G_FORCE_HISTORY_LENGTH) {
+                liveState.g_force_history.shift();
+            }
+            sampleCount += 1;
+            scheduleRender();
+        });
+
+        source.addEventListener('impact', (e) => {
+            if (!liveState) return;
+            liveState.impact_events_history.push({ ...JSON.parse(e.data), sample: sampleCount });
+            scheduleRender();
+        });
+
+        source.addEventListener('event', (e) => {
+            if (!liveState) return;
+            liveState.latest_event = JSON.parse(e.data);
+            scheduleRender();
+        });
+
+        // EventSource reconnects on its own and the server re-sends a snapshot
+        source.onerror = () => {
+            console.error("Live update stream interrupted, reconnecting...");
+            showConnectionError();
+        };
+    }
+
+    if (window.EventSource) {
+        connectEvents();
+    } else {
+        setInterval(fetchData, 500);
+    }
 
     // --- Historical Data View Logic ---
     const dateFilter = document.getElementById('date-filter');
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def multipart_chunk(jpeg_bytes):
+    """Wraps one JPEG as a part of a multipart/x-mixed-replace (MJPEG) stream."""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(jpeg_bytes)).encode() + b'\r\n\r\n' + jpeg_bytes + b'\r\n')
+
+
+class TieredJpegEncoder:
+    """
+    Encodes each published frame at most once per quality tier and shares the
+    bytes between every MJPEG client watching that tier.
+
+    Tiers are encoded lazily: a tier nobody is watching costs nothing, and the
+    first client to ask for frame `seq` at a tier encodes it while any other
+    client asking for the same frame and tier waits for and reuses the result.
+    CPU cost therefore scales with the number of tiers in use, not viewers.
+    """
+    def __init__(self, tiers):
+        """
+        :param tiers: Dict of tier name -> (max height in pixels or None for native size, JPEG quality).
+        """
+        self.tiers = dict(tiers)
+        self._cache = {name: (None, None) for name in self.tiers} # tier -> (seq, jpeg bytes)
+        self._locks = {name: threading.Lock() for name in self.tiers}
+        self._placeholders = {}
+        self.encoded = 0
+        self.served = 0
+
+    def encode(self, seq, frame, tier):
+        """Returns the JPEG bytes of `frame` (published as `seq`) at `tier`."""
+        with self._locks[tier]:
+            cached_seq, jpeg = self._cache[tier]
+            if cached_seq != seq:
+                jpeg = self._encode(frame, tier)
+                self._cache[tier] = (seq, jpeg)
+                self.encoded += 1
+            self.served += 1
+            return jpeg
+
+    def placeholder(self, tier, width=640, height=480):
+        """Black frame shown while the camera is off, encoded once per tier."""
+        if tier not in self._placeholders:
+            self._placeholders[tier] = self._encode(np.zeros((height, width, 3), dtype=np.uint8), tier)
+        return self._placeholders[tier]
+
+    def stats(self):
+        return {"encoded": self.encoded, "served": self.served}
+
+    def _encode(self, frame, tier):
+        max_height, quality = self.tiers[tier]
+        height, width = frame.shape[:2]
+        if max_height and height > max_height:
+            scale = max_height / height
+            frame = cv2.resize(frame, (max(1, int(width * scale)), max_height), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return buffer.tobytes()
+
+
+class FrameRateLimiter:
+    """Sleeps just long enough to keep a client at or below `max_fps`."""
+    def __init__(self, max_fps):
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self._next = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+def parse_stream_params(tier, max_fps, tiers, fps_limit):
+    """
+    Validates the `tier` and `fps` query parameters of a video feed request.
+    Raises ValueError with a user-facing message when either is invalid.
+    """
+    if tier not in tiers:
+        raise ValueError(f"Unknown tier '{tier}'. Expected one of {sorted(tiers)}.")
+    try:
+        max_fps = float(max_fps)
+    except (TypeError, ValueError):
+        raise ValueError("fps must be a number.")
+    if max_fps <= 0:
+        raise ValueError("fps must be positive.")
+    return tier, min(max_fps, fps_limit)
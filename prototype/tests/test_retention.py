@@ -0,0 +1,55 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Add the parent directory (prototype) to sys.path to allow importing modules from it
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_manager import DataManager
+from retention import RetentionEngine
+from session_container import SessionReader, SessionWriter, is_container_session
+
+SESSION = '2020-01-01_00-00-00'
+
+
+class ContainerRetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp, 'data')
+        self.session_dir = os.path.join(self.data_dir, SESSION)
+        # Tiny segments: one record each, so segment_00000 holds no protected frame
+        writer = SessionWriter(self.session_dir, segment_bytes=100)
+        writer.append(1.0, b'x' * 200, 1.0, 2.0, [{'class': 'crack', 'confidence': 0.3, 'bbox': [0, 0, 1, 1]}])
+        writer.append(2.0, b'y' * 200, 1.0, 2.0, [{'class': 'pothole', 'confidence': 0.95, 'bbox': [0, 0, 1, 1]}])
+        writer.append(3.0, b'z' * 200, 1.0, 2.0, [])
+        writer.close()
+        self.data_manager = DataManager(os.path.join(self.tmp, 'test.db'))
+
+    def tearDown(self):
+        self.data_manager.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_protected_segment_survives_recheck(self):
+        engine = RetentionEngine(self.data_manager, self.data_dir, retention_days=1, keep_confidence=0.8,
+                                 batch_pause_s=0, recheck_s=0)
+        for _ in range(2):
+            engine.run_once()
+            self.assertTrue(is_container_session(self.session_dir))
+            self.assertEqual(sorted(os.listdir(self.session_dir)), ['segment_00001.seg', 'session.json'])
+
+        with SessionReader(self.session_dir) as reader:
+            self.assertEqual(len(reader), 1)
+            self.assertEqual(reader.record(0)['detections'][0]['confidence'], 0.95)
+            self.assertEqual(bytes(reader.read_jpeg(0)), b'y' * 200)
+
+        # A reopened session numbers new segments after the ones retention kept
+        writer = SessionWriter(self.session_dir)
+        writer.append(4.0, b'w', 1.0, 2.0, [])
+        writer.close()
+        self.assertTrue(os.path.isfile(os.path.join(self.session_dir, 'segment_00002.seg')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import itertools
+
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between two (N, 4) and (M, 4) arrays of x1, y1, x2, y2 boxes."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).clip(0).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).clip(0).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_match(iou, threshold):
+    """
+    Greedy assignment on an IoU matrix, best pairs first.
+    Returns (matches as (row, col) pairs, unmatched rows, unmatched cols).
+    """
+    matches = []
+    if iou.size:
+        rows, cols = np.unravel_index(np.argsort(-iou, axis=None), iou.shape)
+        used_rows, used_cols = set(), set()
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            if iou[row, col] < threshold:
+                break
+            if row in used_rows or col in used_cols:
+                continue
+            used_rows.add(row)
+            used_cols.add(col)
+            matches.append((row, col))
+    matched_rows = {row for row, _ in matches}
+    matched_cols = {col for _, col in matches}
+    return (matches,
+            [row for row in range(iou.shape[0]) if row not in matched_rows],
+            [col for col in range(iou.shape[1]) if col not in matched_cols])
+
+
+class Track:
+    """One object followed across frames by IoUTracker."""
+    def __init__(self, track_id, detection, frame, context):
+        self.track_id = track_id
+        self.bbox = np.asarray(detection['bbox'], dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.hits = 1
+        self.time_since_update = 0
+        self.confirmed = False
+        self.best_confidence = -1.0
+        self.best_detection = None
+        self.best_frame = None
+        self.best_context = None
+        self._observe(detection, frame, context)
+
+    def predicted_bbox(self):
+        """Where the box should be in the next frame under a constant-velocity model."""
+        return self.bbox + self.velocity * (self.time_since_update + 1)
+
+    def update(self, detection, frame, context):
+        bbox = np.asarray(detection['bbox'], dtype=np.float32)
+        step = (bbox - self.bbox) / (self.time_since_update + 1)
+        self.velocity = 0.5 * self.velocity + 0.5 * step
+        self.bbox = bbox
+        self.hits += 1
+        self.time_since_update = 0
+        self._observe(detection, frame, context)
+
+    def _observe(self, detection, frame, context):
+        # Keep the frame where the object was seen most confidently
+        if detection['confidence'] > self.best_confidence:
+            self.best_confidence = detection['confidence']
+            self.best_detection = dict(detection)
+            self.best_frame = frame
+            self.best_context = context
+
+
+class IoUTracker:
+    """
+    Lightweight ByteTrack-style multi-object tracker on top of DetectionEngine
+    output, using NumPy only.
+
+    Every update, existing tracks are matched to detections by IoU against
+    their constant-velocity predicted boxes: first high-confidence detections,
+    then the remaining low-confidence ones (which can keep a track alive but
+    never start one). A track becomes confirmed after `min_hits` matches and
+    is dropped after `max_age` updates without one. Matched detections get a
+    'track_id' key.
+
+    `update()` reports each track exactly once, at the moment it is confirmed,
+    together with the best-confidence frame seen so far, so callers can persist
+    one record per physical object instead of one per frame.
+    """
+    def __init__(self, iou_threshold=0.3, min_hits=3, max_age=10, high_threshold=0.5):
+        """
+        :param iou_threshold: Minimum IoU between a predicted track box and a detection to associate them.
+        :param min_hits: Matched detections needed to confirm a track.
+        :param max_age: Updates a track survives without a matching detection.
+        :param high_threshold: Detections at or above this confidence are matched first and may start tracks.
+        """
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_age = max_age
+        self.high_threshold = high_threshold
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.confirmed_total = 0
+
+    def update(self, detections, frame=None, context=None):
+        """
+        Feeds one frame's detections to the tracker.
+
+        Args:
+            detections: Detection dicts with 'bbox' and 'confidence', as returned by DetectionEngine.detect().
+                Detections marked 'stale' (re-served by InferenceGate without running the model) are
+                not new evidence, so such a frame leaves the tracks untouched.
+            frame: The frame the detections belong to; kept by reference as a track's best frame.
+            context: Anything to keep with the best frame, e.g. the GPS fix and timestamp.
+
+        Returns:
+            A tuple of (tracks currently visible, tracks confirmed by this update).
+        """
+        if detections and all(d.get('stale') for d in detections):
+            return [t for t in self.tracks if t.time_since_update == 0], []
+
+        high = [d for d in detections if d['confidence'] >= self.high_threshold]
+        low = [d for d in detections if d['confidence'] < self.high_threshold]
+
+        unmatched_tracks = list(range(len(self.tracks)))
+        predicted = np.array([t.predicted_bbox() for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        for group, can_start_tracks in ((high, True), (low, False)):
+            candidates = [self.tracks[i] for i in unmatched_tracks]
+            iou = iou_matrix(predicted[unmatched_tracks], [d['bbox'] for d in group])
+            matches, still_unmatched, unmatched_detections = greedy_match(iou, self.iou_threshold)
+            for row, col in matches:
+                candidates[row].update(group[col], frame, context)
+                group[col]['track_id'] = candidates[row].track_id
+            unmatched_tracks = [unmatched_tracks[row] for row in still_unmatched]
+            if can_start_tracks:
+                new_tracks = []
+                for col in unmatched_detections:
+                    track = Track(next(self._ids), group[col], frame, context)
+                    group[col]['track_id'] = track.track_id
+                    new_tracks.append(track)
+
+        for index in unmatched_tracks:
+            self.tracks[index].time_since_update += 1
+        self.tracks = [t for t in self.tracks if t.time_since_update <= self.max_age] + new_tracks
+
+        newly_confirmed = []
+        for track in self.tracks:
+            if not track.confirmed and track.hits >= self.min_hits:
+                track.confirmed = True
+                newly_confirmed.append(track)
+        self.confirmed_total += len(newly_confirmed)
+        return [t for t in self.tracks if t.time_since_update == 0], newly_confirmed
+
+    def stats(self):
+        return {
+            "active_tracks": len(self.tracks),
+            "confirmed_total": self.confirmed_total,
+        }